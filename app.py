@@ -2,8 +2,27 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import io
+import os
+import tempfile
+import threading
+import functools
+import logging
 import numpy as np
+from collections import OrderedDict
+from urllib.parse import urlencode
+from finanzas.carga import FUENTES
+from finanzas.snapshot import SNAPSHOT_DIR, leer_ingesta, nuevo_estado_refresco, obtener_datos, estado_datos
+from finanzas.periodos import indexar_periodos, tiene_turnos_dados, periodos_con_dato_real
+from finanzas.cubo import construir_cubo, rollup, comparar
+from finanzas.estimacion import ajustar_ocupacion, estimar_ocupacion, totales_estimados
+from finanzas.escenarios import TOTAL, ajustar_escenarios, simular_recupero, rango_recupero
+from finanzas.exportacion import FORMATOS, detalle_perdidas, exportar
+from finanzas.api import nuevo_estado_api, iniciar_api, ofrecer_recursos
+from finanzas.sql import MOTOR, motor_disponible, abrir_base
+from finanzas.tiempos import (iniciar_registro, terminar_registro, registro_actual, seccion, tramo,
+                              acumular, escribir_log)
+from finanzas.metricas import (curva_sensibilidad, nuevo_cache_historia, metricas_historia,
+                               nuevo_cache_metricas, metricas_periodo as metricas_periodo_cache)
 
 # ============================================================
 # CONFIGURACIÓN GLOBAL
@@ -121,6 +140,11 @@ def fmt_millones(n):
 def fmt_fecha(ts):
     return f"{MESES_FULL[ts.month]} {ts.year}"
 
+def fmt_duracion(seg):
+    if seg < 60:   return f"{seg:.0f} s"
+    if seg < 3600: return f"{seg/60:.0f} min"
+    return f"{seg/3600:.1f} h"
+
 def kpi_card(label, value, delta=None, delta_label=None, variant="default", fmt_fn=fmt_pesos):
     val_str = fmt_fn(value)
     delta_html = ""
@@ -146,135 +170,300 @@ def apply_plotly_defaults(fig, title=""):
     fig.update_yaxes(showgrid=True, gridcolor=BORDER, zeroline=False)
     return fig
 
-def generar_excel(df, nombre_hoja="Datos"):
-    buf = io.BytesIO()
-    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
-        df.to_excel(writer, sheet_name=nombre_hoja[:31], index=False)
-    return buf.getvalue()
+# ============================================================
+# CACHÉ DE FIGURAS
+# ============================================================
+# Cada gráfico se arma una vez por (versión de datos, gráfico, parámetros) y se reutiliza en
+# los reruns y entre sesiones. Lo caro es armar la figura (validación de plotly, plantilla,
+# px.bar): ~650 ms los siete gráficos con el preset mediano. plotly_chart solo acepta la figura,
+# no el JSON ya serializado, así que cada rerun la sigue serializando: ~20 ms los siete.
+TAM_CACHE_FIGURAS = 256
+
+@st.cache_resource
+def cache_figuras():
+    return dict(lock=threading.Lock(), figuras=OrderedDict())
+
+def figura(version, clave, armar):
+    # `armar` devuelve la figura terminada; la cacheada se comparte entre sesiones y no se toca
+    # (plotly_chart la copia al serializarla)
+    c, clave = cache_figuras(), (version, *clave)
+    with c['lock']:
+        fig = c['figuras'].get(clave)
+        if fig is not None:
+            c['figuras'].move_to_end(clave)
+            return fig
+    with tramo(f"figura {clave[1]}"):
+        fig = armar()
+    with c['lock']:
+        c['figuras'][clave] = fig
+        while len(c['figuras']) > TAM_CACHE_FIGURAS:
+            c['figuras'].popitem(last=False)
+    return fig
 
-def limpiar_df(df):
-    num_cols = df.select_dtypes(include='number').columns
-    df[num_cols] = df[num_cols].fillna(0)
-    str_cols = df.select_dtypes(include='object').columns
-    df[str_cols] = df[str_cols].fillna('')
-    return df
+def descarga(formato, partes):
+    # Para download_button: el archivo se arma recién al hacer clic (en otro hilo),
+    # escribiendo las partes de a bloques en un temporal en disco. `partes` es una función
+    # que devuelve el iterable: cada clic lo recorre de nuevo. download_button necesita bytes,
+    # así que el archivo terminado se lee entero y queda una vez en memoria (el tamaño del
+    # archivo, no el de los DataFrames ni el del libro de openpyxl). Con la API activa los
+    # botones apuntan a su /exportar, que envía el temporal de a bloques (url_exportacion).
+    def generar():
+        with tempfile.TemporaryFile() as f:
+            return exportar(formato, partes(), f).read()
+    return generar
 
 # ============================================================
 # CARGA DE DATOS
 # ============================================================
-@st.cache_data(ttl=300)
+# El cálculo vive en el paquete finanzas; acá solo quedan las cachés de Streamlit
+@st.cache_resource
+def estado_refresco():
+    # Datos vigentes y estado del hilo de refresco, compartidos entre sesiones del proceso
+    return nuevo_estado_refresco()
+
 def cargar_datos():
-    BASE = "https://docs.google.com/spreadsheets/d/e/2PACX-1vQHFwl-Dxn-Rw9KN_evkCMk2Er8lQqgZMzAtN4LuEkWcCeBVUNwgb8xeIFKvpyxMgeGTeJ3oEWKpMZj"
-    df_of  = pd.read_csv(f"{BASE}/pub?gid=1524527213&single=true&output=csv")
-    df_au  = pd.read_csv(f"{BASE}/pub?gid=2132722842&single=true&output=csv")
-    df_val = pd.read_csv(f"{BASE}/pub?gid=554651129&single=true&output=csv")
+    # Sin cache_data: la versión vigente está en memoria y la renueva el hilo de refresco
+    datos, version, errores = obtener_datos(estado_refresco())
+    for clave, e in errores.items():
+        if clave in FUENTES:
+            st.warning(f"⚠️ No se pudo cargar {FUENTES[clave]['nombre']}: {e}")
+        else:
+            st.warning(f"⚠️ No se pudo guardar el snapshot local: {e}")
+    return (*datos, version)
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def indice_periodos(version, _df_of, _df_au, _df_val, _df_td):
+    # Se reconstruye solo cuando cambia la versión de los datos
+    return indexar_periodos(_df_of, _df_au, _df_val, _df_td)
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def particiones_ingesta(version):
+    # Manifiesto de la ingesta (celdas inválidas por fuente y mes): se lee del disco una vez por versión
+    return (leer_ingesta(version) or {}).get('particiones', {})
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def base_sql(version, _df_of, _df_au, _df_val, _df_td):
+    # Con FINANZAS_MOTOR=duckdb reemplaza al índice: base DuckDB de la versión, junto al snapshot
+    return abrir_base(_df_of, _df_au, _df_val, _df_td, SNAPSHOT_DIR, version)
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def cubo_datos(version, _df_of, _df_au, _df_val, _df_td):
+    # Cubo período × departamento × servicio × profesional de la versión vigente
+    return construir_cubo(_df_of, _df_au, _df_val, _df_td)
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def ocupacion_estimada(version, _cubo, _periodos):
+    # Un ajuste por versión de datos sobre toda la historia de turnos dados y la estimación,
+    # por servicio y en total, de todos los períodos sin dato real
+    modelo = ajustar_ocupacion(_cubo)
+    if modelo is None or not _periodos:
+        return None, None
+    est = estimar_ocupacion(modelo, _cubo, _periodos)
+    return est, totales_estimados(est)
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def escenarios_recupero(version, _cubo, _df_val):
+    # Grilla servicio × meta de recupero anual sorteada una vez por versión de datos
+    par = ajustar_escenarios(_cubo, _df_val)
+    return simular_recupero(par) if par is not None else None
+
+@st.cache_resource
+def cache_historia():
+    # Última tabla de métricas por período, compartida entre sesiones del proceso
+    # y, a través del snapshot, con los demás procesos
+    return nuevo_cache_historia(SNAPSHOT_DIR)
+
+@st.cache_resource
+def cache_metricas():
+    # LRU de resultados de calcular_metricas compartido entre sesiones del proceso
+    # y, a través del snapshot, con los demás procesos
+    return nuevo_cache_metricas(SNAPSHOT_DIR)
 
-    # BD_TURNOS_DADOS — URL completo publicado desde Google Sheets
-    try:
-        df_td = pd.read_csv("https://docs.google.com/spreadsheets/d/e/2PACX-1vQHFwl-Dxn-Rw9KN_evkCMk2Er8lQqgZMzAtN4LuEkWcCeBVUNwgb8xeIFKvpyxMgeGTeJ3oEWKpMZj/pub?gid=1285454147&single=true&output=csv")
-    except Exception as e:
-        st.warning(f"⚠️ No se pudo cargar BD_TURNOS_DADOS: {e}")
-        df_td = pd.DataFrame(columns=['PERIODO','SERVICIO','TURNO_DADOS'])
-
-    for df in [df_of, df_au, df_val, df_td]:
-        df.columns = df.columns.str.strip()
-        for col in ['SERVICIO','DEPARTAMENTO']:
-            if col in df.columns:
-                df[col] = df[col].astype(str).str.strip().str.upper()
-
-    df_of['PERIODO']      = pd.to_datetime(df_of['PERIODO'],      dayfirst=True, errors='coerce')
-    df_au['FECHA_INICIO'] = pd.to_datetime(df_au['FECHA_INICIO'], dayfirst=True, errors='coerce')
-    df_val['PERIODO']     = pd.to_datetime(df_val['PERIODO'],     dayfirst=True, errors='coerce')
-    if 'PERIODO' in df_td.columns:
-        df_td['PERIODO']  = pd.to_datetime(df_td['PERIODO'],      dayfirst=True, errors='coerce')
-
-    if 'VALOR_TURNO' in df_val.columns:
-        df_val['VALOR_TURNO'] = pd.to_numeric(
-            df_val['VALOR_TURNO'].astype(str)
-                .str.replace('$','',regex=False)
-                .str.replace('.','',regex=False)
-                .str.replace(',','.',regex=False),
-            errors='coerce').fillna(0)
-    if 'RENDIMIENTO' in df_val.columns:
-        df_val['RENDIMIENTO'] = pd.to_numeric(df_val['RENDIMIENTO'], errors='coerce').fillna(14)
-    if 'TURNO_DADOS' in df_td.columns:
-        df_td['TURNO_DADOS'] = pd.to_numeric(df_td['TURNO_DADOS'], errors='coerce').fillna(0)
-
-    col_target = 'CONSULTORIOS_REALES' if 'CONSULTORIOS_REALES' in df_au.columns else 'DIAS_CAIDOS'
-    df_au[col_target] = pd.to_numeric(df_au[col_target], errors='coerce').fillna(0)
-    df_au['_COL_TARGET'] = df_au[col_target]
-
-    for df in [df_of, df_au, df_val, df_td]:
-        limpiar_df(df)
-
-    return df_of, df_au, df_val, df_td
+# ============================================================
+# DIAGNÓSTICO DE TIEMPOS (opcional)
+# ============================================================
+# Se activa desde el panel del sidebar (por sesión) o para todas las sesiones con
+# FINANZAS_TIEMPOS_LOG=ruta (.prom → textfile de Prometheus; otra extensión → JSON lines).
+TIEMPOS_LOG = os.environ.get("FINANZAS_TIEMPOS_LOG")
+
+@st.cache_resource
+def tiempos_proceso():
+    # Acumulados de todas las sesiones, para el textfile de Prometheus
+    return dict(lock=threading.Lock(), totales={})
+
+def cerrar_registro(panel=True, **etiquetas):
+    # Cierra el registro del hilo: lo acumula en la sesión y en el proceso, escribe el log y
+    # muestra el panel del sidebar (no en los reruns de un fragmento: no puede escribir ahí)
+    registro = terminar_registro()
+    if registro is None:
+        return
+    totales_sesion = acumular(st.session_state.setdefault('tiempos_sesion', {}), registro)
+    if TIEMPOS_LOG:
+        proc = tiempos_proceso()
+        with proc['lock']:
+            acumular(proc['totales'], registro)
+            try:
+                escribir_log(TIEMPOS_LOG, registro, proc['totales'], **etiquetas)
+            except OSError:
+                pass
+
+    if panel and st.session_state.get('diag_tiempos'):
+        with st.sidebar:
+            st.markdown(f"<div style='font-size:11px;font-weight:700;letter-spacing:.1em;text-transform:uppercase;color:{TEXT_MUTED};margin:8px 0;'>TIEMPOS · ESTE RERUN ({registro['total']*1000:,.0f} ms)</div>", unsafe_allow_html=True)
+            st.dataframe(pd.DataFrame({
+                'Etapa': ["\u2003" * t['nivel'] + t['nombre'] for t in registro['tramos']],
+                'ms'   : [round(t['seg'] * 1000, 1) for t in registro['tramos']],
+            }), width="stretch", hide_index=True)
+            st.markdown(f"<div style='font-size:11px;font-weight:700;letter-spacing:.1em;text-transform:uppercase;color:{TEXT_MUTED};margin:8px 0;'>TIEMPOS · SESIÓN ({totales_sesion['total'][0]} reruns)</div>", unsafe_allow_html=True)
+            st.dataframe(pd.DataFrame([
+                dict(Etapa=n, Llamadas=c, **{'ms total': round(seg * 1000, 1), 'ms prom.': round(seg * 1000 / c, 1)})
+                for n, (c, seg) in sorted(totales_sesion.items(), key=lambda kv: -kv[1][1])
+            ]), width="stretch", hide_index=True)
+            if registro['perfil']:
+                with st.expander("Perfil cProfile (acumulado)"):
+                    st.code(registro['perfil'], language=None)
+
+def detener(**etiquetas):
+    # st.stop() sin dejar abierto el registro (ni cProfile) del hilo
+    cerrar_registro(**etiquetas)
+    st.stop()
+
+def fragmento_medido(nombre):
+    # En el rerun completo un fragmento es un tramo más; cuando se re-ejecuta solo abre su
+    # propio registro, que se suma a los acumulados de la sesión y al log
+    nombre = f"fragmento {nombre}"
+    def decorador(fn):
+        @functools.wraps(fn)
+        def envuelta(*args, **kwargs):
+            if registro_actual() is not None:
+                with tramo(nombre):
+                    return fn(*args, **kwargs)
+            iniciar_registro(st.session_state.get('diag_tiempos', False) or bool(TIEMPOS_LOG),
+                             perfil=st.session_state.get('diag_perfil', False))
+            try:
+                with tramo(nombre):
+                    return fn(*args, **kwargs)
+            finally:
+                cerrar_registro(panel=False, version=version_actual, periodo=str(periodo_sel))
+        return envuelta
+    return decorador
 
 # ============================================================
-# CÁLCULO CENTRAL
+# TABLAS PAGINADAS
 # ============================================================
-def calcular_metricas(df_of, df_au, df_val, df_td_p=None, rend_override=None):
-    # Facturación base (oferta × valor)
-    df_ing = df_of.merge(df_val[['SERVICIO','VALOR_TURNO']], on='SERVICIO', how='left')
-    df_ing['VALOR_TURNO']      = df_ing['VALOR_TURNO'].fillna(0)
-    df_ing['FACTURACION_BASE'] = df_ing['TURNOS_MENSUAL'] * df_ing['VALOR_TURNO']
-
-    # Pérdida por ausentismo profesional
-    df_perd = df_au.merge(df_val[['SERVICIO','VALOR_TURNO','RENDIMIENTO']], on='SERVICIO', how='left')
-    df_perd['VALOR_TURNO']       = df_perd['VALOR_TURNO'].fillna(0)
-    df_perd['RENDIMIENTO_USADO'] = rend_override if rend_override else df_perd['RENDIMIENTO'].fillna(14)
-    df_perd['TURNOS_PERDIDOS']   = df_perd['_COL_TARGET'] * df_perd['RENDIMIENTO_USADO']
-    df_perd['DINERO_PERDIDO']    = df_perd['TURNOS_PERDIDOS'] * df_perd['VALOR_TURNO']
-
-    total_base  = df_ing['FACTURACION_BASE'].sum()
-    total_perd  = df_perd['DINERO_PERDIDO'].sum()
-    turnos_of   = df_ing['TURNOS_MENSUAL'].sum()
-    turnos_perd = df_perd['TURNOS_PERDIDOS'].sum()
-    pct_fuga    = (total_perd / (total_base + total_perd) * 100) if (total_base + total_perd) > 0 else 0
-
-    # Ocupación real (solo si hay dato de turnos dados)
-    ocup = pd.DataFrame()
-    tiene_dato_real = False
-    if df_td_p is not None and not df_td_p.empty:
-        of_serv = df_ing.groupby('SERVICIO').agg(
-            TURNOS_OFERTA=('TURNOS_MENSUAL','sum'),
-            VALOR_TURNO=('VALOR_TURNO','mean')
-        ).reset_index()
-        ocup = of_serv.merge(df_td_p[['SERVICIO','TURNO_DADOS']], on='SERVICIO', how='inner')
-        ocup = ocup[(ocup['VALOR_TURNO'] > 0) & (ocup['TURNOS_OFERTA'] > 0)]
-        ocup['TASA_OCUP']         = (ocup['TURNO_DADOS'] / ocup['TURNOS_OFERTA'] * 100).round(1)
-        ocup['FACT_REAL']         = ocup['TURNO_DADOS'] * ocup['VALOR_TURNO']
-        ocup['PERD_INASISTENCIA'] = (ocup['TURNOS_OFERTA'] - ocup['TURNO_DADOS']).clip(lower=0) * ocup['VALOR_TURNO']
-        tiene_dato_real = not ocup.empty
-
-    return dict(
-        total_base=total_base, total_perd=total_perd,
-        total_pot=total_base + total_perd,
-        total_fact_real=ocup['FACT_REAL'].sum() if tiene_dato_real else None,
-        total_perd_inasist=ocup['PERD_INASISTENCIA'].sum() if tiene_dato_real else None,
-        tasa_ocup_prom=ocup['TASA_OCUP'].clip(upper=100).mean() if tiene_dato_real else None,
-        tiene_dato_real=tiene_dato_real,
-        turnos_of=turnos_of, turnos_perd=turnos_perd, pct_fuga=pct_fuga,
-        df_ing=df_ing, df_perd=df_perd, df_ocup=ocup,
-    )
+# Búsqueda, orden y páginas del lado del servidor: al navegador va solo la página visible,
+# con los números sin formatear (el formato lo aplica column_config en el navegador).
+FILAS_PAGINA = 50
+
+def filas_con_texto(df, columnas, texto):
+    # Máscara de las filas con `texto` en alguna de las columnas, sin distinguir mayúsculas.
+    # En las categóricas se busca en las categorías y se lleva a las filas por código.
+    mascara = np.zeros(len(df), dtype=bool)
+    for c in columnas:
+        s = df[c]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            en_cat = np.append(s.cat.categories.astype(str).str.contains(texto, case=False, regex=False), False)
+            mascara |= en_cat[s.cat.codes.to_numpy()]   # código -1 (vacío) → el False del final
+        else:
+            mascara |= s.astype("string").str.contains(texto, case=False, regex=False).fillna(False).to_numpy(dtype=bool)
+    return mascara
+
+def a_primera_pagina(clave):
+    st.session_state[f'{clave}_pagina'] = 1
+
+@st.fragment
+@fragmento_medido("tabla paginada")
+def tabla_paginada(df, clave, columnas, orden, buscar=()):
+    # columnas: {columna: column_config} en el orden a mostrar; orden: (columna, descendente)
+    # inicial; buscar: columnas de texto para el buscador. Cambiar de página re-ejecuta solo la tabla.
+    etiquetas = {c: (cfg or {}).get('label') or c for c, cfg in columnas.items()}
+    if st.session_state.get(f'{clave}_orden') not in columnas:
+        st.session_state.pop(f'{clave}_orden', None)
+    c1, c2, c3, c4 = st.columns([3, 2, 1, 1], vertical_alignment="bottom")
+    texto = c1.text_input("Buscar", key=f'{clave}_buscar', placeholder=", ".join(etiquetas[c] for c in buscar),
+                          on_change=a_primera_pagina, args=(clave,)) if buscar else ""
+    col  = c2.selectbox("Ordenar por", list(columnas), index=list(columnas).index(orden[0]), format_func=etiquetas.get,
+                        key=f'{clave}_orden', on_change=a_primera_pagina, args=(clave,))
+    desc = c3.toggle("Descendente", value=orden[1], key=f'{clave}_desc', on_change=a_primera_pagina, args=(clave,))
+
+    sel = np.flatnonzero(filas_con_texto(df, buscar, texto)) if texto else np.arange(len(df))
+    # Orden estable de las filas elegidas (vacíos al final); solo se copian las de la página
+    pos = (df[col].iloc[sel].reset_index(drop=True)
+                  .sort_values(ascending=not desc, kind='stable', na_position='last').index.to_numpy())
+    n_pag = max(1, -(-len(sel) // FILAS_PAGINA))
+    if st.session_state.get(f'{clave}_pagina', 1) > n_pag:
+        st.session_state[f'{clave}_pagina'] = n_pag
+    pagina = c4.number_input("Página", min_value=1, max_value=n_pag, step=1, key=f'{clave}_pagina')
+    i = (pagina - 1) * FILAS_PAGINA
+    visibles = df.iloc[sel[pos[i:i + FILAS_PAGINA]]]
+
+    st.dataframe(visibles, column_config=columnas, column_order=list(columnas),
+                 width="stretch", hide_index=True)
+    st.caption(f"Filas {i + 1 if len(sel) else 0:,}–{i + len(visibles):,} de {len(sel):,}"
+               + (f" (de {len(df):,} en total)" if texto else "") + f" · página {pagina} de {n_pag}")
+
+# ============================================================
+# API JSON (opcional)
+# ============================================================
+# Con FINANZAS_API_PUERTO=puerto el proceso sirve además las métricas en JSON (finanzas/api.py)
+# desde un hilo, con el mismo estado de refresco y las mismas cachés que las sesiones.
+API_PUERTO = os.environ.get("FINANZAS_API_PUERTO")
+# Dirección de la API vista desde el navegador (para los links de exportación)
+API_URL    = os.environ.get("FINANZAS_API_URL", f"http://localhost:{API_PUERTO}").rstrip("/")
+
+@st.cache_resource
+def servidor_api():
+    api = nuevo_estado_api(estado_refresco(), cache_metricas(), cache_historia(), SNAPSHOT_DIR)
+    try:
+        iniciar_api(api, int(API_PUERTO), os.environ.get("FINANZAS_API_HOST", "127.0.0.1"))
+    except (OSError, ValueError) as e:
+        return api, str(e)
+    return api, None
+
+registro = iniciar_registro(st.session_state.get('diag_tiempos', False) or bool(TIEMPOS_LOG),
+                            perfil=st.session_state.get('diag_perfil', False))
 
 # ============================================================
 # CARGA INICIAL
 # ============================================================
+seccion("carga de datos")
 try:
-    df_oferta, df_ausencia, df_valores, df_turnos_dados = cargar_datos()
+    df_oferta, df_ausencia, df_valores, df_turnos_dados, version_actual = cargar_datos()
+    usar_sql = MOTOR == 'duckdb' and motor_disponible()
+    if MOTOR == 'duckdb' and not usar_sql:
+        st.warning("⚠️ FINANZAS_MOTOR=duckdb pero duckdb no está instalado: se calcula con pandas.")
+    indice = (base_sql if usar_sql else indice_periodos)(version_actual, df_oferta, df_ausencia,
+                                                          df_valores, df_turnos_dados)
+    cubo   = cubo_datos(version_actual, df_oferta, df_ausencia, df_valores, df_turnos_dados)
+    if API_PUERTO:
+        api, error_api = servidor_api()
+        ofrecer_recursos(api, version_actual, indice, cubo)
 except Exception as e:
     st.error(f"❌ Error cargando datos: {e}")
-    st.stop()
-
-tiene_td       = not df_turnos_dados.empty and 'TURNO_DADOS' in df_turnos_dados.columns
-# Normalizar períodos a date para comparación robusta
-periodos_reales = set(
-    pd.to_datetime(df_turnos_dados['PERIODO'].dropna()).dt.to_period('M')
-) if tiene_td else set()
+    detener()
+
+# Celdas que no respetan el esquema (se tomaron como vacías)
+seccion("celdas inválidas")
+part_actual = particiones_ingesta(version_actual)
+n_invalidas = {FUENTES[c]['nombre']: sum(m['n'] for m in part.get('invalidas', {}).values())
+               for c, part in part_actual.items()}
+if any(n_invalidas.values()):
+    st.warning("⚠️ Hay celdas con valores inválidos que se tomaron como vacías: " +
+               ", ".join(f"{f} ({n})" for f, n in n_invalidas.items() if n))
+    with st.expander("Ver celdas inválidas"):
+        st.dataframe(pd.DataFrame([
+            dict(FUENTE=FUENTES[c]['nombre'], **fila)
+            for c, part in part_actual.items()
+            for m in part.get('invalidas', {}).values() for fila in m['filas']
+        ]), width="stretch", hide_index=True)
+
+tiene_td        = tiene_turnos_dados(df_turnos_dados)
+periodos_reales = periodos_con_dato_real(df_turnos_dados)
 
 # ============================================================
 # SIDEBAR
 # ============================================================
+seccion("sidebar")
 with st.sidebar:
     st.markdown(f"""
     <div style="text-align:center; padding:10px 0 20px 0;">
@@ -288,7 +477,7 @@ with st.sidebar:
     fechas_disp = sorted(df_valores['PERIODO'].dropna().unique())
     if not fechas_disp:
         st.error("Sin períodos disponibles.")
-        st.stop()
+        detener(version=version_actual)
 
     periodo_sel  = st.selectbox("PERÍODO", fechas_disp, index=len(fechas_disp)-1, format_func=fmt_fecha)
     es_dato_real = pd.Timestamp(periodo_sel).to_period('M') in periodos_reales
@@ -307,56 +496,340 @@ with st.sidebar:
         st.caption(f"Ajustado: **{rend_manual}** pac/cons")
 
     st.markdown("<hr>", unsafe_allow_html=True)
-    st.markdown(f"<div style='font-size:11px;color:{TEXT_MUTED};'>Datos actualizados cada 5 min.</div>", unsafe_allow_html=True)
+    est = estado_datos(estado_refresco())
+    if est['edad'] is not None:
+        prox = f" · próxima actualización en {fmt_duracion(est['proximo'])}" if est['proximo'] is not None and not est['ultimo_error'] else ""
+        st.markdown(f"<div style='font-size:11px;color:{TEXT_MUTED};'>Datos de hace {fmt_duracion(est['edad'])}{prox}</div>", unsafe_allow_html=True)
+    if est['ultimo_error']:
+        hace = f" hace {fmt_duracion(est['hace_error'])}" if est['hace_error'] is not None else ""
+        reint = f" Reintento en {fmt_duracion(est['proximo'])}." if est['proximo'] is not None else ""
+        st.markdown(f"<div style='font-size:11px;color:{ACCENT2};margin-top:4px;'>⚠️ Falló la actualización{hace} "
+                    f"({est['fallos']} {'intento' if est['fallos'] == 1 else 'intentos'}): {est['ultimo_error']}.{reint}</div>",
+                    unsafe_allow_html=True)
+
+    with st.expander("🛠️ Diagnóstico"):
+        st.checkbox("Medir tiempos por etapa", key='diag_tiempos')
+        st.checkbox("Perfilar con cProfile", key='diag_perfil', disabled=not st.session_state.get('diag_tiempos'))
+        if API_PUERTO:
+            st.caption(f"⚠️ API JSON no disponible: {error_api}" if error_api else f"API JSON en el puerto {API_PUERTO}")
 
 # ============================================================
 # HELPERS DE FILTRADO
 # ============================================================
-def filtrar(p):
-    dv = df_valores[df_valores['PERIODO'] == p]
-    do = df_oferta[(df_oferta['PERIODO'].dt.year==p.year)  & (df_oferta['PERIODO'].dt.month==p.month)]
-    da = df_ausencia[(df_ausencia['FECHA_INICIO'].dt.year==p.year) & (df_ausencia['FECHA_INICIO'].dt.month==p.month)]
-    dt = df_turnos_dados[df_turnos_dados['PERIODO']==p] if tiene_td else None
-    return do, da, dv, dt
-
-df_of_f, df_au_f, df_val_f, df_td_f = filtrar(periodo_sel)
+def metricas_periodo(version, p, rend_override=None, real=False):
+    return metricas_periodo_cache(cache_metricas(), version, indice, p, rend_override, real)
+
+def url_exportacion(formato, periodos, rend_override=None):
+    # /exportar de la API: arma el mismo archivo y lo envía de a bloques desde el temporal
+    consulta = dict(desde=f"{periodos[0]:%Y-%m}", hasta=f"{periodos[-1]:%Y-%m}")
+    if rend_override:
+        consulta['rendimiento'] = int(rend_override)
+    return f"{API_URL}/exportar/{formato}?{urlencode(consulta)}"
+
+def partes_detalle(periodos, rend_override=None):
+    # Función que recorre el detalle de pérdidas de cada período, calculándolo recién ahí. La
+    # caché y el índice se toman ahora: el recorrido puede correr fuera del hilo del script.
+    c, version, idx = cache_metricas(), version_actual, indice
+    def partes():
+        for p in periodos:
+            real = pd.Timestamp(p).to_period('M') in periodos_reales
+            df   = detalle_perdidas(metricas_periodo_cache(c, version, idx, p, rend_override, real))
+            yield fmt_fecha(p), (df.assign(PERIODO=p) if len(periodos) > 1 else df)
+    return partes
 
 idx_ant    = fechas_disp.index(periodo_sel) - 1 if fechas_disp.index(periodo_sel) > 0 else None
 periodo_ant = fechas_disp[idx_ant] if idx_ant is not None else None
 
-# Tasa de ocupación promedio histórica (para estimación en períodos sin dato)
-tasa_hist_prom = None
-if tiene_td and periodos_reales:
-    tasas = []
-    for p in sorted(periodos_reales):
-        try:
-            p_ts = p.to_timestamp()
-            do, da, dv, dt = filtrar(p_ts)
-            mh = calcular_metricas(do, da, dv, dt)
-            if mh['tasa_ocup_prom'] and not np.isnan(mh['tasa_ocup_prom']):
-                tasas.append(mh['tasa_ocup_prom'])
-        except:
-            pass
-    tasa_hist_prom = float(np.mean(tasas)) if tasas else None
+# Métricas de todos los períodos en una sola pasada (historia + tasa histórica)
+seccion("historia: métricas")
+periodos_hist = sorted(set(fechas_disp) | {p.to_timestamp() for p in periodos_reales})
+try:
+    m_hist = metricas_historia(cache_historia(), version_actual, df_oferta, df_ausencia, df_valores,
+                               df_turnos_dados if tiene_td else None, periodos_hist,
+                               sql=indice if usar_sql else None)
+except Exception as e:
+    # La página sigue sin la evolución histórica, pero el error queda a la vista y en el log
+    logging.getLogger(__name__).exception("No se pudo calcular la historia de métricas")
+    st.warning(f"⚠️ No se pudo calcular la evolución histórica: {e}")
+    m_hist = None
+
+# Ocupación estimada por estacionalidad y tendencia de cada servicio (períodos sin dato)
+seccion("estimación de ocupación")
+fechas_est = [p for p in fechas_disp if pd.Timestamp(p).to_period('M') not in periodos_reales]
+ocup_est, tot_est = ocupacion_estimada(version_actual, cubo, fechas_est) if tiene_td else (None, None)
+
+# ============================================================
+# FRAGMENTOS
+# ============================================================
+# Partes de la página que se re-ejecutan solas: un widget de adentro no recalcula
+# ni redibuja el resto. Reciben los resultados ya calculados en el rerun completo.
+@st.fragment
+@fragmento_medido("simulador")
+def simulador(m, grp, esc):
+    st.markdown('<div class="sec-title">🎯 Simulador de Estrategia de Recupero</div>', unsafe_allow_html=True)
+    st.markdown(f'<div class="sec-sub">¿Cuánto dinero se recuperaría reduciendo el ausentismo del profesional?</div>', unsafe_allow_html=True)
+
+    tipo_sim = st.radio("Alcance:", ["🏢  Global (todo CEMIC)", "🔬  Por servicio"], horizontal=True)
+
+    if "Por servicio" in tipo_sim and not grp.empty:
+        servicio_sel    = st.selectbox("Servicio a intervenir:", grp['SERVICIO'].tolist())
+        base_calc       = grp[grp['SERVICIO']==servicio_sel]['DINERO_PERDIDO'].values[0]
+        turnos_base     = grp[grp['SERVICIO']==servicio_sel]['TURNOS_PERDIDOS'].values[0]
+        pct_sobre_total = (base_calc / m['total_perd'] * 100) if m['total_perd'] > 0 else 0
+        st.markdown(f"""
+        <div class="insight-box insight-box-amber">
+            📌 <b>{servicio_sel}</b> — pérdida: <b>{fmt_millones(base_calc)}</b>
+            ({turnos_base:,.0f} turnos · {pct_sobre_total:.1f}% del total).
+        </div>
+        """, unsafe_allow_html=True)
+        texto_base = servicio_sel
+    else:
+        base_calc   = m['total_perd']
+        turnos_base = m['turnos_perd']
+        texto_base  = "todo CEMIC"
+
+    col_sl, col_res = st.columns([3, 1])
+    with col_sl:
+        meta_pct = st.slider(f"¿Qué % de la pérdida de {texto_base} se puede recuperar?",
+                             0, 100, 25, key="slider_rec")
+        st.progress(meta_pct / 100)
+    with col_res:
+        dinero_rec = base_calc * (meta_pct / 100)
+        turnos_rec = turnos_base * (meta_pct / 100)
+        st.markdown(kpi_card("Ingreso Extra Estimado", dinero_rec,
+                             delta_label=f"{turnos_rec:,.0f} turnos recuperados",
+                             variant="success"), unsafe_allow_html=True)
+
+    anual_rec = dinero_rec * 12
+    cm, ca    = st.columns(2)
+    cm.markdown(kpi_card("Impacto Mensual", dinero_rec, variant="success"), unsafe_allow_html=True)
+    ca.markdown(kpi_card("Proyección Anual del Recupero", anual_rec, variant="success"), unsafe_allow_html=True)
+    ca.caption("Si se mantiene la mejora los 12 meses")
+
+    # Rango de riesgo: sorteos con la variabilidad histórica de ausencias, rendimiento y valores
+    por_servicio = "Por servicio" in tipo_sim and not grp.empty
+    serie = esc[esc['SERVICIO'] == (servicio_sel if por_servicio else TOTAL)] if esc is not None else None
+    if serie is not None and not serie.empty:
+        r = rango_recupero(esc, servicio_sel if por_servicio else TOTAL, meta_pct)
+        ca.caption(f"Rango 90% según la historia: {fmt_millones(r['P5'])} – {fmt_millones(r['P95'])} "
+                   f"(mediana {fmt_millones(r['P50'])})")
+        with st.expander("📉 Rango de riesgo por meta (Monte Carlo)"):
+            def armar():
+                fig_r = go.Figure()
+                fig_r.add_trace(go.Scatter(x=serie['META'], y=serie['P95'], line=dict(width=0),
+                                           showlegend=False, hoverinfo='skip'))
+                fig_r.add_trace(go.Scatter(x=serie['META'], y=serie['P5'], line=dict(width=0), fill='tonexty',
+                                           fillcolor='rgba(105,240,174,0.2)', name='Rango 90%', hoverinfo='skip'))
+                fig_r.add_trace(go.Scatter(x=serie['META'], y=serie['P50'], name='Mediana',
+                                           line=dict(color=ACCENT4, width=2), mode='lines',
+                                           customdata=serie[['P5','P95']].to_numpy(),
+                                           hovertemplate="Meta %{x}%<br>Mediana: %{y:$,.0f}<br>"
+                                                         "Rango: %{customdata[0]:$,.0f} – %{customdata[1]:$,.0f}<extra></extra>"))
+                fig_r.add_vline(x=meta_pct, line_width=1, line_dash="dash", line_color=TEXT_MUTED,
+                                annotation_text=f"{meta_pct}%", annotation_font_color=TEXT_MUTED)
+                apply_plotly_defaults(fig_r, f"Recupero anual de {texto_base} según la meta")
+                fig_r.update_layout(height=340, xaxis_title="Meta de recupero (%)", xaxis_ticksuffix="%",
+                                    yaxis=dict(tickformat="$.3s"))
+                return fig_r
+            st.plotly_chart(figura(version_actual, ('riesgo', servicio_sel if por_servicio else TOTAL, meta_pct, texto_base), armar),
+                            width="stretch")
+            st.caption("Sorteos de consultorios ausentes, rendimiento y valor del turno con la variabilidad "
+                       "histórica de cada servicio; la meta se cumple con cierta dispersión.")
+
+    if "Por servicio" in tipo_sim and not grp.empty:
+        impacto = (dinero_rec / m['total_perd'] * 100) if m['total_perd'] > 0 else 0
+        st.markdown(f"""
+        <div class="insight-box insight-box-teal" style="margin-top:12px;">
+            💡 Gestionando solo <b>{servicio_sel}</b> al <b>{meta_pct}%</b>,
+            se resuelve el <b>{impacto:.1f}%</b> del problema.
+            Proyectado anualmente: <b>{fmt_millones(anual_rec)}</b>.
+        </div>
+        """, unsafe_allow_html=True)
+
+@st.fragment
+@fragmento_medido("historia")
+def evolucion_historica(m_hist, fechas_disp, periodos_reales, tot_est):
+    st.markdown('<div class="sec-title">📈 Evolución Histórica</div>', unsafe_allow_html=True)
+    st.markdown(f'<div class="sec-sub">Barras verdes oscuras = dato real · Barras transparentes = estimado por oferta · Línea = pérdida por ausentismo · Círculos = ocupación estimada (banda del 95%)</div>', unsafe_allow_html=True)
+
+    df_hist = pd.DataFrame()
+    if m_hist is not None:
+        df_hist = m_hist.loc[fechas_disp].reset_index()
+        es_real = df_hist['PERIODO'].dt.to_period('M').isin(periodos_reales)
+        con_fact_real = es_real & df_hist['tiene_dato_real'] & (df_hist['total_fact_real'] != 0)
+        df_hist = pd.DataFrame({
+            'Período'    : df_hist['PERIODO'],
+            'Label'      : df_hist['PERIODO'].map(fmt_fecha),
+            'Facturación': df_hist['total_fact_real'].where(con_fact_real, df_hist['total_base']),
+            'Pérdida'    : df_hist['total_perd'],
+            '% Fuga'     : df_hist['pct_fuga'],
+            'Tasa Ocup'  : df_hist['tasa_ocup_prom'].where(es_real),
+            'es_real'    : es_real,
+        })
+
+    if len(df_hist) >= 2:
+        df_hist = df_hist.sort_values('Período')
+        df_real = df_hist[df_hist['es_real']]
+        df_est  = df_hist[~df_hist['es_real']]
+
+        def armar():
+            fig_evo = go.Figure()
+            if not df_real.empty:
+                fig_evo.add_trace(go.Bar(x=df_real['Label'], y=df_real['Facturación'],
+                    name='Facturación real', marker_color=ACCENT4, opacity=0.9, marker_line_width=0))
+            if not df_est.empty:
+                fig_evo.add_trace(go.Bar(x=df_est['Label'], y=df_est['Facturación'],
+                    name='Facturación estimada', marker_color=ACCENT4, opacity=0.3, marker_line_width=0))
+            fig_evo.add_trace(go.Scatter(x=df_hist['Label'], y=df_hist['Pérdida'],
+                name='Pérdida ausentismo', line=dict(color=ACCENT2, width=2), mode='lines+markers'))
+
+            df_con_tasa = df_hist[df_hist['Tasa Ocup'].notna()]
+            if not df_con_tasa.empty:
+                fig_evo.add_trace(go.Scatter(x=df_con_tasa['Label'], y=df_con_tasa['Tasa Ocup'],
+                    name='Tasa ocupación %', yaxis='y2',
+                    line=dict(color=ACCENT3, width=2, dash='dot'), mode='lines+markers+text',
+                    text=df_con_tasa['Tasa Ocup'].apply(lambda x: f"{x:.0f}%"),
+                    textposition='top center'))
+
+            # Meses sin dato real: tasa estimada con su banda
+            if tot_est is not None:
+                df_tasa_est = tot_est.reindex(df_est['Período']).assign(Label=df_est['Label'].to_numpy()).dropna()
+                if not df_tasa_est.empty:
+                    fig_evo.add_trace(go.Scatter(x=df_tasa_est['Label'], y=df_tasa_est['tasa_ocup_prom'],
+                        name='Tasa ocupación estimada %', yaxis='y2', mode='markers',
+                        marker=dict(color=ACCENT3, symbol='circle-open', size=8),
+                        error_y=dict(type='data', symmetric=False, color=ACCENT3, thickness=1,
+                                     array=df_tasa_est['tasa_ocup_max'] - df_tasa_est['tasa_ocup_prom'],
+                                     arrayminus=df_tasa_est['tasa_ocup_prom'] - df_tasa_est['tasa_ocup_min'])))
+
+            apply_plotly_defaults(fig_evo, "Facturación y pérdida mensual")
+            fig_evo.update_layout(barmode='overlay', height=360,
+                yaxis2=dict(overlaying='y', side='right', showgrid=False,
+                            title='Tasa Ocup %', color=ACCENT3,
+                            ticksuffix='%', range=[0, 110]))
+            return fig_evo
+        st.plotly_chart(figura(version_actual, ('historia',), armar), width="stretch")
+
+@st.fragment
+@fragmento_medido("desglose")
+def desglose(cubo, fechas_disp, periodo_sel, rend_override):
+    st.markdown('<div class="sec-title">🔎 Desglose de la Pérdida</div>', unsafe_allow_html=True)
+    st.markdown(f'<div class="sec-sub">Pérdida por ausentismo acumulada en un rango de períodos, por la dimensión elegida</div>', unsafe_allow_html=True)
+
+    DIMS = {"Departamento": 'DEPARTAMENTO', "Servicio": 'SERVICIO', "Profesional": 'PROFESIONAL'}
+    c1, c2 = st.columns([1, 3])
+    dim   = DIMS[c1.radio("Por:", list(DIMS), key='desglose_dim')]
+    desde, hasta = c2.select_slider("Períodos:", options=fechas_disp, value=(periodo_sel, periodo_sel),
+                                    format_func=fmt_fecha, key='desglose_rango')
+    comparar_ant = st.checkbox("Comparar con el rango anterior de igual largo", key='desglose_comparar')
+
+    # Todo sale del cubo: agrupar filas ya sumadas, sin volver a los datos crudos
+    if comparar_ant:
+        i, f = fechas_disp.index(desde), fechas_disp.index(hasta)
+        largo = f - i + 1
+        if i - largo < 0:
+            st.info("No hay suficientes períodos anteriores para comparar.")
+            return
+        ant = (fechas_disp[i - largo], fechas_disp[i - 1])
+        tabla = comparar(cubo, [dim], (desde, hasta), ant, rend_override=rend_override).rename(
+            columns={'DINERO_PERDIDO_A': 'DINERO_PERDIDO', 'DINERO_PERDIDO_B': 'ANTERIOR'})
+    else:
+        tabla = rollup(cubo, [dim], desde, hasta, rend_override=rend_override)
+    tabla = tabla[tabla[dim].notna() & (tabla['DINERO_PERDIDO'] > 0)].copy()
+    if tabla.empty:
+        st.info("Sin pérdidas por ausentismo en el rango elegido.")
+        return
+    tabla[dim] = tabla[dim].astype(str)
+    tabla = tabla.sort_values('DINERO_PERDIDO', ascending=False)
+
+    top = tabla.head(15).sort_values('DINERO_PERDIDO', ascending=True)
+    def armar():
+        fig_d = go.Figure(go.Bar(x=top['DINERO_PERDIDO'], y=top[dim], orientation='h', name='Rango elegido',
+                                 text=top['DINERO_PERDIDO'].apply(fmt_millones), textposition='outside',
+                                 marker=dict(color=ACCENT2, line_width=0)))
+        if comparar_ant:
+            fig_d.add_trace(go.Bar(x=top['ANTERIOR'], y=top[dim], orientation='h', name='Rango anterior',
+                                   marker=dict(color=TEXT_MUTED, line_width=0), opacity=0.5))
+        apply_plotly_defaults(fig_d, f"Top {len(top)} — pérdida por {dim.lower()}")
+        fig_d.update_layout(height=max(360, len(top)*26), barmode='group', showlegend=comparar_ant)
+        return fig_d
+    st.plotly_chart(figura(version_actual, ('desglose', dim, desde, hasta, comparar_ant, rend_override), armar),
+                    width="stretch")
+
+    cols = {dim: st.column_config.TextColumn(dim.capitalize()),
+            'DINERO_PERDIDO': st.column_config.NumberColumn('Pérdida ($)', format="$ %,.0f"),
+            'TURNOS_PERDIDOS': st.column_config.NumberColumn('Turnos Perdidos', format="%,.0f"),
+            'ANTERIOR': st.column_config.NumberColumn('Rango anterior ($)', format="$ %,.0f"),
+            'DIFERENCIA': st.column_config.NumberColumn('Diferencia ($)', format="$ %,.0f")}
+    tabla_paginada(tabla, 'desglose_tabla', {c: v for c, v in cols.items() if c in tabla.columns},
+                   ('DINERO_PERDIDO', True), buscar=(dim,))
+
+@st.fragment
+@fragmento_medido("exportación")
+def detalle_exportacion(m, periodo_sel, fechas_disp, rend_override):
+    with st.expander("📄 Ver detalle completo y exportar"):
+        # El cuerpo del expander corre aunque esté cerrado: las filas se arman solo si se piden
+        if st.toggle("Mostrar detalle de ausencias del período", key='ver_detalle'):
+            df_exp = detalle_perdidas(m, ordenar=False)
+            tabla_paginada(df_exp, 'detalle_tabla', {
+                'FECHA_INICIO'     : st.column_config.DateColumn(format="DD/MM/YYYY"),
+                'FECHA_FIN'        : st.column_config.DateColumn(format="DD/MM/YYYY"),
+                'SERVICIO'         : None,
+                'PROFESIONAL'      : None,
+                'FRACCION'         : st.column_config.NumberColumn(format="percent"),
+                '_COL_TARGET'      : st.column_config.NumberColumn(format="%,.1f"),
+                'RENDIMIENTO_USADO': st.column_config.NumberColumn(format="%,.0f"),
+                'TURNOS_PERDIDOS'  : st.column_config.NumberColumn(format="%,.0f"),
+                'DINERO_PERDIDO'   : st.column_config.NumberColumn(format="$ %,.0f"),
+            }, ('DINERO_PERDIDO', True), buscar=('SERVICIO', 'PROFESIONAL'))
+        st.markdown("<br>", unsafe_allow_html=True)
+
+        # Los archivos se generan al hacer clic, no en cada rerun
+        c1, c2 = st.columns([1, 3])
+        alcance = c1.radio("Exportar:", ["Período seleccionado", "Rango de períodos"], key='exp_alcance')
+        periodos = [periodo_sel]
+        if alcance == "Rango de períodos":
+            desde, hasta = c2.select_slider("Períodos a exportar:", options=fechas_disp, key='exp_rango',
+                                            value=(fechas_disp[max(0, fechas_disp.index(periodo_sel) - 11)], periodo_sel),
+                                            format_func=fmt_fecha)
+            periodos = fechas_disp[fechas_disp.index(desde):fechas_disp.index(hasta) + 1]
+            c2.caption(f"{len(periodos)} períodos · Excel: una hoja por período · CSV y Parquet: una tabla con columna PERIODO")
+        nombre = "_".join(dict.fromkeys(fmt_fecha(p).replace(' ','_') for p in (periodos[0], periodos[-1])))
+
+        por_api = bool(API_PUERTO) and not error_api
+        for col, (formato, (etiqueta, mime, _)) in zip(st.columns([1,1,1,3])[:3], FORMATOS.items()):
+            if por_api:
+                col.link_button(f"⬇️ {etiqueta}", url_exportacion(formato, periodos, rend_override),
+                                width="stretch")
+                continue
+            col.download_button(f"⬇️ {etiqueta}", descarga(formato, partes_detalle(periodos, rend_override)),
+                f"perdidas_{nombre}.{formato}", mime, on_click="ignore",
+                width="stretch", key=f'exp_{formato}')
 
 # ============================================================
 # MAIN
 # ============================================================
+seccion("métricas del período")
 try:
-    m = calcular_metricas(df_of_f, df_au_f, df_val_f,
-                          df_td_f if es_dato_real else None,
-                          rend_override=rend_manual if usar_slider else None)
+    m = metricas_periodo(version_actual, periodo_sel,
+                         rend_override=rend_manual if usar_slider else None, real=es_dato_real)
+
+    # Ocupación estimada del período (solo si no tiene dato real)
+    tot_p, ocup_p = None, None
+    if tot_est is not None and not m['tiene_dato_real'] and pd.Timestamp(periodo_sel) in tot_est.index:
+        tot_p  = tot_est.loc[pd.Timestamp(periodo_sel)]
+        ocup_p = ocup_est[ocup_est['PERIODO'] == pd.Timestamp(periodo_sel)]
 
     m_ant = None
     if periodo_ant is not None:
         try:
             ant_real = pd.Timestamp(periodo_ant).to_period('M') in periodos_reales
-            do_a, da_a, dv_a, dt_a = filtrar(periodo_ant)
-            m_ant = calcular_metricas(do_a, da_a, dv_a, dt_a if ant_real else None)
+            m_ant = metricas_periodo(version_actual, periodo_ant, real=ant_real)
         except:
             m_ant = None
 
     # ── Encabezado ─────────────────────────────────────────
+    seccion("encabezado")
     badge_per = "✅ Dato real" if es_dato_real else "📈 Estimado"
     badge_cls = "badge" if es_dato_real else "badge badge-proj"
     vs_str    = f"&nbsp;&nbsp;vs&nbsp;&nbsp;<span style='color:{TEXT_MUTED};'>{fmt_fecha(periodo_ant)}</span>" if periodo_ant else ""
@@ -371,6 +844,7 @@ try:
     """, unsafe_allow_html=True)
 
     # ── KPIs ───────────────────────────────────────────────
+    seccion("KPIs")
     d_base = (m['total_base'] - m_ant['total_base']) if m_ant else None
     d_perd = (m['total_perd'] - m_ant['total_perd']) if m_ant else None
 
@@ -412,19 +886,22 @@ try:
         c4.markdown(kpi_card("📅 Proyección Anual Pérdida", m['total_perd'] * 12, variant="warning"), unsafe_allow_html=True)
         c4.caption("Si el ausentismo de este mes se mantiene 12 meses")
 
-        if tasa_hist_prom:
-            fact_est = m['total_base'] * tasa_hist_prom / 100
+        if tot_p is not None:
             st.markdown(f"""
             <div class="insight-box insight-box-amber" style="margin-top:12px;">
-                📈 <b>Estimación:</b> Basado en los meses anteriores, la tasa de ocupación promedio es
-                <b>{tasa_hist_prom:.1f}%</b>. La facturación real estimada para este período sería
-                <b>{fmt_millones(fact_est)}</b> — cargá los turnos dados para ver el dato exacto.
+                📈 <b>Estimación:</b> Según la estacionalidad y la tendencia de cada servicio, la tasa de
+                ocupación promedio sería <b>{tot_p['tasa_ocup_prom']:.1f}%</b>
+                (entre {tot_p['tasa_ocup_min']:.1f}% y {tot_p['tasa_ocup_max']:.1f}%, 95%). La facturación real
+                estimada para este período sería <b>{fmt_millones(tot_p['total_fact_real'])}</b>
+                (entre {fmt_millones(tot_p['fact_real_min'])} y {fmt_millones(tot_p['fact_real_max'])})
+                — cargá los turnos dados para ver el dato exacto.
             </div>
             """, unsafe_allow_html=True)
 
     st.markdown("<br>", unsafe_allow_html=True)
 
     # ── Waterfall ──────────────────────────────────────────
+    seccion("waterfall")
     st.markdown('<div class="sec-title">📊 Composición Financiera del Período</div>', unsafe_allow_html=True)
 
     if m['tiene_dato_real']:
@@ -441,30 +918,31 @@ try:
         wf_t = [fmt_millones(m['total_pot']), f"- {fmt_millones(m['total_perd'])}", fmt_millones(m['total_base'])]
         wf_m = ["absolute","relative","total"]
 
-    fig_wf = go.Figure(go.Waterfall(
-        name="", orientation="v", measure=wf_m, x=wf_x, y=wf_y, text=wf_t,
-        textposition="outside",
-        connector=dict(line=dict(color=BORDER, width=1, dash="dot")),
-        increasing=dict(marker=dict(color=BLUE_LIGHT)),
-        decreasing=dict(marker=dict(color=ACCENT2, line=dict(color=ACCENT2, width=0))),
-        totals=dict(marker=dict(color=ACCENT4, line=dict(color=ACCENT4, width=0))),
-        textfont=dict(size=13, color="#CDD6F4"),
-    ))
-    apply_plotly_defaults(fig_wf)
-    fig_wf.update_layout(height=360, showlegend=False, yaxis=dict(tickformat="$.3s"))
-    st.plotly_chart(fig_wf, use_container_width=True)
+    def armar():
+        fig_wf = go.Figure(go.Waterfall(
+            name="", orientation="v", measure=wf_m, x=wf_x, y=wf_y, text=wf_t,
+            textposition="outside",
+            connector=dict(line=dict(color=BORDER, width=1, dash="dot")),
+            increasing=dict(marker=dict(color=BLUE_LIGHT)),
+            decreasing=dict(marker=dict(color=ACCENT2, line=dict(color=ACCENT2, width=0))),
+            totals=dict(marker=dict(color=ACCENT4, line=dict(color=ACCENT4, width=0))),
+            textfont=dict(size=13, color="#CDD6F4"),
+        ))
+        apply_plotly_defaults(fig_wf)
+        fig_wf.update_layout(height=360, showlegend=False, yaxis=dict(tickformat="$.3s"))
+        return fig_wf
+    st.plotly_chart(figura(version_actual, ('waterfall', periodo_sel, rend_manual if usar_slider else None, es_dato_real), armar),
+                    width="stretch")
 
     st.markdown("<hr>", unsafe_allow_html=True)
 
     # ── Tasa de ocupación (solo si hay dato real) ───────────
+    seccion("ocupación")
     if m['tiene_dato_real'] and not m['df_ocup'].empty:
         st.markdown('<div class="sec-title">📋 Tasa de Ocupación por Servicio</div>', unsafe_allow_html=True)
         st.markdown(f'<div class="sec-sub">Turnos dados / turnos ofertados · Verde = buena ocupación · Rojo = baja ocupación · &gt;100% = alta demanda espontánea</div>', unsafe_allow_html=True)
 
-        ocup = m['df_ocup'].sort_values('TASA_OCUP', ascending=True).copy()
-        ocup['color'] = ocup['TASA_OCUP'].apply(
-            lambda x: ACCENT2 if x < 60 else (ACCENT3 if x < 85 else ACCENT4))
-        ocup['etiqueta'] = ocup['TASA_OCUP'].apply(lambda x: f"{x:.0f}%")
+        ocup = m['df_ocup'].sort_values('TASA_OCUP', ascending=True)
 
         baja = ocup[ocup['TASA_OCUP'] < 60].sort_values('PERD_INASISTENCIA', ascending=False).head(3)
         alta = ocup[ocup['TASA_OCUP'] > 100]
@@ -487,31 +965,65 @@ try:
             </div>
             """, unsafe_allow_html=True)
 
-        fig_ocup = go.Figure(go.Bar(
-            x=ocup['TASA_OCUP'], y=ocup['SERVICIO'], orientation='h',
-            text=ocup['etiqueta'], textposition='outside',
-            marker=dict(color=ocup['color'], line_width=0),
-            customdata=np.stack([ocup['TURNO_DADOS'], ocup['TURNOS_OFERTA'],
-                                 ocup['FACT_REAL'], ocup['PERD_INASISTENCIA']], axis=1),
-            hovertemplate=(
-                "<b>%{y}</b><br>Tasa: %{x:.1f}%<br>"
-                "Turnos dados: %{customdata[0]:,.0f}<br>"
-                "Turnos ofertados: %{customdata[1]:,.0f}<br>"
-                "Facturación real: $%{customdata[2]:,.0f}<br>"
-                "Brecha oferta-demanda: $%{customdata[3]:,.0f}<extra></extra>"
-            )
-        ))
-        fig_ocup.add_vline(x=100, line_width=1, line_dash="dash", line_color=TEXT_MUTED,
-                           annotation_text="100%", annotation_font_color=TEXT_MUTED)
-        apply_plotly_defaults(fig_ocup, "Tasa de ocupación por servicio")
-        fig_ocup.update_layout(height=max(420, len(ocup)*22), xaxis_ticksuffix="%")
-        st.plotly_chart(fig_ocup, use_container_width=True)
+        def armar():
+            color = ocup['TASA_OCUP'].apply(lambda x: ACCENT2 if x < 60 else (ACCENT3 if x < 85 else ACCENT4))
+            fig_ocup = go.Figure(go.Bar(
+                x=ocup['TASA_OCUP'], y=ocup['SERVICIO'], orientation='h',
+                text=ocup['TASA_OCUP'].apply(lambda x: f"{x:.0f}%"), textposition='outside',
+                marker=dict(color=color, line_width=0),
+                customdata=np.stack([ocup['TURNO_DADOS'], ocup['TURNOS_OFERTA'],
+                                     ocup['FACT_REAL'], ocup['PERD_INASISTENCIA']], axis=1),
+                hovertemplate=(
+                    "<b>%{y}</b><br>Tasa: %{x:.1f}%<br>"
+                    "Turnos dados: %{customdata[0]:,.0f}<br>"
+                    "Turnos ofertados: %{customdata[1]:,.0f}<br>"
+                    "Facturación real: $%{customdata[2]:,.0f}<br>"
+                    "Brecha oferta-demanda: $%{customdata[3]:,.0f}<extra></extra>"
+                )
+            ))
+            fig_ocup.add_vline(x=100, line_width=1, line_dash="dash", line_color=TEXT_MUTED,
+                               annotation_text="100%", annotation_font_color=TEXT_MUTED)
+            apply_plotly_defaults(fig_ocup, "Tasa de ocupación por servicio")
+            fig_ocup.update_layout(height=max(420, len(ocup)*22), xaxis_ticksuffix="%")
+            return fig_ocup
+        st.plotly_chart(figura(version_actual, ('ocupacion', periodo_sel, rend_manual if usar_slider else None), armar), width="stretch")
+        st.markdown("<hr>", unsafe_allow_html=True)
+    elif ocup_p is not None and not ocup_p.empty:
+        st.markdown('<div class="sec-title">📋 Tasa de Ocupación Estimada por Servicio</div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="sec-sub">Estacionalidad y tendencia de los meses con turnos dados · Barra de error = banda del 95% · <span class="badge badge-proj">📈 Estimado</span></div>', unsafe_allow_html=True)
+
+        ocup = ocup_p.sort_values('TASA_OCUP', ascending=True)
+        def armar():
+            fig_ocup = go.Figure(go.Bar(
+                x=ocup['TASA_OCUP'], y=ocup['SERVICIO'], orientation='h',
+                marker=dict(color=ocup['TASA_OCUP'].apply(
+                    lambda x: ACCENT2 if x < 60 else (ACCENT3 if x < 85 else ACCENT4)), line_width=0, opacity=0.5),
+                error_x=dict(type='data', symmetric=False, color=TEXT_MUTED,
+                             array=ocup['TASA_OCUP_MAX'] - ocup['TASA_OCUP'],
+                             arrayminus=ocup['TASA_OCUP'] - ocup['TASA_OCUP_MIN']),
+                customdata=np.stack([ocup['TASA_OCUP_MIN'], ocup['TASA_OCUP_MAX'],
+                                     ocup['FACT_REAL'], ocup['PERD_INASISTENCIA']], axis=1),
+                hovertemplate=(
+                    "<b>%{y}</b><br>Tasa estimada: %{x:.1f}% (%{customdata[0]:.1f}% – %{customdata[1]:.1f}%)<br>"
+                    "Facturación real estimada: $%{customdata[2]:,.0f}<br>"
+                    "Brecha oferta-demanda estimada: $%{customdata[3]:,.0f}<extra></extra>"
+                )
+            ))
+            fig_ocup.add_vline(x=100, line_width=1, line_dash="dash", line_color=TEXT_MUTED,
+                               annotation_text="100%", annotation_font_color=TEXT_MUTED)
+            apply_plotly_defaults(fig_ocup, "Tasa de ocupación estimada por servicio")
+            fig_ocup.update_layout(height=max(420, len(ocup)*22), xaxis_ticksuffix="%")
+            return fig_ocup
+        st.plotly_chart(figura(version_actual, ('ocupacion_est', periodo_sel), armar), width="stretch")
         st.markdown("<hr>", unsafe_allow_html=True)
 
     # ── Top pérdidas por ausentismo profesional ─────────────
+    seccion("pareto")
     st.markdown('<div class="sec-title">📉 Pérdida por Ausentismo del Profesional</div>', unsafe_allow_html=True)
 
-    grp = m['df_perd'].groupby('SERVICIO')[['DINERO_PERDIDO','TURNOS_PERDIDOS']].sum().reset_index()
+    grp = rollup(cubo, ['SERVICIO'], periodo_sel, periodo_sel, rend_override=rend_manual if usar_slider else None)
+    grp = grp[['SERVICIO','DINERO_PERDIDO','TURNOS_PERDIDOS']]
+    grp['SERVICIO'] = grp['SERVICIO'].astype(str)
     grp = grp[grp['DINERO_PERDIDO'] > 0].sort_values('DINERO_PERDIDO', ascending=False)
 
     if grp.empty:
@@ -526,159 +1038,79 @@ try:
         </div>
         """, unsafe_allow_html=True)
 
-        tab1, tab2 = st.tabs(["📊  Top 10 servicios", "📋  Todos los servicios"])
+        tab1, tab2, tab3 = st.tabs(["📊  Top 10 servicios", "📋  Todos los servicios", "🎚️  Sensibilidad al rendimiento"])
         with tab1:
-            top10 = grp.head(10).sort_values('DINERO_PERDIDO', ascending=True).copy()
-            top10['etiqueta'] = top10['DINERO_PERDIDO'].apply(fmt_millones)
-            top10['pct']      = (top10['DINERO_PERDIDO'] / m['total_perd'] * 100).round(1)
-            fig_b = px.bar(top10, x='DINERO_PERDIDO', y='SERVICIO', orientation='h',
-                           text='etiqueta', color='DINERO_PERDIDO',
-                           color_continuous_scale=[[0,"#FF8A65"],[0.5,ACCENT2],[1,"#B71C1C"]],
-                           custom_data=['TURNOS_PERDIDOS','pct'])
-            fig_b.update_traces(textposition='outside', marker_line_width=0,
-                hovertemplate="<b>%{y}</b><br>Pérdida: %{x:$,.0f}<br>Turnos: %{customdata[0]:,.0f}<br>% total: %{customdata[1]:.1f}%<extra></extra>")
-            fig_b.update_coloraxes(showscale=False)
-            apply_plotly_defaults(fig_b, "Top 10 — pérdida por ausentismo profesional")
-            fig_b.update_layout(height=420)
-            st.plotly_chart(fig_b, use_container_width=True)
+            def armar():
+                top10 = grp.head(10).sort_values('DINERO_PERDIDO', ascending=True).copy()
+                top10['etiqueta'] = top10['DINERO_PERDIDO'].apply(fmt_millones)
+                top10['pct']      = (top10['DINERO_PERDIDO'] / m['total_perd'] * 100).round(1)
+                fig_b = px.bar(top10, x='DINERO_PERDIDO', y='SERVICIO', orientation='h',
+                               text='etiqueta', color='DINERO_PERDIDO',
+                               color_continuous_scale=[[0,"#FF8A65"],[0.5,ACCENT2],[1,"#B71C1C"]],
+                               custom_data=['TURNOS_PERDIDOS','pct'])
+                fig_b.update_traces(textposition='outside', marker_line_width=0,
+                    hovertemplate="<b>%{y}</b><br>Pérdida: %{x:$,.0f}<br>Turnos: %{customdata[0]:,.0f}<br>% total: %{customdata[1]:.1f}%<extra></extra>")
+                fig_b.update_coloraxes(showscale=False)
+                apply_plotly_defaults(fig_b, "Top 10 — pérdida por ausentismo profesional")
+                fig_b.update_layout(height=420)
+                return fig_b
+            st.plotly_chart(figura(version_actual, ('top10', periodo_sel, rend_manual if usar_slider else None), armar), width="stretch")
         with tab2:
-            dt = grp.copy()
-            dt['% del total']     = (dt['DINERO_PERDIDO'] / m['total_perd'] * 100).round(1).fillna(0)
-            dt['Pérdida ($)']     = dt['DINERO_PERDIDO'].apply(lambda x: f"$ {x:,.0f}")
-            dt['Turnos Perdidos'] = dt['TURNOS_PERDIDOS'].apply(lambda x: f"{x:,.0f}")
-            st.dataframe(
-                dt[['SERVICIO','Pérdida ($)','Turnos Perdidos','% del total']]
-                    .style.bar(subset=['% del total'], color=ACCENT2, vmin=0, vmax=100),
-                use_container_width=True, hide_index=True
-            )
+            dt = grp.assign(PCT=(grp['DINERO_PERDIDO'] / m['total_perd'] * 100).fillna(0) if m['total_perd'] > 0 else 0.0)
+            tabla_paginada(dt, 'pareto_tabla', {
+                'SERVICIO'       : st.column_config.TextColumn('Servicio'),
+                'DINERO_PERDIDO' : st.column_config.NumberColumn('Pérdida ($)', format="$ %,.0f"),
+                'TURNOS_PERDIDOS': st.column_config.NumberColumn('Turnos Perdidos', format="%,.0f"),
+                'PCT'            : st.column_config.ProgressColumn('% del total', format="%.1f%%", min_value=0, max_value=100),
+            }, ('DINERO_PERDIDO', True), buscar=('SERVICIO',))
+        with tab3:
+            def armar():
+                rends = np.arange(1, 31)
+                sens  = m['sens']
+                curva = curva_sensibilidad(sens[sens['SERVICIO'].astype(str).isin(top3['SERVICIO'])], rends)
+                fig_s = go.Figure()
+                fig_s.add_trace(go.Scatter(x=rends, y=sens['PERD_POR_REND'].sum() * rends, name='Total CEMIC',
+                    line=dict(color=ACCENT2, width=3), mode='lines'))
+                for i, (serv, g) in enumerate(curva.groupby('SERVICIO', sort=False)):
+                    fig_s.add_trace(go.Scatter(x=g['RENDIMIENTO'], y=g['DINERO_PERDIDO'], name=serv,
+                        line=dict(color=[ACCENT3, BLUE_LIGHT, ACCENT4][i % 3], width=2), mode='lines'))
+                if usar_slider:
+                    fig_s.add_vline(x=rend_manual, line_width=1, line_dash="dash", line_color=TEXT_MUTED,
+                                    annotation_text=f"{rend_manual} pac/cons", annotation_font_color=TEXT_MUTED)
+                apply_plotly_defaults(fig_s, "Pérdida según pacientes por consultorio")
+                fig_s.update_layout(height=380, xaxis_title="Pacientes por consultorio", yaxis=dict(tickformat="$.3s"))
+                return fig_s
+            st.plotly_chart(figura(version_actual, ('sensibilidad', periodo_sel, rend_manual if usar_slider else None), armar), width="stretch")
 
     st.markdown("<hr>", unsafe_allow_html=True)
 
-    # ── Simulador de estrategia ─────────────────────────────
-    st.markdown('<div class="sec-title">🎯 Simulador de Estrategia de Recupero</div>', unsafe_allow_html=True)
-    st.markdown(f'<div class="sec-sub">¿Cuánto dinero se recuperaría reduciendo el ausentismo del profesional?</div>', unsafe_allow_html=True)
-
-    tipo_sim = st.radio("Alcance:", ["🏢  Global (todo CEMIC)", "🔬  Por servicio"], horizontal=True)
+    # ── Desglose por departamento / profesional ─────────────
+    seccion("desglose")
+    desglose(cubo, fechas_disp, periodo_sel, rend_manual if usar_slider else None)
 
-    if "Por servicio" in tipo_sim and not grp.empty:
-        servicio_sel    = st.selectbox("Servicio a intervenir:", grp['SERVICIO'].tolist())
-        base_calc       = grp[grp['SERVICIO']==servicio_sel]['DINERO_PERDIDO'].values[0]
-        turnos_base     = grp[grp['SERVICIO']==servicio_sel]['TURNOS_PERDIDOS'].values[0]
-        pct_sobre_total = (base_calc / m['total_perd'] * 100) if m['total_perd'] > 0 else 0
-        st.markdown(f"""
-        <div class="insight-box insight-box-amber">
-            📌 <b>{servicio_sel}</b> — pérdida: <b>{fmt_millones(base_calc)}</b>
-            ({turnos_base:,.0f} turnos · {pct_sobre_total:.1f}% del total).
-        </div>
-        """, unsafe_allow_html=True)
-        texto_base = servicio_sel
-    else:
-        base_calc   = m['total_perd']
-        turnos_base = m['turnos_perd']
-        texto_base  = "todo CEMIC"
-
-    col_sl, col_res = st.columns([3, 1])
-    with col_sl:
-        meta_pct = st.slider(f"¿Qué % de la pérdida de {texto_base} se puede recuperar?",
-                             0, 100, 25, key="slider_rec")
-        st.progress(meta_pct / 100)
-    with col_res:
-        dinero_rec = base_calc * (meta_pct / 100)
-        turnos_rec = turnos_base * (meta_pct / 100)
-        st.markdown(kpi_card("Ingreso Extra Estimado", dinero_rec,
-                             delta_label=f"{turnos_rec:,.0f} turnos recuperados",
-                             variant="success"), unsafe_allow_html=True)
-
-    anual_rec = dinero_rec * 12
-    cm, ca    = st.columns(2)
-    cm.markdown(kpi_card("Impacto Mensual", dinero_rec, variant="success"), unsafe_allow_html=True)
-    ca.markdown(kpi_card("Proyección Anual del Recupero", anual_rec, variant="success"), unsafe_allow_html=True)
-    ca.caption("Si se mantiene la mejora los 12 meses")
+    st.markdown("<hr>", unsafe_allow_html=True)
 
-    if "Por servicio" in tipo_sim and not grp.empty:
-        impacto = (dinero_rec / m['total_perd'] * 100) if m['total_perd'] > 0 else 0
-        st.markdown(f"""
-        <div class="insight-box insight-box-teal" style="margin-top:12px;">
-            💡 Gestionando solo <b>{servicio_sel}</b> al <b>{meta_pct}%</b>,
-            se resuelve el <b>{impacto:.1f}%</b> del problema.
-            Proyectado anualmente: <b>{fmt_millones(anual_rec)}</b>.
-        </div>
-        """, unsafe_allow_html=True)
+    # ── Simulador de estrategia ─────────────────────────────
+    seccion("simulador")
+    simulador(m, grp, escenarios_recupero(version_actual, cubo, df_valores))
 
     st.markdown("<hr>", unsafe_allow_html=True)
 
     # ── Evolución histórica ─────────────────────────────────
-    st.markdown('<div class="sec-title">📈 Evolución Histórica</div>', unsafe_allow_html=True)
-    st.markdown(f'<div class="sec-sub">Barras verdes oscuras = dato real · Barras transparentes = estimado por oferta · Línea = pérdida por ausentismo</div>', unsafe_allow_html=True)
-
-    hist_rows = []
-    for p in fechas_disp:
-        try:
-            do, da, dv, dt = filtrar(p)
-            real = pd.Timestamp(p).to_period('M') in periodos_reales
-            mh   = calcular_metricas(do, da, dv, dt if real else None)
-            hist_rows.append({
-                'Período'    : p, 'Label': fmt_fecha(p),
-                'Facturación': mh['total_fact_real'] if (real and mh['total_fact_real']) else mh['total_base'],
-                'Pérdida'    : mh['total_perd'],
-                '% Fuga'     : mh['pct_fuga'],
-                'Tasa Ocup'  : mh['tasa_ocup_prom'] if real else None,
-                'es_real'    : real,
-            })
-        except:
-            pass
-
-    if len(hist_rows) >= 2:
-        df_hist = pd.DataFrame(hist_rows).sort_values('Período')
-        df_real = df_hist[df_hist['es_real']]
-        df_est  = df_hist[~df_hist['es_real']]
-
-        fig_evo = go.Figure()
-        if not df_real.empty:
-            fig_evo.add_trace(go.Bar(x=df_real['Label'], y=df_real['Facturación'],
-                name='Facturación real', marker_color=ACCENT4, opacity=0.9, marker_line_width=0))
-        if not df_est.empty:
-            fig_evo.add_trace(go.Bar(x=df_est['Label'], y=df_est['Facturación'],
-                name='Facturación estimada', marker_color=ACCENT4, opacity=0.3, marker_line_width=0))
-        fig_evo.add_trace(go.Scatter(x=df_hist['Label'], y=df_hist['Pérdida'],
-            name='Pérdida ausentismo', line=dict(color=ACCENT2, width=2), mode='lines+markers'))
-
-        df_con_tasa = df_hist[df_hist['Tasa Ocup'].notna()]
-        if not df_con_tasa.empty:
-            fig_evo.add_trace(go.Scatter(x=df_con_tasa['Label'], y=df_con_tasa['Tasa Ocup'],
-                name='Tasa ocupación %', yaxis='y2',
-                line=dict(color=ACCENT3, width=2, dash='dot'), mode='lines+markers+text',
-                text=df_con_tasa['Tasa Ocup'].apply(lambda x: f"{x:.0f}%"),
-                textposition='top center'))
-
-        apply_plotly_defaults(fig_evo, "Facturación y pérdida mensual")
-        fig_evo.update_layout(barmode='overlay', height=360,
-            yaxis2=dict(overlaying='y', side='right', showgrid=False,
-                        title='Tasa Ocup %', color=ACCENT3,
-                        ticksuffix='%', range=[0, 110]))
-        st.plotly_chart(fig_evo, use_container_width=True)
+    seccion("historia: gráfico")
+    evolucion_historica(m_hist, fechas_disp, periodos_reales, tot_est)
 
     st.markdown("<hr>", unsafe_allow_html=True)
 
     # ── Detalle y exportación ───────────────────────────────
-    with st.expander("📄 Ver detalle completo y exportar"):
-        df_exp = m['df_perd'].copy()
-        cols   = [c for c in ['FECHA_INICIO','SERVICIO','PROFESIONAL','_COL_TARGET',
-                               'RENDIMIENTO_USADO','TURNOS_PERDIDOS','DINERO_PERDIDO'] if c in df_exp.columns]
-        df_exp = df_exp[cols].sort_values('DINERO_PERDIDO', ascending=False)
-        st.dataframe(df_exp.style.format({
-            'DINERO_PERDIDO':'$ {:,.0f}','TURNOS_PERDIDOS':'{:,.0f}',
-            '_COL_TARGET':'{:,.0f}','RENDIMIENTO_USADO':'{:,.0f}'}),
-            use_container_width=True, hide_index=True)
-        st.markdown("<br>", unsafe_allow_html=True)
-        cx, cc, _ = st.columns([1,1,4])
-        cx.download_button("⬇️ Excel", generar_excel(df_exp,"Pérdidas"),
-            f"perdidas_{fmt_fecha(periodo_sel).replace(' ','_')}.xlsx",
-            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
-        cc.download_button("⬇️ CSV", df_exp.to_csv(index=False).encode('utf-8'),
-            f"perdidas_{fmt_fecha(periodo_sel).replace(' ','_')}.csv",
-            "text/csv", use_container_width=True)
+    seccion("exportación")
+    detalle_exportacion(m, periodo_sel, fechas_disp, rend_manual if usar_slider else None)
 
 except Exception as e:
     st.error(f"❌ Error de cálculo: {e}")
     st.exception(e)
+
+# ============================================================
+# PANEL DE TIEMPOS
+# ============================================================
+cerrar_registro(version=version_actual, periodo=str(periodo_sel))
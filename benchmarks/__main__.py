@@ -0,0 +1,5 @@
+import sys
+
+from .correr import main
+
+sys.exit(main())
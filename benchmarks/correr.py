@@ -0,0 +1,282 @@
+import gc
+import os
+import sys
+import json
+import time
+import platform
+import threading
+import argparse
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from finanzas.carga import FUENTES, parsear_csv, ingerir_fuente, compactar
+from finanzas.snapshot import guardar_snapshot, leer_snapshot
+from finanzas.periodos import indexar_periodos, filtrar, tiene_turnos_dados, asignar_ausencias
+from finanzas.metricas import calcular_metricas, calcular_metricas_periodos, aplicar_rendimiento
+from finanzas.cubo import construir_cubo, rollup
+from finanzas.escenarios import ajustar_escenarios, simular_recupero
+from finanzas.sql import motor_disponible
+from .sintetico import TAMANOS, generar, como_csv
+
+# ============================================================
+# ETAPAS
+# ============================================================
+# Cada etapa recibe el contexto y devuelve un dict con lo que agrega (o None).
+# Se ejecutan en orden: las posteriores usan lo que dejaron las anteriores.
+def etapa_carga(ctx):
+    # Camino de cargar_datos sin red: CSV → tipado + particiones → compactado
+    datos, particiones = [], {}
+    for clave in FUENTES:
+        limpio, particiones[clave], _ = ingerir_fuente(clave, parsear_csv(ctx['csv'][clave]))
+        datos.append(limpio)
+    return dict(datos=compactar(datos), particiones=particiones)
+
+def etapa_carga_incremental(ctx):
+    # Misma descarga con un solo mes de ausencias modificado
+    datos = []
+    for clave, previo in zip(FUENTES, ctx['datos']):
+        raw = parsear_csv(ctx['csv_mod'][clave] if clave in ctx['csv_mod'] else ctx['csv'][clave])
+        datos.append(ingerir_fuente(clave, raw, previo, ctx['particiones'][clave])[0])
+    compactar(datos)
+
+def etapa_snapshot_escritura(ctx):
+    guardar_snapshot(ctx['datos'], ctx['dir_snapshot'])
+
+def etapa_snapshot_lectura(ctx):
+    leer_snapshot(ctx['dir_snapshot'])
+
+def etapa_asignacion(ctx):
+    # Reparto de todas las ausencias entre los meses que cubren
+    asignar_ausencias(ctx['datos'][1])
+
+def etapa_indice(ctx):
+    return dict(indice=indexar_periodos(*ctx['datos']))
+
+def etapa_filtrar(ctx):
+    for p in ctx['periodos']:
+        filtrar(ctx['indice'], p)
+
+def etapa_metricas(ctx):
+    # Una llamada por período, como al recorrer el selector de la app
+    for p in ctx['periodos']:
+        do, da, dv, dt = filtrar(ctx['indice'], p)
+        calcular_metricas(do, da, dv, dt)
+
+def etapa_rendimiento(ctx):
+    # Barrido del slider de rendimiento sobre el último período
+    do, da, dv, dt = filtrar(ctx['indice'], ctx['periodos'][-1])
+    m = calcular_metricas(do, da, dv, dt)
+    for r in range(1, 31):
+        aplicar_rendimiento(m, r)
+
+def etapa_historia(ctx):
+    df_of, df_au, df_val, df_td = ctx['datos']
+    calcular_metricas_periodos(df_of, df_au, df_val, df_td if tiene_turnos_dados(df_td) else None,
+                               ctx['periodos'])
+
+def etapa_cubo(ctx):
+    return dict(cubo=construir_cubo(*ctx['datos']))
+
+def etapa_rollup(ctx):
+    # Pareto por servicio de cada período y desgloses de todo el rango
+    for p in ctx['periodos']:
+        rollup(ctx['cubo'], ['SERVICIO'], p, p)
+    for dim in ('DEPARTAMENTO', 'SERVICIO', 'PROFESIONAL'):
+        rollup(ctx['cubo'], [dim], ctx['periodos'][0], ctx['periodos'][-1])
+
+def etapa_escenarios(ctx):
+    # Grilla completa servicio × meta, en un solo proceso
+    simular_recupero(ajustar_escenarios(ctx['cubo'], ctx['datos'][2]), procesos=1)
+
+# Motor SQL (opcional): mismas cuentas que metricas e historia, en DuckDB
+def etapa_base_sql(ctx):
+    from finanzas.sql import abrir_base
+    return dict(base_sql=abrir_base(*ctx['datos']))
+
+def etapa_metricas_sql(ctx):
+    from finanzas.sql import calcular_metricas_sql
+    for p in ctx['periodos']:
+        calcular_metricas_sql(ctx['base_sql'], p, real=True)
+
+def etapa_historia_sql(ctx):
+    from finanzas.sql import calcular_metricas_periodos_sql
+    calcular_metricas_periodos_sql(ctx['base_sql'], ctx['periodos'])
+
+ETAPAS = dict(
+    carga              = etapa_carga,
+    carga_incremental  = etapa_carga_incremental,
+    snapshot_escritura = etapa_snapshot_escritura,
+    snapshot_lectura   = etapa_snapshot_lectura,
+    asignacion         = etapa_asignacion,
+    indice             = etapa_indice,
+    filtrar            = etapa_filtrar,
+    metricas           = etapa_metricas,
+    rendimiento        = etapa_rendimiento,
+    historia           = etapa_historia,
+    cubo               = etapa_cubo,
+    rollup             = etapa_rollup,
+    escenarios         = etapa_escenarios,
+    base_sql           = etapa_base_sql,
+    metricas_sql       = etapa_metricas_sql,
+    historia_sql       = etapa_historia_sql,
+)
+# Etapas que se corren aunque no se pidan, si se pide alguna que usa su salida
+NECESARIAS = dict(carga=tuple(ETAPAS), indice=tuple(ETAPAS), cubo=('rollup', 'escenarios'),
+                  base_sql=('metricas_sql', 'historia_sql'))
+# Por defecto, las del motor SQL solo si duckdb está instalado
+ETAPAS_SQL     = ('base_sql', 'metricas_sql', 'historia_sql')
+ETAPAS_DEFECTO = tuple(e for e in ETAPAS if e not in ETAPAS_SQL or motor_disponible())
+
+# ============================================================
+# MEDICIÓN
+# ============================================================
+PAGINA = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def rss_actual():
+    # Memoria residente del proceso (incluye buffers de Arrow, que tracemalloc no ve)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGINA
+    except OSError:
+        return None
+
+def pico_rss(fn, ctx, intervalo=0.002):
+    # Muestrea el RSS en otro hilo mientras corre fn; devuelve el aumento máximo
+    inicio = rss_actual()
+    if inicio is None:
+        fn(ctx)
+        return None
+    pico, fin = [inicio], threading.Event()
+    def muestrear():
+        while not fin.wait(intervalo):
+            pico[0] = max(pico[0], rss_actual())
+    hilo = threading.Thread(target=muestrear, daemon=True)
+    hilo.start()
+    try:
+        fn(ctx)
+    finally:
+        fin.set()
+        hilo.join()
+    return max(pico[0], rss_actual()) - inicio
+
+def medir(fn, ctx, repeticiones):
+    # Tiempos sin instrumentar y corridas aparte para la memoria (tracemalloc agrega overhead)
+    tiempos, salida = [], None
+    for _ in range(repeticiones):
+        gc.collect()
+        t = time.perf_counter()
+        salida = fn(ctx)
+        tiempos.append(time.perf_counter() - t)
+    gc.collect()
+    tracemalloc.start()
+    fn(ctx)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()
+    rss = pico_rss(fn, ctx)
+    return salida, dict(
+        seg_mediana=statistics.median(tiempos), seg_min=min(tiempos), repeticiones=repeticiones,
+        pico_mb=round(pico / 2**20, 2), pico_rss_mb=None if rss is None else round(rss / 2**20, 2))
+
+def modificar_un_mes(tablas):
+    # Cambia CONSULTORIOS_REALES en las ausencias del mes más frecuente
+    au  = tablas['ausencias'].copy()
+    mes = au['FECHA_INICIO'].str[3:].value_counts().index[0]
+    sel = au['FECHA_INICIO'].str[3:] == mes
+    au.loc[sel, 'CONSULTORIOS_REALES'] = au.loc[sel, 'CONSULTORIOS_REALES'] % 5 + 1
+    return como_csv(dict(ausencias=au))
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def correr(tamano, etapas=ETAPAS_DEFECTO, repeticiones=3):
+    tablas = generar(**tamano)
+    ctx = dict(csv=como_csv(tablas), csv_mod=modificar_un_mes(tablas))
+    res = {}
+    with tempfile.TemporaryDirectory() as d:
+        ctx['dir_snapshot'] = d
+        for nombre in ETAPAS:
+            # Las etapas no pedidas igual se corren (una vez) si otras dependen de su salida
+            if nombre not in etapas and not set(NECESARIAS.get(nombre, ())) & set(etapas):
+                continue
+            salida, res[nombre] = medir(ETAPAS[nombre], ctx, repeticiones if nombre in etapas else 1)
+            ctx.update(salida or {})
+            if nombre == 'carga':
+                ctx['periodos'] = sorted(ctx['datos'][2]['PERIODO'].dropna().unique())
+    return dict(
+        fecha=time.strftime("%Y-%m-%dT%H:%M:%S"), commit=commit_actual(),
+        entorno=dict(python=platform.python_version(), pandas=pd.__version__,
+                     numpy=np.__version__, plataforma=platform.platform()),
+        tamano=tamano, filas={c: len(df) for c, df in tablas.items()},
+        etapas={n: r for n, r in res.items() if n in etapas},
+    )
+
+def comparar(actual, base, tolerancia, minimo=0.005):
+    # Compara el mínimo de cada etapa (menos ruidoso que la mediana). Devuelve las que
+    # empeoraron más que la tolerancia; diferencias por debajo de `minimo` segundos se ignoran.
+    regresiones = []
+    print(f"{'etapa':<20}{'base (s)':>12}{'actual (s)':>12}{'cambio':>10}")
+    for nombre, r in actual['etapas'].items():
+        b = base.get('etapas', {}).get(nombre)
+        if b is None:
+            continue
+        cambio = r['seg_min'] / b['seg_min'] - 1 if b['seg_min'] > 0 else 0
+        peor   = cambio > tolerancia and r['seg_min'] - b['seg_min'] > minimo
+        print(f"{nombre:<20}{b['seg_min']:>12.4f}{r['seg_min']:>12.4f}{cambio:>+10.1%}"
+              + ("  ← regresión" if peor else ""))
+        if peor:
+            regresiones.append(nombre)
+    return regresiones
+
+# ============================================================
+# CLI
+# ============================================================
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks",
+                                 description="Benchmarks de carga, filtrado y cálculo con datos sintéticos.")
+    ap.add_argument("--tamano", choices=TAMANOS, default="chico", help="tamaños predefinidos")
+    for campo in ('servicios', 'profesionales', 'meses', 'ausencias', 'meses_turnos', 'semilla'):
+        ap.add_argument(f"--{campo.replace('_', '-')}", type=int, help="reemplaza el valor del tamaño elegido")
+    ap.add_argument("--etapas", default=",".join(ETAPAS_DEFECTO), help="etapas separadas por coma")
+    ap.add_argument("-n", "--repeticiones", type=int, default=3)
+    ap.add_argument("-o", "--salida", help="guardar los resultados en este JSON")
+    ap.add_argument("--comparar", metavar="JSON", help="resultados base; sale con 1 si hay regresiones")
+    ap.add_argument("--tolerancia", type=float, default=0.2, help="empeoramiento admitido (0.2 = 20%%)")
+    ap.add_argument("--minimo", type=float, default=0.005, help="diferencia en segundos por debajo de la cual no se marca")
+    args = ap.parse_args(argv)
+
+    tamano = dict(TAMANOS[args.tamano])
+    for campo in ('servicios', 'profesionales', 'meses', 'ausencias', 'meses_turnos', 'semilla'):
+        if getattr(args, campo) is not None:
+            tamano[campo] = getattr(args, campo)
+    etapas = [e for e in args.etapas.split(",") if e]
+    desconocidas = set(etapas) - set(ETAPAS)
+    if desconocidas:
+        ap.error(f"etapas desconocidas: {', '.join(sorted(desconocidas))}")
+
+    res = correr(tamano, etapas, args.repeticiones)
+    print(f"{'etapa':<20}{'mediana (s)':>12}{'mín (s)':>12}{'pico (MB)':>12}{'pico RSS':>12}")
+    for nombre, r in res['etapas'].items():
+        rss = "-" if r['pico_rss_mb'] is None else f"{r['pico_rss_mb']:.1f}"
+        print(f"{nombre:<20}{r['seg_mediana']:>12.4f}{r['seg_min']:>12.4f}{r['pico_mb']:>12.1f}{rss:>12}")
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(res, f, indent=2)
+
+    if args.comparar:
+        with open(args.comparar) as f:
+            base = json.load(f)
+        if base.get('tamano') != res['tamano']:
+            print("Aviso: los tamaños de la base y la corrida actual no coinciden.", file=sys.stderr)
+        if comparar(res, base, args.tolerancia, args.minimo):
+            return 1
+    return 0
@@ -0,0 +1,105 @@
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from finanzas.carga import FUENTES, parsear_csv, ingerir_fuente, compactar
+from finanzas.periodos import indexar_periodos, filtrar, periodos_con_dato_real
+from finanzas.metricas import ESCALARES, calcular_metricas, calcular_metricas_periodos
+from finanzas.sql import abrir_base, filtrar_sql, calcular_metricas_sql, calcular_metricas_periodos_sql
+from .sintetico import TAMANOS, generar, como_csv
+
+# ============================================================
+# PARIDAD pandas ↔ DuckDB
+# ============================================================
+# Con los mismos datos sintéticos que los benchmarks compara los dos motores en cada período
+# (con y sin rendimiento manual): KPIs, frames por servicio, filas de ingresos y pérdidas,
+# cortes de filtrar y la tabla histórica. Además de los datos tal como salen del generador prueba
+# variantes que este no produce: oferta con fracciones (queda float32 o float64 al compactar) y
+# filas de valores repetidas. tests/test_paridad.py corre los mismos casos con pytest; como
+# script sale con 1 si algo difiere en cualquiera de los casos.
+TOLERANCIA    = 1e-9   # relativa: las mismas sumas en otro orden difieren en los últimos dígitos
+RENDIMIENTOS  = (None, 20)
+
+CASOS = ("sintético", "oferta con medias (float32)", "oferta con decimales (float64)", "valores repetidos")
+
+def caso(nombre, tablas):
+    # Tablas de texto del caso a partir de las del generador
+    of, va = tablas['oferta'], tablas['valores']
+    return {
+        "sintético"                     : tablas,
+        "oferta con medias (float32)"   : tablas | dict(oferta=of.assign(TURNOS_MENSUAL=of['TURNOS_MENSUAL'] + 0.5)),
+        "oferta con decimales (float64)": tablas | dict(oferta=of.assign(TURNOS_MENSUAL=of['TURNOS_MENSUAL'] + 0.37)),
+        "valores repetidos"             : tablas | dict(valores=pd.concat([va, va.iloc[::7]], ignore_index=True)),
+    }[nombre]
+
+def ingerir(tablas):
+    csv = como_csv(tablas)
+    return compactar([ingerir_fuente(c, parsear_csv(csv[c]))[0] for c in FUENTES])
+
+def normalizar(df, ordenar=False):
+    # Texto en vez de categorías y, para las filas (sin orden propio), orden por todas las columnas
+    df = df.reset_index(drop=True)
+    df = df.assign(**{c: df[c].astype(str) for c in df.columns
+                      if isinstance(df[c].dtype, pd.CategoricalDtype) or not (pd.api.types.is_numeric_dtype(df[c])
+                                                                              or pd.api.types.is_datetime64_any_dtype(df[c]))})
+    return df.sort_values(list(df.columns)).reset_index(drop=True) if ordenar else df
+
+def iguales(a, b, ordenar=False):
+    if isinstance(a, pd.DataFrame) or isinstance(b, pd.DataFrame):
+        if a is None or b is None:
+            return (a is None or a.empty) and (b is None or b.empty)
+        try:
+            pd.testing.assert_frame_equal(normalizar(a, ordenar), normalizar(b[list(a.columns)], ordenar),
+                                          check_dtype=False, check_exact=False, rtol=TOLERANCIA)
+            return True
+        except (AssertionError, KeyError):
+            return False
+    if a is None or b is None or isinstance(a, (bool, np.bool_)):
+        return a == b
+    return bool(np.isclose(a, b, rtol=TOLERANCIA))
+
+def diferencias(datos, rendimientos=RENDIMIENTOS):
+    df_of, df_au, df_val, df_td = datos
+    indice, base = indexar_periodos(*datos), abrir_base(*datos)
+    reales   = periodos_con_dato_real(df_td)
+    periodos = sorted(set(df_val['PERIODO'].dropna().unique()) | {p.to_timestamp() for p in reales})
+    dif = []
+    for p in periodos:
+        real = p.to_period('M') in reales
+        do, da, dv, dt = cortes = filtrar(indice, p)
+        for i, (a, b) in enumerate(zip(cortes, filtrar_sql(base, p))):
+            if not iguales(a, b, ordenar=True):
+                dif.append(f"{p:%Y-%m} filtrar[{i}]")
+        for rend in rendimientos:
+            m1 = calcular_metricas(do, da, dv, dt if real else None, rend)
+            m2 = calcular_metricas_sql(base, p, real, rend)
+            dif += [f"{p:%Y-%m} rend={rend} {k}: {m1[k]} ≠ {m2[k]}" for k in ESCALARES if not iguales(m1[k], m2[k])]
+            dif += [f"{p:%Y-%m} rend={rend} {k}" for k in ('sens', 'df_ocup') if not iguales(m1[k], m2[k])]
+            dif += [f"{p:%Y-%m} rend={rend} {k}" for k in ('df_ing', 'df_perd')
+                    if not iguales(m1[k], m2[k], ordenar=True)]
+    for rend in rendimientos:
+        h1 = calcular_metricas_periodos(df_of, df_au, df_val, df_td, periodos, rend)
+        h2 = calcular_metricas_periodos_sql(base, periodos, rend)
+        if not iguales(h1.reset_index(), h2.reset_index()):
+            dif.append(f"historia rend={rend}")
+    return dif, len(periodos)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.paridad",
+                                 description="Compara el motor pandas con el de DuckDB sobre datos sintéticos.")
+    ap.add_argument("--tamano", choices=TAMANOS, default="chico")
+    ap.add_argument("--semilla", type=int, default=0)
+    args = ap.parse_args(argv)
+    total, tablas = 0, generar(**TAMANOS[args.tamano], semilla=args.semilla)
+    for nombre in CASOS:
+        dif, n = diferencias(ingerir(caso(nombre, tablas)))
+        for d in dif:
+            print(f"[{nombre}] {d}")
+        print(f"{nombre}: {n} períodos, {'sin diferencias' if not dif else f'{len(dif)} diferencias'}")
+        total += len(dif)
+    return 1 if total else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
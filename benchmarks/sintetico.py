@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+from finanzas.carga import FORMATO_FECHA, MONEDA
+
+# ============================================================
+# GENERADOR DE DATOS SINTÉTICOS
+# ============================================================
+# Tablas con el mismo formato que las hojas publicadas (texto, fechas dd/mm/aaaa,
+# importes es-AR). Con la misma semilla y tamaños el resultado es idéntico.
+TAMANOS = {
+    'chico':   dict(servicios=12, profesionales=60,   meses=14, ausencias=3_000),
+    'mediano': dict(servicios=40, profesionales=600,  meses=36, ausencias=100_000),
+    'grande':  dict(servicios=80, profesionales=3000, meses=60, ausencias=2_000_000),
+}
+
+def fmt_moneda(v):
+    miles, dec = f"{v:,.2f}".split(".")
+    return f"{MONEDA['simbolo']} {miles.replace(',', MONEDA['miles'])}{MONEDA['decimal']}{dec}"
+
+def generar(servicios=12, profesionales=60, meses=14, ausencias=3_000, meses_turnos=None, semilla=0):
+    # Devuelve {clave de FUENTES: DataFrame de texto}
+    rng = np.random.default_rng(semilla)
+    meses_turnos = meses // 2 + 1 if meses_turnos is None else min(meses_turnos, meses)
+    inicio = pd.Timestamp("2020-01-01")
+    fechas = pd.date_range(inicio, periods=meses, freq="MS")
+    txt_mes = np.asarray(fechas.strftime(FORMATO_FECHA))
+
+    serv  = np.asarray([f"SERVICIO {i:03d}" for i in range(servicios)])
+    dep   = np.asarray([f"DEPARTAMENTO {i % 8}" for i in range(servicios)])
+    prof  = np.asarray([f"Profesional {i:05d}" for i in range(profesionales)])
+    s_pro = rng.integers(0, servicios, profesionales)   # servicio de cada profesional
+
+    # Oferta: un registro por profesional y mes
+    m_of = np.repeat(np.arange(meses), profesionales)
+    p_of = np.tile(np.arange(profesionales), meses)
+    oferta = pd.DataFrame({
+        'PERIODO':        txt_mes[m_of],
+        'DEPARTAMENTO':   dep[s_pro[p_of]],
+        'SERVICIO':       serv[s_pro[p_of]],
+        'PROFESIONAL':    prof[p_of],
+        'TURNOS_MENSUAL': rng.integers(50, 400, len(m_of)),
+    })
+
+    # Valores: servicio × mes, con ~5% de combinaciones sin cargar
+    m_va = np.repeat(np.arange(meses), servicios)
+    s_va = np.tile(np.arange(servicios), meses)
+    hay  = rng.random(len(m_va)) >= 0.05
+    m_va, s_va = m_va[hay], s_va[hay]
+    valores = pd.DataFrame({
+        'PERIODO':     txt_mes[m_va],
+        'SERVICIO':    serv[s_va],
+        'VALOR_TURNO': [fmt_moneda(v) for v in rng.uniform(5_000, 30_000, len(m_va))],
+        'RENDIMIENTO': rng.integers(8, 20, len(m_va)),
+    })
+
+    # Ausencias: fecha de inicio uniforme en el rango, duración de 0 a 9 días
+    dias  = (fechas[-1] + pd.offsets.MonthEnd(0) - inicio).days + 1
+    txt_dia = np.asarray(pd.date_range(inicio, periods=dias + 10, freq="D").strftime(FORMATO_FECHA))
+    d_ini = rng.integers(0, dias, ausencias)
+    p_au  = rng.integers(0, profesionales, ausencias)
+    ausencias = pd.DataFrame({
+        'FECHA_INICIO':        txt_dia[d_ini],
+        'FECHA_FIN':           txt_dia[d_ini + rng.integers(0, 10, ausencias)],
+        'DEPARTAMENTO':        dep[s_pro[p_au]],
+        'SERVICIO':            serv[s_pro[p_au]],
+        'PROFESIONAL':         prof[p_au],
+        'CONSULTORIOS_REALES': rng.integers(1, 6, ausencias),
+    })
+
+    # Turnos dados: servicio × mes, solo los primeros meses
+    m_td = np.repeat(np.arange(meses_turnos), servicios)
+    s_td = np.tile(np.arange(servicios), meses_turnos)
+    turnos_dados = pd.DataFrame({
+        'PERIODO':     txt_mes[m_td],
+        'SERVICIO':    serv[s_td],
+        'TURNO_DADOS': rng.integers(100, 2_000, len(m_td)),
+    })
+    return dict(oferta=oferta, ausencias=ausencias, valores=valores, turnos_dados=turnos_dados)
+
+def como_csv(tablas):
+    # Bytes tal como los devuelve la descarga de cada hoja
+    return {clave: df.to_csv(index=False).encode() for clave, df in tablas.items()}
@@ -0,0 +1,30 @@
+# Núcleo de cálculo del simulador, sin Streamlit ni Plotly.
+# Los submódulos se importan recién al usar un nombre: `import finanzas` es inmediato.
+import importlib
+
+_EXPORTS = dict(
+    carga       = ['FUENTES', 'descargar_datos', 'cargar_archivos', 'tipar_fuente', 'compactar'],
+    snapshot    = ['SNAPSHOT_DIR', 'TTL_DATOS', 'version_datos', 'leer_snapshot', 'leer_ingesta',
+                   'guardar_snapshot', 'nuevo_estado_refresco', 'iniciar_refresco', 'detener_refresco',
+                   'estado_datos', 'obtener_datos'],
+    periodos    = ['indexar_periodos', 'filtrar', 'tiene_turnos_dados', 'periodos_con_dato_real'],
+    metricas    = ['Metricas', 'calcular_metricas', 'aplicar_rendimiento', 'curva_sensibilidad', 'calcular_metricas_periodos',
+                   'nuevo_cache_historia', 'metricas_historia', 'nuevo_cache_metricas', 'metricas_periodo',
+                   'estadisticas_cache_metricas'],
+    cubo        = ['DIMENSIONES', 'MEDIDAS', 'construir_cubo', 'cortar', 'rollup', 'comparar'],
+    estimacion  = ['ajustar_ocupacion', 'estimar_ocupacion', 'totales_estimados'],
+    escenarios  = ['ajustar_escenarios', 'simular_recupero', 'rango_recupero'],
+    exportacion = ['FORMATOS', 'detalle_perdidas', 'exportar'],
+    sql         = ['MOTOR', 'abrir_base', 'filtrar_sql', 'calcular_metricas_sql', 'calcular_metricas_periodos_sql'],
+    api         = ['nuevo_estado_api', 'responder', 'iniciar_api', 'detener_api', 'estadisticas_api'],
+)
+_ORIGEN = {nombre: modulo for modulo, nombres in _EXPORTS.items() for nombre in nombres}
+
+__all__ = list(_ORIGEN)
+
+def __getattr__(nombre):
+    if nombre in _ORIGEN:
+        valor = getattr(importlib.import_module(f".{_ORIGEN[nombre]}", __name__), nombre)
+        globals()[nombre] = valor
+        return valor
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
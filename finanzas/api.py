@@ -0,0 +1,368 @@
+import os
+import re
+import sys
+import json
+import math
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+import pandas as pd
+
+from .snapshot import SNAPSHOT_DIR, nuevo_estado_refresco, obtener_datos, estado_datos
+from .periodos import indexar_periodos, tiene_turnos_dados, periodos_con_dato_real
+from .cubo import construir_cubo, rollup
+from .estimacion import ajustar_ocupacion, estimar_ocupacion, totales_estimados
+from .metricas import nuevo_cache_metricas, nuevo_cache_historia, metricas_periodo, metricas_historia
+from .exportacion import FORMATOS, detalle_perdidas, exportar
+
+# ============================================================
+# API JSON DE MÉTRICAS
+# ============================================================
+# Servidor HTTP (biblioteca estándar) con los mismos KPIs que la app, para otros consumidores:
+#   GET /estado              versión y antigüedad de los datos (sin caché)
+#   GET /periodos            períodos con métricas y si tienen dato real
+#   GET /metricas/AAAA-MM    KPIs del período                         (?rendimiento=N)
+#   GET /perdidas/AAAA-MM    pérdida por servicio, de mayor a menor   (?rendimiento=N)
+#   GET /ocupacion/AAAA-MM   ocupación por servicio: real, o estimada con su banda
+#   GET /historia            KPIs de todos los períodos
+#   GET /exportar/FORMATO    detalle de pérdidas como archivo (xlsx, csv o parquet)
+#                            ?desde=AAAA-MM[&hasta=AAAA-MM][&rendimiento=N]
+# Los frames salen del estado de refresco (el de la app si corre adentro de ella, o el snapshot
+# mapeado si corre aparte): no se vuelve a descargar nada. Una respuesta depende solo de la
+# versión de datos y de la URL: el ETag sale de ambas, un If-None-Match vigente se contesta
+# con 304 sin armar el cuerpo y los cuerpos ya armados se guardan hasta que cambia la versión.
+# Las exportaciones no se guardan: se escriben en un temporal en disco y se envían de a bloques.
+PUERTO_API           = 8765
+TAM_CACHE_RESPUESTAS = 512
+PERIODO_URL          = re.compile(r"^\d{4}-\d{2}$")
+
+class ErrorApi(Exception):
+    def __init__(self, codigo, mensaje):
+        super().__init__(mensaje)
+        self.codigo = codigo
+
+def nuevo_estado_api(estado=None, c_metricas=None, c_historia=None, directorio=SNAPSHOT_DIR):
+    # Dentro de la app se le pasan su estado de refresco y sus cachés de métricas: la API
+    # sirve la misma versión y reutiliza lo que ya calcularon las sesiones (y viceversa)
+    return dict(lock=threading.Lock(), estado=estado if estado is not None else nuevo_estado_refresco(),
+                directorio=directorio,
+                c_metricas=c_metricas if c_metricas is not None else nuevo_cache_metricas(directorio),
+                c_historia=c_historia if c_historia is not None else nuevo_cache_historia(directorio),
+                recursos=None, ofrecido=None, respuestas=OrderedDict(),
+                aciertos=0, fallos=0, no_modificadas=0, servidor=None, hilo=None)
+
+def ofrecer_recursos(api, version, indice, cubo):
+    # La app entrega el índice y el cubo que ya armó para su versión: la API no los repite
+    with api['lock']:
+        api['ofrecido'] = (version, indice, cubo)
+
+def recursos(api):
+    # Datos vigentes y lo que se deriva de ellos, armado una vez por versión
+    # Como la app, con una fuente caída se sirve lo que haya (/estado muestra el error)
+    datos, version, _ = obtener_datos(api['estado'], api['directorio'])
+    with api['lock']:
+        r = api['recursos']
+        if r is None or r['version'] != version:
+            df_of, df_au, df_val, df_td = datos
+            td = df_td if tiene_turnos_dados(df_td) else None
+            ofrecido = api['ofrecido']
+            if ofrecido is not None and ofrecido[0] == version:
+                indice, cubo = ofrecido[1:]
+            else:
+                indice, cubo = indexar_periodos(*datos), construir_cubo(*datos)
+            reales = periodos_con_dato_real(td)
+            r = api['recursos'] = dict(
+                version=version, datos=(df_of, df_au, df_val, td), indice=indice, cubo=cubo, reales=reales,
+                # Los mismos períodos que la historia de la app
+                periodos=sorted(set(df_val['PERIODO'].dropna().unique()) | {p.to_timestamp() for p in reales}))
+            api['respuestas'].clear()
+        return r
+
+def modelo_ocupacion(api, r):
+    # Ajuste de ocupación de la versión, la primera vez que se pide una estimación
+    with api['lock']:
+        if 'modelo' not in r:
+            r['modelo'] = ajustar_ocupacion(r['cubo']) if r['datos'][3] is not None else None
+        return r['modelo']
+
+# ============================================================
+# RESPUESTAS
+# ============================================================
+def a_json(v):
+    # Tipos de pandas/numpy → JSON: NaN/NaT → null, fechas → 'AAAA-MM-DD'
+    if isinstance(v, pd.DataFrame):
+        return [dict(zip(map(str, v.columns), map(a_json, fila))) for fila in v.itertuples(index=False, name=None)]
+    if isinstance(v, pd.Series):
+        return {str(k): a_json(x) for k, x in v.items()}
+    if isinstance(v, dict):
+        return {str(k): a_json(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [a_json(x) for x in v]
+    if isinstance(v, (bool, np.bool_)):
+        return bool(v)
+    if isinstance(v, (int, np.integer)):
+        return int(v)
+    if isinstance(v, (float, np.floating)):
+        return None if math.isnan(v) or math.isinf(v) else float(v)
+    if v is None or v is pd.NaT or v is pd.NA:
+        return None
+    if isinstance(v, (pd.Timestamp, np.datetime64)):
+        return f"{pd.Timestamp(v):%Y-%m-%d}"
+    return str(v)
+
+def metricas_de(api, r, p, rend):
+    real = p.to_period('M') in r['reales']
+    return metricas_periodo(api['c_metricas'], r['version'], r['indice'], p, rend, real)
+
+def resp_periodos(api, r, p, rend):
+    return [dict(periodo=q, dato_real=q.to_period('M') in r['reales']) for q in r['periodos']]
+
+def resp_metricas(api, r, p, rend):
+    return dict(periodo=p, rendimiento=rend, **metricas_de(api, r, p, rend).escalares())
+
+def resp_perdidas(api, r, p, rend):
+    # Como el Pareto de la app
+    grp = rollup(r['cubo'], ['SERVICIO'], p, p, rend_override=rend)
+    grp = grp[grp['DINERO_PERDIDO'] > 0].sort_values('DINERO_PERDIDO', ascending=False)
+    return dict(periodo=p, rendimiento=rend,
+                servicios=grp[['SERVICIO','CONSULTORIOS','TURNOS_PERDIDOS','DINERO_PERDIDO']])
+
+def resp_ocupacion(api, r, p, rend):
+    m = metricas_de(api, r, p, None)
+    if m['tiene_dato_real']:
+        return dict(periodo=p, estimado=False, servicios=m['df_ocup'],
+                    totales={k: m[k] for k in ('tasa_ocup_prom', 'total_fact_real', 'total_perd_inasist')})
+    modelo = modelo_ocupacion(api, r)
+    if modelo is None:
+        raise ErrorApi(404, "no hay turnos dados para estimar la ocupación")
+    est = estimar_ocupacion(modelo, r['cubo'], [p])
+    tot = totales_estimados(est)
+    return dict(periodo=p, estimado=True, servicios=est.drop(columns='PERIODO'),
+                totales=tot.iloc[0] if len(tot) else {})
+
+def resp_historia(api, r, p, rend):
+    return metricas_historia(api['c_historia'], r['version'], *r['datos'], r['periodos']).reset_index()
+
+# nombre → (lleva período, acepta rendimiento, función)
+RUTAS = dict(
+    periodos  = (False, False, resp_periodos),
+    metricas  = (True,  True,  resp_metricas),
+    perdidas  = (True,  True,  resp_perdidas),
+    ocupacion = (True,  False, resp_ocupacion),
+    historia  = (False, False, resp_historia),
+)
+
+def leer_periodo(texto):
+    if not PERIODO_URL.match(texto):
+        raise ErrorApi(400, "el período va como AAAA-MM")
+    return pd.Timestamp(f"{texto}-01")
+
+def leer_rendimiento(consulta):
+    valor = consulta.get('rendimiento', [''])[-1]
+    if not valor:
+        return None
+    if not valor.isdigit():
+        raise ErrorApi(400, "rendimiento debe ser un entero positivo")
+    return int(valor) or None
+
+def leer_pedido(url):
+    # (ruta, período, rendimiento) validados; la clave de caché es su forma canónica
+    partes = urlsplit(url)
+    ruta   = [s for s in partes.path.split('/') if s]
+    if not ruta or ruta[0] not in RUTAS:
+        raise ErrorApi(404, "ruta desconocida")
+    con_periodo, con_rend, _ = RUTAS[ruta[0]]
+    if len(ruta) != 1 + con_periodo:
+        raise ErrorApi(404, "ruta desconocida")
+    p    = leer_periodo(ruta[1]) if con_periodo else None
+    rend = leer_rendimiento(parse_qs(partes.query)) if con_rend else None
+    return ruta[0], p, rend
+
+def etiqueta(version, clave):
+    return f'"{version}-{hashlib.sha1(repr(clave).encode()).hexdigest()[:12]}"'
+
+def coincide(si_no_coincide, etag):
+    if not si_no_coincide:
+        return False
+    etiquetas = [t.strip().removeprefix('W/') for t in si_no_coincide.split(',')]
+    return '*' in etiquetas or etag in etiquetas
+
+def cuerpo_json(v):
+    return json.dumps(a_json(v), ensure_ascii=False, separators=(',', ':'), allow_nan=False).encode('utf-8')
+
+def responder(api, url, si_no_coincide=None):
+    # (código, cuerpo, cabeceras) de un GET; independiente del servidor HTTP
+    try:
+        if urlsplit(url).path.strip('/') == 'estado':
+            obtener_datos(api['estado'], api['directorio'])
+            return 200, cuerpo_json(estado_datos(api['estado'])), {}
+        nombre, p, rend = leer_pedido(url)
+        r = recursos(api)
+        if p is not None and p not in r['periodos']:
+            raise ErrorApi(404, f"sin datos para {p:%Y-%m}")
+        clave = (nombre, p, rend)
+        etag  = etiqueta(r['version'], clave)
+        cab   = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if coincide(si_no_coincide, etag):
+            with api['lock']:
+                api['no_modificadas'] += 1
+            return 304, b"", cab
+        with api['lock']:
+            guardada = api['respuestas'].get(clave)
+            if guardada is not None and guardada[0] == etag:
+                api['aciertos'] += 1
+                api['respuestas'].move_to_end(clave)
+                return 200, guardada[1], cab
+            api['fallos'] += 1
+
+        cuerpo = cuerpo_json(RUTAS[nombre][2](api, r, p, rend))
+        with api['lock']:
+            # Si cambió la versión mientras se armaba, no se guarda
+            if api['recursos'] is r:
+                api['respuestas'][clave] = (etag, cuerpo)
+                while len(api['respuestas']) > TAM_CACHE_RESPUESTAS:
+                    api['respuestas'].popitem(last=False)
+        return 200, cuerpo, cab
+    except ErrorApi as e:
+        return e.codigo, cuerpo_json(dict(error=str(e))), {}
+    except Exception as e:
+        return 500, cuerpo_json(dict(error=f"{type(e).__name__}: {e}")), {}
+
+# ============================================================
+# EXPORTACIÓN
+# ============================================================
+def es_exportacion(url):
+    return urlsplit(url).path.strip('/').split('/')[0] == 'exportar'
+
+def exportar_pedido(api, url, destino):
+    # Escribe en `destino` el detalle de pérdidas de los períodos pedidos, como el botón de
+    # la app (una hoja por período en Excel, columna PERIODO si son varios). (nombre, mime)
+    partes = urlsplit(url)
+    ruta   = [s for s in partes.path.split('/') if s]
+    if len(ruta) != 2 or ruta[1] not in FORMATOS:
+        raise ErrorApi(404, f"formato desconocido (hay {', '.join(FORMATOS)})")
+    consulta = parse_qs(partes.query)
+    if not consulta.get('desde'):
+        raise ErrorApi(400, "falta ?desde=AAAA-MM")
+    desde = leer_periodo(consulta['desde'][-1])
+    hasta = leer_periodo(consulta.get('hasta', consulta['desde'])[-1])
+    rend  = leer_rendimiento(consulta)
+    r = recursos(api)
+    # Los períodos exportables de la app: los que tienen valores
+    periodos = [p for p in sorted(r['datos'][2]['PERIODO'].dropna().unique()) if desde <= p <= hasta]
+    if not periodos:
+        raise ErrorApi(404, f"sin datos entre {desde:%Y-%m} y {hasta:%Y-%m}")
+    def partes_detalle():
+        for p in periodos:
+            df = detalle_perdidas(metricas_de(api, r, p, rend))
+            yield f"{p:%Y-%m}", (df.assign(PERIODO=p) if len(periodos) > 1 else df)
+    exportar(ruta[1], partes_detalle(), destino)
+    nombre = "_".join(dict.fromkeys(f"{p:%Y-%m}" for p in (periodos[0], periodos[-1])))
+    return f"perdidas_{nombre}.{ruta[1]}", FORMATOS[ruta[1]][1]
+
+def estadisticas_api(api):
+    with api['lock']:
+        return dict(version=api['recursos']['version'] if api['recursos'] else None,
+                    respuestas=len(api['respuestas']), aciertos=api['aciertos'],
+                    fallos=api['fallos'], no_modificadas=api['no_modificadas'])
+
+# ============================================================
+# SERVIDOR
+# ============================================================
+class Manejador(BaseHTTPRequestHandler):
+    api = None   # lo fija nuevo_servidor en una subclase
+
+    def do_GET(self):
+        if es_exportacion(self.path):
+            return self.enviar_exportacion()
+        codigo, cuerpo, cabeceras = responder(self.api, self.path, self.headers.get('If-None-Match'))
+        self.send_response(codigo)
+        for k, v in cabeceras.items():
+            self.send_header(k, v)
+        if codigo != 304:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        if codigo != 304:
+            self.wfile.write(cuerpo)
+
+    def enviar_exportacion(self):
+        # El archivo terminado va del temporal al socket de a bloques: no se lee entero
+        with tempfile.TemporaryFile() as f:
+            try:
+                nombre, mime = exportar_pedido(self.api, self.path, f)
+            except ErrorApi as e:
+                return self.enviar_error(e.codigo, str(e))
+            except Exception as e:
+                return self.enviar_error(500, f"{type(e).__name__}: {e}")
+            self.send_response(200)
+            self.send_header('Content-Type', mime)
+            self.send_header('Content-Disposition', f'attachment; filename="{nombre}"')
+            self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile)
+
+    def enviar_error(self, codigo, mensaje):
+        cuerpo = cuerpo_json(dict(error=mensaje))
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        pass
+
+def nuevo_servidor(api, puerto=PUERTO_API, host="127.0.0.1"):
+    servidor = ThreadingHTTPServer((host, puerto), type('Manejador', (Manejador,), dict(api=api)))
+    servidor.daemon_threads = True
+    return servidor
+
+def iniciar_api(api, puerto=PUERTO_API, host="127.0.0.1"):
+    # Idempotente: a lo sumo un servidor por estado. OSError si el puerto está ocupado.
+    with api['lock']:
+        if api['hilo'] is not None and api['hilo'].is_alive():
+            return api['servidor']
+        api['servidor'] = nuevo_servidor(api, puerto, host)
+        api['hilo'] = threading.Thread(target=api['servidor'].serve_forever, name="finanzas-api", daemon=True)
+        api['hilo'].start()
+        return api['servidor']
+
+def detener_api(api):
+    with api['lock']:
+        servidor, api['servidor'], api['hilo'] = api['servidor'], None, None
+    if servidor is not None:
+        servidor.shutdown()
+        servidor.server_close()
+
+# ============================================================
+# CLI: python -m finanzas.api
+# ============================================================
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m finanzas.api",
+                                 description="Sirve las métricas en JSON leyendo el snapshot local.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--puerto", type=int, default=PUERTO_API)
+    ap.add_argument("--snapshot", metavar="DIR", default=SNAPSHOT_DIR,
+                    help="snapshot que comparte con la app (sin snapshot se descargan las hojas)")
+    args = ap.parse_args(argv)
+    api = nuevo_estado_api(directorio=args.snapshot)
+    servidor = nuevo_servidor(api, args.puerto, args.host)
+    print(f"API de métricas en http://{args.host}:{servidor.server_address[1]}/", file=sys.stderr)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,315 @@
+import io
+import os
+import time
+import hashlib
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from .periodos import clave_mes, meses_cubiertos
+from .tiempos import medido, propagar
+
+# ============================================================
+# FUENTES Y ESQUEMA
+# ============================================================
+BASE_URL = os.environ.get(
+    "FINANZAS_BASE_URL",
+    "https://docs.google.com/spreadsheets/d/e/2PACX-1vQHFwl-Dxn-Rw9KN_evkCMk2Er8lQqgZMzAtN4LuEkWcCeBVUNwgb8xeIFKvpyxMgeGTeJ3oEWKpMZj",
+)
+
+# Esquema de cada hoja publicada. Tipos de columna:
+#   'fecha'  → FORMATO_FECHA (con respaldo dayfirst para celdas con otro formato)
+#   'numero' → número simple;  'moneda' → importe con el formato de MONEDA
+#   'clave'  → texto normalizado en mayúsculas (se usa en los joins);  'texto' → texto libre
+FORMATO_FECHA = "%d/%m/%Y"
+MONEDA        = dict(simbolo="$", miles=".", decimal=",")   # es-AR: "$ 12.345,50"
+DEFECTOS      = dict(RENDIMIENTO=14)                        # numéricos vacíos o inválidos → 0 salvo estos
+MAX_INVALIDAS = 50                                          # filas de ejemplo guardadas por hoja y mes
+
+FUENTES = {
+    'oferta':       dict(gid="1524527213", nombre="Oferta", col_fecha='PERIODO',
+                         requeridas=dict(PERIODO='fecha', SERVICIO='clave', TURNOS_MENSUAL='numero'),
+                         opcionales=dict(DEPARTAMENTO='clave', PROFESIONAL='texto')),
+    'ausencias':    dict(gid="2132722842", nombre="Ausencias", col_fecha='FECHA_INICIO',
+                         requeridas=dict(FECHA_INICIO='fecha', SERVICIO='clave'),
+                         opcionales=dict(DEPARTAMENTO='clave', PROFESIONAL='texto', FECHA_FIN='fecha',
+                                         CONSULTORIOS_REALES='numero', DIAS_CAIDOS='numero'),
+                         alguna_de=['CONSULTORIOS_REALES','DIAS_CAIDOS']),
+    'valores':      dict(gid="554651129", nombre="Valores", col_fecha='PERIODO',
+                         requeridas=dict(PERIODO='fecha', SERVICIO='clave', VALOR_TURNO='moneda', RENDIMIENTO='numero'),
+                         opcionales=dict(DEPARTAMENTO='clave')),
+    'turnos_dados': dict(gid="1285454147", nombre="BD_TURNOS_DADOS", col_fecha='PERIODO',
+                         requeridas=dict(PERIODO='fecha', SERVICIO='clave', TURNO_DADOS='numero'),
+                         opcionales=dict(DEPARTAMENTO='clave')),
+}
+TIMEOUT_FUENTE   = 20    # segundos por intento
+REINTENTOS       = 2
+ESPERA_REINTENTO = 0.5   # segundos, se duplica en cada reintento
+
+# ============================================================
+# DESCARGA
+# ============================================================
+def url_fuente(clave):
+    return f"{os.environ.get('FINANZAS_BASE_URL', BASE_URL)}/pub?gid={FUENTES[clave]['gid']}&single=true&output=csv"
+
+@medido("descarga")
+def descargar(url, timeout=None, reintentos=None):
+    # Sin argumentos rigen TIMEOUT_FUENTE y REINTENTOS del momento de la llamada
+    timeout    = TIMEOUT_FUENTE if timeout is None else timeout
+    reintentos = REINTENTOS if reintentos is None else reintentos
+    for intento in range(reintentos + 1):
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as resp:
+                return resp.read()
+        except Exception:
+            if intento == reintentos:
+                raise
+            time.sleep(ESPERA_REINTENTO * 2 ** intento)
+
+@medido("parseo CSV")
+def parsear_csv(cuerpo):
+    # Todo como texto con el lector Arrow; los tipos los asigna el esquema
+    try:
+        df = pd.read_csv(io.BytesIO(cuerpo), dtype=str, keep_default_na=False, engine='pyarrow')
+    except ValueError:
+        df = pd.read_csv(io.BytesIO(cuerpo), dtype=str, keep_default_na=False)
+    df.columns = df.columns.str.strip()
+    return df
+
+def validar_columnas(clave, df):
+    # Un renombre en la hoja falla acá en lugar de convertirse en ceros silenciosos
+    f = FUENTES[clave]
+    faltan = [c for c in f['requeridas'] if c not in df.columns]
+    if f.get('alguna_de') and not any(c in df.columns for c in f['alguna_de']):
+        faltan.append(" o ".join(f['alguna_de']))
+    if faltan:
+        raise ValueError(f"faltan columnas {', '.join(faltan)} (¿se renombraron en la hoja?)")
+
+def leer_fuente(clave):
+    # Descarga, parsea y valida en el mismo hilo: cada hoja se procesa apenas llega
+    df = parsear_csv(descargar(url_fuente(clave)))
+    validar_columnas(clave, df)
+    return df
+
+def frame_vacio(clave):
+    f = FUENTES[clave]
+    return pd.DataFrame(columns=list(f['requeridas']) + f.get('alguna_de', [])[:1])
+
+def descargar_fuentes(claves=tuple(FUENTES)):
+    # Descargas en paralelo; una fuente caída se reemplaza por un frame vacío
+    frames, errores = {}, {}
+    with ThreadPoolExecutor(max_workers=len(claves)) as pool:
+        futuros = {pool.submit(propagar(leer_fuente), c): c for c in claves}
+        for fut in as_completed(futuros):
+            clave = futuros[fut]
+            try:
+                frames[clave] = fut.result()
+            except Exception as e:
+                errores[clave] = e
+                frames[clave] = frame_vacio(clave)
+    return frames, errores
+
+# ============================================================
+# TIPADO
+# ============================================================
+def por_valores_unicos(s, fn):
+    # Convierte cada valor distinto una sola vez (fechas e importes se repiten mucho)
+    unicos = pd.Index(s.unique())
+    return pd.Series(fn(pd.Series(unicos)).to_numpy()[unicos.get_indexer(s)], index=s.index)
+
+def parsear_fechas(s):
+    f = pd.to_datetime(s, format=FORMATO_FECHA, errors='coerce')
+    resto = f.isna() & s.notna()
+    if resto.any():
+        f[resto] = pd.to_datetime(s[resto], dayfirst=True, errors='coerce')
+    return f
+
+def parsear_moneda(s):
+    tabla = str.maketrans({MONEDA['simbolo']: None, MONEDA['miles']: None, MONEDA['decimal']: '.', ' ': None, '\xa0': None})
+    return pd.to_numeric(s.str.translate(tabla), errors='coerce')
+
+PARSERS = dict(
+    fecha  = lambda s: por_valores_unicos(s, parsear_fechas),
+    moneda = lambda s: por_valores_unicos(s, parsear_moneda),
+    numero = lambda s: pd.to_numeric(s, errors='coerce'),
+)
+
+@medido("tipado")
+def tipar_fuente(clave, df):
+    # Asigna los tipos del esquema en una pasada por columna y devuelve las celdas inválidas
+    # (con texto pero sin valor parseable) como (FILA, COLUMNA, VALOR).
+    f = FUENTES[clave]
+    esquema = {**f['requeridas'], **f.get('opcionales', {})}
+    invalidas = []
+    for col in df.columns:
+        tipo = esquema.get(col, 'texto')
+        if not (pd.api.types.is_string_dtype(df[col]) or isinstance(df[col].dtype, pd.CategoricalDtype)):
+            # Columna ya tipada (p. ej. desde Parquet): solo completar vacíos
+            if tipo in PARSERS and tipo != 'fecha':
+                df[col] = df[col].fillna(DEFECTOS.get(col, 0))
+            continue
+        s = df[col].astype(object).str.strip()
+        if tipo in PARSERS:
+            s = s.mask(s == '')
+            valor = PARSERS[tipo](s)
+            malas = s.notna() & valor.isna()
+            if malas.any():
+                invalidas.append(pd.DataFrame({'FILA': df.index[malas] + 2, 'COLUMNA': col, 'VALOR': s[malas]}))
+            if tipo != 'fecha':
+                valor = valor.fillna(DEFECTOS.get(col, 0))
+            df[col] = valor
+        else:
+            s = s.fillna('')
+            df[col] = s.str.upper() if tipo == 'clave' else s
+
+    if clave == 'ausencias':
+        col_target = 'CONSULTORIOS_REALES' if 'CONSULTORIOS_REALES' in df.columns else 'DIAS_CAIDOS'
+        df['_COL_TARGET'] = df[col_target]
+
+    invalidas = pd.concat(invalidas) if invalidas else pd.DataFrame(columns=['FILA','COLUMNA','VALOR'])
+    return df, invalidas
+
+# ============================================================
+# INGESTA INCREMENTAL
+# ============================================================
+def claves_mes_crudas(raw, col):
+    # Mes de cada fila cruda; se parsea solo cada fecha distinta una vez
+    if col not in raw.columns:
+        return np.full(len(raw), -1, dtype='int64')
+    return clave_mes(PARSERS['fecha'](raw[col].str.strip())).to_numpy()
+
+def registrar_invalidas(invalidas, claves):
+    # Resumen por mes: cantidad y algunas filas de ejemplo
+    if invalidas.empty:
+        return {}
+    invalidas = invalidas.assign(MES=claves[invalidas['FILA'].to_numpy() - 2])
+    return {str(mes): dict(n=len(g), filas=g.drop(columns='MES').head(MAX_INVALIDAS).astype(str).to_dict('records'))
+            for mes, g in invalidas.groupby('MES')}
+
+def hashes_por_mes(raw, claves):
+    # Hash ordenado de las filas de cada mes: detecta altas, bajas, ediciones y reordenamientos
+    filas = pd.util.hash_pandas_object(raw, index=False).to_numpy()
+    orden = np.argsort(claves, kind='stable')
+    meses, inicios = np.unique(claves[orden], return_index=True)
+    fines = np.append(inicios[1:], len(orden))
+    return {str(k): hashlib.sha1(filas[orden[i:f]].tobytes()).hexdigest()
+            for k, i, f in zip(meses, inicios, fines)}
+
+def firma_esquema(raw):
+    return "|".join(f"{c}:{t}" for c, t in zip(raw.columns, raw.dtypes.astype(str)))
+
+# Columnas de texto con diccionario compartido entre las cuatro hojas
+CATEGORICAS = ['SERVICIO','DEPARTAMENTO','PROFESIONAL']
+
+def reducir_numerico(s):
+    # int32 si es entero y entra; float32 si no pierde precisión; si no, float64
+    v = s.to_numpy(dtype='float64')
+    if not np.isnan(v).any() and (v == np.round(v)).all() and (np.abs(v) < 2**31).all():
+        return s.astype('int32')
+    if np.array_equal(v.astype('float32').astype('float64'), v, equal_nan=True):
+        return s.astype('float32')
+    return s.astype('float64')
+
+@medido("compactar")
+def compactar(datos):
+    # Representación compacta: categorías compartidas (joins y groupbys sobre códigos
+    # enteros con el mismo diccionario en todas las hojas) y numéricos angostos.
+    datos = list(datos)
+    for col in CATEGORICAS:
+        con_col = [df[col] for df in datos if col in df.columns]
+        if not con_col:
+            continue
+        categorias = sorted(set().union(*(
+            s.cat.categories if isinstance(s.dtype, pd.CategoricalDtype) else s.unique() for s in con_col)))
+        dtype = pd.CategoricalDtype(categorias)
+        for df in datos:
+            if col in df.columns:
+                df[col] = df[col].astype(dtype)
+    for df in datos:
+        for col in df.select_dtypes(include='number').columns:
+            df[col] = reducir_numerico(df[col])
+    return tuple(datos)
+
+def ingerir_fuente(clave, raw, previo=None, part_previa=None):
+    # Tipa solo los meses cuyo hash cambió y reutiliza el resto del snapshot previo.
+    # Devuelve (frame tipado, particiones, meses modificados).
+    col    = FUENTES[clave]['col_fecha']
+    claves = claves_mes_crudas(raw, col)
+    part   = dict(esquema=firma_esquema(raw), meses=hashes_por_mes(raw, claves))
+
+    if previo is None or not part_previa or part_previa.get('esquema') != part['esquema'] or col not in previo.columns:
+        sucios = {int(k) for k in set(part['meses']) | set((part_previa or {}).get('meses', {}))}
+        limpio, invalidas = tipar_fuente(clave, raw)
+        part['invalidas'] = registrar_invalidas(invalidas, claves)
+        return limpio, part, sucios
+
+    antes  = part_previa['meses']
+    sucios = {int(k) for k in set(part['meses']) | set(antes) if part['meses'].get(k) != antes.get(k)}
+    nuevo  = np.isin(claves, list(sucios))
+    claves_prev = clave_mes(previo[col]).to_numpy()
+    reuso  = previo[~np.isin(claves_prev, list(sucios))]
+    pos    = np.flatnonzero(~nuevo)
+    if len(reuso) != len(pos):
+        limpio, invalidas = tipar_fuente(clave, raw)
+        part['invalidas'] = registrar_invalidas(invalidas, claves)
+        return limpio, part, sucios | {int(k) for k in antes}
+
+    # Alinear mes a mes (orden estable) las filas reutilizadas con su posición en la hoja nueva
+    reuso = reuso.iloc[np.argsort(claves_prev[~np.isin(claves_prev, list(sucios))], kind='stable')]
+    pos   = pos[np.argsort(claves[pos], kind='stable')]
+    partes = [reuso.set_axis(pos)]
+    part['invalidas'] = {m: v for m, v in part_previa.get('invalidas', {}).items() if int(m) not in sucios}
+    if nuevo.any():
+        tipado, invalidas = tipar_fuente(clave, raw[nuevo].copy())
+        partes.append(tipado.set_axis(np.flatnonzero(nuevo)))
+        part['invalidas'].update(registrar_invalidas(invalidas, claves))
+    limpio = pd.concat(partes).sort_index().reset_index(drop=True)
+    if clave == 'ausencias' and sucios:
+        # Una ausencia que cruza meses también modifica los meses posteriores a su inicio
+        sucios |= meses_cubiertos(previo, sucios) | meses_cubiertos(limpio, sucios)
+    return limpio, part, sucios
+
+def descargar_datos(previo=None):
+    # Descarga + limpieza incremental, sin llamadas a Streamlit (se usa también en segundo plano).
+    # previo: (datos, meta) del último snapshot, como lo devuelve leer_snapshot().
+    frames, errores = descargar_fuentes()
+    datos_prev, meta_prev = previo if previo is not None else ((None,) * len(FUENTES), {})
+    part_prev = meta_prev.get('particiones', {})
+    datos, particiones, sucios = [], {}, set()
+    for clave, df_prev in zip(FUENTES, datos_prev):
+        limpio, particiones[clave], s = ingerir_fuente(
+            clave, frames[clave], None if clave in errores else df_prev, part_prev.get(clave))
+        datos.append(limpio)
+        sucios |= s
+    ingesta = dict(base=meta_prev.get('version'), particiones=particiones, meses_sucios=sorted(sucios))
+    return compactar(datos), errores, ingesta
+
+# ============================================================
+# ARCHIVOS LOCALES
+# ============================================================
+def leer_archivo(ruta):
+    # CSV con el formato de las hojas publicadas, o Parquet / Arrow IPC (crudo o ya tipado)
+    ext = os.path.splitext(ruta)[1].lower()
+    if ext == '.parquet':
+        df = pd.read_parquet(ruta)
+    elif ext in ('.arrow', '.feather', '.ipc'):
+        df = pd.read_feather(ruta)
+    else:
+        with open(ruta, 'rb') as f:
+            return parsear_csv(f.read())
+    df.columns = df.columns.str.strip()
+    return df
+
+def cargar_archivos(rutas):
+    # rutas: {clave de FUENTES: ruta}. Una fuente sin ruta (p. ej. turnos dados) queda vacía.
+    datos = []
+    for clave in FUENTES:
+        if rutas.get(clave):
+            df = leer_archivo(rutas[clave])
+            validar_columnas(clave, df)
+        else:
+            df = frame_vacio(clave)
+        datos.append(tipar_fuente(clave, df)[0])
+    return compactar(datos)
@@ -0,0 +1,64 @@
+import sys
+import argparse
+
+from .carga import FUENTES, cargar_archivos
+from .periodos import tiene_turnos_dados, periodos_con_dato_real
+from .metricas import calcular_metricas_periodos
+from .sql import MOTOR
+
+# ============================================================
+# CLI: métricas de todos los períodos → tabla resumen
+# ============================================================
+def leer_argumentos(argv=None):
+    ap = argparse.ArgumentParser(
+        prog="python -m finanzas",
+        description="Calcula las métricas de cada período y escribe una tabla resumen (CSV o Parquet).")
+    ap.add_argument("--oferta",       help="oferta de turnos (CSV de la hoja publicada o Parquet)")
+    ap.add_argument("--ausencias",    help="ausencias (CSV o Parquet)")
+    ap.add_argument("--valores",      help="valores por servicio (CSV o Parquet)")
+    ap.add_argument("--turnos-dados", help="turnos dados (opcional)")
+    ap.add_argument("--snapshot", metavar="DIR",
+                    help="leer el snapshot Arrow de DIR (sin archivos ni snapshot se descargan las hojas)")
+    ap.add_argument("--rendimiento", type=int, help="pacientes por consultorio para todas las ausencias")
+    ap.add_argument("--motor", choices=("pandas", "duckdb"), default=MOTOR,
+                    help="motor de cálculo (duckdb es opcional; por defecto FINANZAS_MOTOR o pandas)")
+    ap.add_argument("-o", "--salida", default="-", help="archivo .csv o .parquet (por defecto CSV a stdout)")
+    return ap.parse_args(argv)
+
+def cargar(args):
+    rutas = dict(oferta=args.oferta, ausencias=args.ausencias,
+                 valores=args.valores, turnos_dados=args.turnos_dados)
+    if any(rutas.values()):
+        faltan = [FUENTES[c]['nombre'] for c in ('oferta', 'ausencias', 'valores') if not rutas[c]]
+        if faltan:
+            raise SystemExit(f"Faltan archivos: {', '.join(faltan)}")
+        return cargar_archivos(rutas)
+
+    from .snapshot import SNAPSHOT_DIR, obtener_datos
+    datos, _, errores = obtener_datos(directorio=args.snapshot or SNAPSHOT_DIR)
+    for clave, e in errores.items():
+        print(f"No se pudo cargar {FUENTES[clave]['nombre'] if clave in FUENTES else clave}: {e}", file=sys.stderr)
+    return datos
+
+def resumen(df_of, df_au, df_val, df_td, rend_override=None, motor="pandas"):
+    # Mismos períodos que la historia de la app: los de valores y los que tienen dato real
+    td       = df_td if tiene_turnos_dados(df_td) else None
+    periodos = sorted(set(df_val['PERIODO'].dropna().unique()) |
+                      {p.to_timestamp() for p in periodos_con_dato_real(td)})
+    if motor == "duckdb":
+        from .sql import abrir_base, calcular_metricas_periodos_sql
+        res = calcular_metricas_periodos_sql(abrir_base(df_of, df_au, df_val, td), periodos, rend_override)
+    else:
+        res = calcular_metricas_periodos(df_of, df_au, df_val, td, periodos, rend_override)
+    return res.reset_index()
+
+def main(argv=None):
+    args = leer_argumentos(argv)
+    res  = resumen(*cargar(args), rend_override=args.rendimiento, motor=args.motor)
+    if args.salida == "-":
+        res.to_csv(sys.stdout, index=False)
+    elif args.salida.lower().endswith(".parquet"):
+        res.to_parquet(args.salida, index=False)
+    else:
+        res.to_csv(args.salida, index=False)
+    return 0
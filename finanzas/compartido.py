@@ -0,0 +1,119 @@
+import os
+import uuid
+import shutil
+import json
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:   # Windows: sin bloqueo entre procesos, el rename atómico igual evita lecturas a medias
+    fcntl = None
+
+# ============================================================
+# CACHÉ COMPARTIDA ENTRE PROCESOS
+# ============================================================
+# Resultados por versión de datos en <snapshot>/<versión>/cache/, en Arrow IPC de un solo
+# bloque: los demás procesos los mapean en memoria sin copiarlos. Un lock de archivo por
+# resultado hace que lo calcule un solo proceso; se publica con rename atómico.
+@contextmanager
+def bloqueo(ruta, esperar=True):
+    # flock exclusivo; con esperar=False devuelve False si otro proceso lo tiene
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if esperar else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def publicar(ruta, escribir, valor):
+    # Escribe en un temporal hermano y lo renombra: un lector ve todo o nada
+    tmp = os.path.join(os.path.dirname(ruta), f".tmp-{uuid.uuid4().hex}")
+    try:
+        escribir(tmp, valor)
+        os.replace(tmp, ruta)
+    except OSError:
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp, ignore_errors=True)
+        elif os.path.exists(tmp):
+            os.remove(tmp)
+        # Si ya existe (otro proceso ganó la carrera) no es un error
+        if not os.path.exists(ruta):
+            raise
+
+def escribir_tabla(ruta, df):
+    import pyarrow as pa
+    tabla = pa.Table.from_pandas(df, preserve_index=True).combine_chunks()
+    with pa.OSFile(ruta, "wb") as f, pa.ipc.new_file(f, tabla.schema) as w:
+        w.write_table(tabla, max_chunksize=max(tabla.num_rows, 1))
+
+def leer_tabla(ruta):
+    # Mapeado en memoria; columnas numéricas sin nulos quedan sin copia
+    import pyarrow as pa
+    return pa.ipc.open_file(pa.memory_map(ruta)).read_all().to_pandas(split_blocks=True)
+
+def escribir_metricas(carpeta, m):
+    # Resultado de calcular_metricas: un .arrow por frame y los escalares en JSON
+    os.makedirs(carpeta)
+    escalares = {}
+    for k, v in m.items():
+        if isinstance(v, pd.DataFrame):
+            escribir_tabla(os.path.join(carpeta, f"{k}.arrow"), v)
+        else:
+            escalares[k] = v.item() if isinstance(v, np.generic) else v
+    with open(os.path.join(carpeta, "escalares.json"), "w") as f:
+        json.dump(escalares, f)
+
+def leer_metricas(carpeta):
+    with open(os.path.join(carpeta, "escalares.json")) as f:
+        m = json.load(f)
+    for archivo in os.listdir(carpeta):
+        if archivo.endswith(".arrow"):
+            m[archivo[:-len(".arrow")]] = leer_tabla(os.path.join(carpeta, archivo))
+    return m
+
+VERSION_CACHE = 3   # subir cuando cambia la lógica de cálculo: invalida lo ya publicado
+
+def carpeta_cache(directorio, version):
+    # Solo versiones publicadas en el snapshot (se borran junto con él)
+    if not directorio or not os.path.isdir(os.path.join(directorio, version)):
+        return None
+    return os.path.join(directorio, version, f"cache-v{VERSION_CACHE}")
+
+def leer_compartido(directorio, version, nombre, leer):
+    carpeta = carpeta_cache(directorio, version)
+    if carpeta is None or not os.path.exists(os.path.join(carpeta, nombre)):
+        return None
+    try:
+        return leer(os.path.join(carpeta, nombre))
+    except (OSError, ValueError):
+        return None
+
+def obtener_compartido(directorio, version, nombre, calcular, escribir, leer):
+    # Lee el resultado si otro proceso ya lo publicó; si no, lo calcula uno solo a la vez
+    carpeta = carpeta_cache(directorio, version)
+    if carpeta is None:
+        return calcular()
+    valor = leer_compartido(directorio, version, nombre, leer)
+    if valor is not None:
+        return valor
+    with bloqueo(os.path.join(carpeta, f".{nombre}.lock")):
+        valor = leer_compartido(directorio, version, nombre, leer)
+        if valor is not None:
+            return valor
+        valor = calcular()
+        try:
+            publicar(os.path.join(carpeta, nombre), escribir, valor)
+        except OSError:
+            pass
+    return valor
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from .periodos import asignar_ausencias, tiene_turnos_dados
+from .tiempos import medido
+
+# ============================================================
+# CUBO PERÍODO × DEPARTAMENTO × SERVICIO × PROFESIONAL
+# ============================================================
+# Medidas ya sumadas por combinación de dimensiones, ordenadas por período: un rango de
+# períodos es un slice contiguo y cualquier rollup agrupa filas pre-agregadas, no filas crudas.
+# Los cortes van por el PERIODO exacto, como filtrar(): dos períodos de valores en el mismo
+# mes son dos celdas distintas (cada uno con la oferta y las ausencias del mes).
+# Los turnos dados solo existen por servicio: quedan en filas sin PROFESIONAL.
+DIMENSIONES = ['PERIODO','DEPARTAMENTO','SERVICIO','PROFESIONAL']
+MEDIDAS     = ['TURNOS_OFERTA','FACTURACION_BASE','CONSULTORIOS','PERD_POR_REND',
+               'TURNOS_PERDIDOS','DINERO_PERDIDO','TURNOS_DADOS']
+
+def con_dimensiones(df, dtypes):
+    # Completa las dimensiones que la hoja no trae (vacías, con el mismo dtype categórico)
+    for col in DIMENSIONES[1:]:
+        if col not in df.columns:
+            df[col] = pd.Series(pd.Categorical([None] * len(df), dtype=dtypes[col])
+                                if isinstance(dtypes[col], pd.CategoricalDtype) else None, index=df.index)
+    return df
+
+@medido("cubo")
+def construir_cubo(df_of, df_au, df_val, df_td=None):
+    per = pd.DataFrame({'PERIODO': pd.DatetimeIndex(df_val['PERIODO'].dropna().unique())})
+    per['MES'] = per['PERIODO'].dt.to_period('M')
+    val = df_val[['PERIODO','SERVICIO','VALOR_TURNO','RENDIMIENTO']]
+    frames = [df for df in (df_of, df_au, df_td) if df is not None]
+    dtypes = {c: next((df[c].dtype for df in frames if c in df.columns), object) for c in DIMENSIONES[1:]}
+
+    # Oferta y facturación base
+    of = (con_dimensiones(df_of[[c for c in DIMENSIONES[1:] if c in df_of.columns] + ['TURNOS_MENSUAL']], dtypes)
+          .assign(MES=df_of['PERIODO'].dt.to_period('M'))
+          .merge(per, on='MES')
+          .merge(val[['PERIODO','SERVICIO','VALOR_TURNO']], on=['PERIODO','SERVICIO'], how='left'))
+    of['TURNOS_OFERTA']    = of['TURNOS_MENSUAL']
+    of['FACTURACION_BASE'] = of['TURNOS_MENSUAL'] * of['VALOR_TURNO'].fillna(0)
+
+    # Pérdida por ausentismo (ausencias repartidas por días hábiles)
+    asig = asignar_ausencias(df_au)
+    au = (con_dimensiones(asig[[c for c in DIMENSIONES[1:] if c in asig.columns] + ['_COL_TARGET']], dtypes)
+          .assign(MES=asig['PERIODO'].dt.to_period('M'))
+          .merge(per, on='MES')
+          .merge(val, on=['PERIODO','SERVICIO'], how='left'))
+    valor = au['VALOR_TURNO'].fillna(0)
+    au['CONSULTORIOS']    = au['_COL_TARGET']
+    au['PERD_POR_REND']   = au['_COL_TARGET'] * valor
+    au['TURNOS_PERDIDOS'] = au['_COL_TARGET'] * au['RENDIMIENTO'].fillna(14)
+    au['DINERO_PERDIDO']  = au['TURNOS_PERDIDOS'] * valor
+
+    partes = [of, au]
+    if tiene_turnos_dados(df_td):
+        td = con_dimensiones(df_td[['PERIODO'] + [c for c in DIMENSIONES[1:] if c in df_td.columns] + ['TURNO_DADOS']]
+                             .rename(columns={'TURNO_DADOS': 'TURNOS_DADOS'}), dtypes)
+        partes.append(td[td['PERIODO'].isin(per['PERIODO'])])
+
+    cubo = (pd.concat([p.reindex(columns=DIMENSIONES + MEDIDAS) for p in partes], ignore_index=True)
+              .groupby(DIMENSIONES, observed=True, dropna=False, sort=False)[MEDIDAS].sum(min_count=1)
+              .reset_index())
+    cubo[MEDIDAS] = cubo[MEDIDAS].fillna(0)
+    cubo = cubo.sort_values('PERIODO', kind='stable').reset_index(drop=True)
+
+    claves, inicios = np.unique(cubo['PERIODO'].to_numpy(), return_index=True)
+    return dict(datos=cubo, claves=claves, inicios=inicios, fines=np.append(inicios[1:], len(cubo)))
+
+def clave_periodo(cubo, p):
+    return np.datetime64(pd.Timestamp(p)).astype(cubo['claves'].dtype)
+
+def cortar(cubo, desde=None, hasta=None, **filtros):
+    # Rango de períodos [desde, hasta] (slice sin copia) y filtros por dimensión: valor o lista
+    claves = cubo['claves']
+    i = np.searchsorted(claves, clave_periodo(cubo, desde), 'left')  if desde is not None else 0
+    f = np.searchsorted(claves, clave_periodo(cubo, hasta), 'right') if hasta is not None else len(claves)
+    if i >= f:
+        return cubo['datos'].iloc[0:0]
+    df = cubo['datos'].iloc[cubo['inicios'][i]:cubo['fines'][f - 1]]
+    for col, valor in filtros.items():
+        df = df[df[col].isin(valor if isinstance(valor, (list, tuple, set)) else [valor])]
+    return df
+
+def con_rendimiento(df, rend):
+    # La pérdida es lineal en el rendimiento (ver aplicar_rendimiento)
+    return df.assign(TURNOS_PERDIDOS=df['CONSULTORIOS'] * rend, DINERO_PERDIDO=df['PERD_POR_REND'] * rend)
+
+def rollup(cubo, por=('SERVICIO',), desde=None, hasta=None, rend_override=None, **filtros):
+    # Medidas sumadas por las dimensiones de `por` (vacío: totales) sobre el corte pedido
+    df = cortar(cubo, desde, hasta, **filtros)
+    if por:
+        res = df.groupby(list(por), observed=True)[MEDIDAS].sum().reset_index()
+    else:
+        res = df[MEDIDAS].sum().to_frame().T
+    return con_rendimiento(res, rend_override) if rend_override else res
+
+def comparar(cubo, por, rango_a, rango_b, medida='DINERO_PERDIDO', rend_override=None):
+    # Una medida en dos rangos de períodos, lado a lado, con la diferencia
+    a = rollup(cubo, por, *rango_a, rend_override=rend_override)[list(por) + [medida]]
+    b = rollup(cubo, por, *rango_b, rend_override=rend_override)[list(por) + [medida]]
+    res = a.merge(b, on=list(por), how='outer', suffixes=('_A', '_B')).fillna({f'{medida}_A': 0, f'{medida}_B': 0})
+    res['DIFERENCIA'] = res[f'{medida}_A'] - res[f'{medida}_B']
+    return res
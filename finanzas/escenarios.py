@@ -0,0 +1,131 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .cubo import rollup
+from .tiempos import medido
+
+# ============================================================
+# ESCENARIOS DE RECUPERO (MONTE CARLO)
+# ============================================================
+# Pérdida anual de un servicio = consultorios ausentes en 12 meses × rendimiento × valor del turno,
+# cada uno sorteado con la variabilidad histórica del servicio:
+#   consultorios: gamma con la media y la varianza mensual (12 meses = una gamma de forma 12k)
+#   rendimiento : normal con la media y el desvío de la hoja de valores (mínimo 1)
+#   valor       : último valor × lognormal con la volatilidad mensual del precio, promediada en el año
+# El recupero efectivo de una meta se sortea con una beta centrada en ella (DISPERSION_META).
+CUANTILES       = (0.05, 0.5, 0.95)
+METAS           = tuple(range(0, 101, 5))   # % de la pérdida que se intenta recuperar
+N_SORTEOS       = 5_000
+DISPERSION_META = 20          # concentración de la beta: más alto = la meta se cumple con menos desvío
+UMBRAL_POOL     = 50_000_000  # sorteos × servicios × metas a partir del cual se reparte en procesos
+TOTAL           = 'TOTAL'
+MESES           = 12
+# Varianza del promedio de 12 meses de una caminata aleatoria, en unidades de la mensual
+FACTOR_PRECIO   = (MESES + 1) * (2 * MESES + 1) / (6 * MESES)
+
+@medido("ajuste de escenarios")
+def ajustar_escenarios(cubo, df_val):
+    # Una fila por servicio con los parámetros de los sorteos; None sin historia
+    mensual = rollup(cubo, ['PERIODO','SERVICIO'])
+    mensual = mensual[mensual['TURNOS_OFERTA'] > 0]
+    if mensual.empty:
+        return None
+    cons = mensual.groupby(mensual['SERVICIO'].astype(str))['CONSULTORIOS'].agg(['mean', 'var'])
+
+    val = (df_val[['PERIODO','SERVICIO','VALOR_TURNO','RENDIMIENTO']]
+           .dropna(subset=['PERIODO'])
+           .assign(SERVICIO=lambda d: d['SERVICIO'].astype(str))
+           .sort_values('PERIODO', kind='stable'))
+    val['LOG_VALOR'] = np.log(val['VALOR_TURNO'].where(val['VALOR_TURNO'] > 0))
+    g = val.groupby('SERVICIO')
+    par = pd.DataFrame({
+        'CONS_MEDIA' : cons['mean'],
+        'CONS_VAR'   : cons['var'].fillna(0),
+        'REND_MEDIA' : g['RENDIMIENTO'].mean(),
+        'REND_SD'    : g['RENDIMIENTO'].std(),
+        'VALOR'      : g['VALOR_TURNO'].last(),
+        'VOL_PRECIO' : val['LOG_VALOR'].groupby(val['SERVICIO']).diff().groupby(val['SERVICIO']).std(),
+    }).reindex(cons.index)
+    par['REND_MEDIA'] = par['REND_MEDIA'].fillna(14)
+    par[['REND_SD','VOL_PRECIO']] = par[['REND_SD','VOL_PRECIO']].fillna(0)
+    par['VALOR'] = par['VALOR'].fillna(0)
+    par = par[(par['CONS_MEDIA'] > 0) & (par['VALOR'] > 0)]
+    return par if not par.empty else None
+
+def fraccion_meta(rng, meta, forma):
+    # Fracción efectivamente recuperada para una meta en [0, 1]
+    if DISPERSION_META is None or meta <= 0 or meta >= 1:
+        return np.full(forma, meta)
+    return rng.beta(meta * DISPERSION_META, (1 - meta) * DISPERSION_META, forma)
+
+def simular_bloque(par, metas, n, semilla):
+    # Sorteos de un grupo de servicios: cuantiles y media por (meta, servicio) y el total por sorteo
+    rng  = np.random.default_rng(semilla)
+    k    = len(par['CONS_MEDIA'])
+    med, var = par['CONS_MEDIA'], par['CONS_VAR']
+    # Gamma con la media y la varianza mensuales; sin varianza, consultorios fijos
+    con_var = var > 0
+    forma   = np.where(con_var, med ** 2 / np.where(con_var, var, 1), 1.0)
+    escala  = np.where(con_var, var / np.where(med > 0, med, 1), 0.0)
+    cons = np.where(con_var, rng.gamma(MESES * forma, np.where(con_var, escala, 1), (n, k)), MESES * med)
+    rend = np.maximum(rng.normal(par['REND_MEDIA'], par['REND_SD'], (n, k)), 1)
+    sd_p = par['VOL_PRECIO'] * np.sqrt(FACTOR_PRECIO)
+    valor = par['VALOR'] * np.exp(rng.normal(-sd_p ** 2 / 2, sd_p, (n, k)))
+    perdida = cons * rend * valor
+
+    cuant = np.empty((len(metas), len(CUANTILES), k))
+    media = np.empty((len(metas), k))
+    total = np.empty((len(metas), n))
+    for i, meta in enumerate(metas):
+        rec = perdida * fraccion_meta(rng, meta / 100, (n, k))
+        cuant[i] = np.quantile(rec, CUANTILES, axis=0)
+        media[i] = rec.mean(axis=0)
+        total[i] = rec.sum(axis=1)
+    return cuant, media, total
+
+@medido("escenarios de recupero")
+def simular_recupero(par, metas=METAS, n=N_SORTEOS, semilla=0, procesos=None):
+    # Recupero anual por (servicio, meta) y para el total: MEDIA y un P<q> por cuantil.
+    # procesos=None reparte en un pool solo si la grilla supera UMBRAL_POOL.
+    metas = list(metas)
+    if procesos is None:
+        procesos = min(os.cpu_count() or 1, 8) if n * len(par) * len(metas) > UMBRAL_POOL else 1
+    procesos = max(1, min(procesos, len(par)))
+    # Una semilla independiente por bloque: reproducible para la misma cantidad de procesos
+    bloques  = np.array_split(np.arange(len(par)), procesos)
+    semillas = np.random.SeedSequence(semilla).spawn(len(bloques))
+    args = [({c: par[c].to_numpy()[b] for c in par.columns}, metas, n, s) for b, s in zip(bloques, semillas)]
+    if procesos > 1:
+        # spawn: los procesos no heredan los hilos del servidor
+        with ProcessPoolExecutor(procesos, mp_context=multiprocessing.get_context('spawn')) as pool:
+            partes = list(pool.map(simular_bloque, *zip(*args)))
+    else:
+        partes = [simular_bloque(*a) for a in args]
+
+    cuant = np.concatenate([p[0] for p in partes], axis=2)
+    media = np.concatenate([p[1] for p in partes], axis=1)
+    total = sum(p[2] for p in partes)
+    cuant = np.concatenate([cuant, np.quantile(total, CUANTILES, axis=1).T[:, :, None]], axis=2)
+    media = np.concatenate([media, total.mean(axis=1)[:, None]], axis=1)
+
+    servicios = list(par.index) + [TOTAL]
+    res = pd.DataFrame({
+        'SERVICIO': np.tile(servicios, len(metas)),
+        'META'    : np.repeat(metas, len(servicios)),
+        'MEDIA'   : media.ravel(),
+    })
+    for j, q in enumerate(CUANTILES):
+        res[f'P{round(q * 100)}'] = cuant[:, j, :].ravel()
+    return res
+
+def rango_recupero(res, servicio, meta):
+    # Fila de `res` para un servicio (o TOTAL) y una meta cualquiera, interpolando en la grilla
+    r = res[res['SERVICIO'] == servicio]
+    if r.empty:
+        return None
+    cols = [c for c in r.columns if c not in ('SERVICIO', 'META')]
+    return pd.Series({c: float(np.interp(meta, r['META'], r[c])) for c in cols})
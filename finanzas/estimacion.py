@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+
+from .cubo import rollup
+from .tiempos import medido
+
+# ============================================================
+# ESTIMACIÓN DE OCUPACIÓN SIN TURNOS DADOS
+# ============================================================
+# Tasa de ocupación de cada servicio = nivel + tendencia lineal + efecto del mes del año.
+# El efecto estacional es común a todos los servicios (hay pocos años de historia) y se
+# achica hacia 0 en los meses con pocas observaciones. Se ajusta una vez por versión de
+# datos sobre toda la historia del cubo, con sumas agrupadas por servicio: sin loops.
+# La tendencia es conservadora: se achica hacia 0 según su error estándar y no se extiende
+# más de HORIZONTE_TENDENCIA meses fuera de la historia del servicio. Tasas y bandas van de 0 a 100.
+Z_CONFIANZA         = 1.96   # banda del 95%
+PESO_ESTACIONAL     = 5      # observaciones "virtuales" en 0 para cada mes del año
+MIN_OBS_TENDENCIA   = 12     # con menos meses con dato el servicio no tiene tendencia: nivel + estación
+HORIZONTE_TENDENCIA = 6      # meses fuera de la historia en los que la tendencia sigue sumando
+TASA_MAXIMA         = 100.0
+
+def observaciones(cubo):
+    # Una fila por (período, servicio) con turnos dados, como la ocupación de calcular_metricas
+    obs = rollup(cubo, ['PERIODO','SERVICIO'])
+    obs = obs[(obs['TURNOS_DADOS'] > 0) & (obs['TURNOS_OFERTA'] > 0) & (obs['FACTURACION_BASE'] > 0)]
+    return pd.DataFrame({
+        'SERVICIO': obs['SERVICIO'].astype(str).to_numpy(),
+        'T'       : (obs['PERIODO'].dt.year * 12 + obs['PERIODO'].dt.month - 1).to_numpy(),
+        'MES'     : obs['PERIODO'].dt.month.to_numpy() - 1,
+        'TASA'    : (obs['TURNOS_DADOS'] / obs['TURNOS_OFERTA'] * 100).to_numpy(),
+    })
+
+@medido("ajuste de ocupación")
+def ajustar_ocupacion(cubo):
+    # None si no hay ningún mes con turnos dados
+    obs = observaciones(cubo)
+    if obs.empty:
+        return None
+    t0 = int(obs['T'].min())   # tiempo relativo: sumas de cuadrados sin pérdida de precisión
+    obs['T'] -= t0
+
+    # Estacionalidad común: desvío medio respecto del nivel de cada servicio, por mes del año
+    desvio = obs['TASA'] - obs.groupby('SERVICIO')['TASA'].transform('mean')
+    por_mes = desvio.groupby(obs['MES']).agg(['sum', 'count'])
+    estacion = np.zeros(12)
+    estacion[por_mes.index] = por_mes['sum'] / (por_mes['count'] + PESO_ESTACIONAL)
+
+    # Tendencia por servicio: mínimos cuadrados sobre la tasa desestacionalizada
+    y = obs['TASA'] - estacion[obs['MES']]
+    s = (obs.assign(Y=y, TT=obs['T'] ** 2, TY=obs['T'] * y, YY=y ** 2)
+            .groupby('SERVICIO')
+            .agg(N=('T','size'), ST=('T','sum'), SY=('Y','sum'), STT=('TT','sum'), STY=('TY','sum'), SYY=('YY','sum')))
+    t_med, y_med = s['ST'] / s['N'], s['SY'] / s['N']
+    sxx = s['STT'] - s['N'] * t_med ** 2
+    sxy = s['STY'] - s['N'] * t_med * y_med
+    syy = s['SYY'] - s['N'] * y_med ** 2
+    con_tend = (s['N'] >= MIN_OBS_TENDENCIA) & (sxx > 1e-9)
+    pend = (sxy / sxx.where(con_tend)).fillna(0.0)
+    sse  = (syy - pend * sxy).clip(lower=0)
+    gl   = s['N'] - np.where(con_tend, 2, 1)
+    # Pendiente achicada por pend² / (pend² + error²): una tendencia que no se distingue
+    # del ruido queda cerca de 0
+    err2 = (sse / gl.where(gl > 0) / sxx.where(con_tend)).fillna(0.0)
+    pend = (pend * pend ** 2 / (pend ** 2 + err2)).fillna(0.0)
+
+    # Servicios con un solo mes: dispersión del conjunto
+    sigma_global = float(np.sqrt(sse.sum() / gl.sum())) if gl.sum() > 0 else float(desvio.std(ddof=0))
+    rango_t = obs.groupby('SERVICIO')['T'].agg(['min', 'max'])
+    servicios = pd.DataFrame({
+        'N'        : s['N'],
+        'T_MEDIO'  : t_med,
+        'T_MIN'    : rango_t['min'],
+        'T_MAX'    : rango_t['max'],
+        'NIVEL'    : y_med,
+        'PENDIENTE': pend,
+        'SXX'      : sxx.where(con_tend),
+        'SIGMA'    : np.sqrt(sse / gl.where(gl > 0)).fillna(sigma_global),
+    })
+    # Un servicio sin historia toma el nivel medio: suma la dispersión entre servicios
+    return dict(servicios=servicios, estacion=estacion, t0=t0,
+                nivel_nuevo=float(y_med.mean()),
+                sigma_nuevo=float(np.hypot(sigma_global, y_med.std(ddof=0))))
+
+def predecir_tasa(modelo, servicios, t, mes):
+    # Tasa estimada (%) y su desvío de predicción para cada (servicio, mes absoluto, mes del año)
+    m  = modelo['servicios'].reindex(pd.Index(servicios))
+    # La tendencia deja de sumar HORIZONTE_TENDENCIA meses después (o antes) de la historia
+    t  = np.clip(t - modelo['t0'], m['T_MIN'].to_numpy() - HORIZONTE_TENDENCIA,
+                 m['T_MAX'].to_numpy() + HORIZONTE_TENDENCIA)
+    dt = np.nan_to_num(t - m['T_MEDIO'].to_numpy(), nan=0.0)
+    tasa = (m['NIVEL'].fillna(modelo['nivel_nuevo']).to_numpy()
+            + m['PENDIENTE'].fillna(0).to_numpy() * dt + modelo['estacion'][mes])
+    # Ruido del mes + incertidumbre del nivel y de la pendiente (crece al alejarse de la historia)
+    sigma = m['SIGMA'].fillna(modelo['sigma_nuevo']).to_numpy()
+    var   = sigma ** 2 * (1 + 1 / m['N'].fillna(1).to_numpy()
+                          + np.nan_to_num(dt ** 2 / m['SXX'].to_numpy(), nan=0.0))
+    return np.clip(tasa, 0, TASA_MAXIMA), np.sqrt(var)
+
+def estimar_ocupacion(modelo, cubo, periodos, z=Z_CONFIANZA):
+    # Una fila por (período, servicio) con la ocupación estimada y su banda, con las mismas
+    # columnas que df_ocup de calcular_metricas (más _MIN/_MAX y SD)
+    periodos = pd.DatetimeIndex(periodos)
+    base = rollup(cubo, ['PERIODO','SERVICIO'], periodos.min(), periodos.max())
+    base = base[base['PERIODO'].isin(periodos) & (base['TURNOS_OFERTA'] > 0) & (base['FACTURACION_BASE'] > 0)]
+    est = pd.DataFrame({
+        'PERIODO'      : base['PERIODO'].to_numpy(),
+        'SERVICIO'     : base['SERVICIO'].astype(str).to_numpy(),
+        'TURNOS_OFERTA': base['TURNOS_OFERTA'].to_numpy(),
+        'VALOR_TURNO'  : (base['FACTURACION_BASE'] / base['TURNOS_OFERTA']).to_numpy(),
+    })
+    per = est['PERIODO'].dt
+    tasa, sd = predecir_tasa(modelo, est['SERVICIO'], (per.year * 12 + per.month - 1).to_numpy(),
+                             per.month.to_numpy() - 1)
+    base_fact = est['TURNOS_OFERTA'] * est['VALOR_TURNO']
+    for suf, t in (('', tasa), ('_MIN', np.clip(tasa - z * sd, 0, TASA_MAXIMA)),
+                   ('_MAX', np.clip(tasa + z * sd, 0, TASA_MAXIMA))):
+        est['TASA_OCUP' + suf] = t
+        est['TURNO_DADOS' + suf] = est['TURNOS_OFERTA'] * t / 100
+        est['FACT_REAL' + suf]   = base_fact * t / 100
+    # La brecha baja cuando la ocupación sube: sus extremos salen de los de la tasa
+    for suf, t in (('', tasa), ('_MIN', est['TASA_OCUP_MAX']), ('_MAX', est['TASA_OCUP_MIN'])):
+        est['PERD_INASISTENCIA' + suf] = base_fact * (1 - t / 100).clip(0)
+    est['SD'] = sd
+    return est
+
+def totales_estimados(est, z=Z_CONFIANZA):
+    # Totales por período como los de calcular_metricas, con banda suponiendo errores
+    # independientes entre servicios
+    g = est.assign(TASA_TOPE=est['TASA_OCUP'].clip(upper=100), VAR_TASA=est['SD'] ** 2,
+                   VAR_FACT=(est['TURNOS_OFERTA'] * est['VALOR_TURNO'] * est['SD'] / 100) ** 2).groupby('PERIODO')
+    res = g.agg(tasa_ocup_prom=('TASA_TOPE','mean'), total_fact_real=('FACT_REAL','sum'),
+                total_perd_inasist=('PERD_INASISTENCIA','sum'), var_tasa=('VAR_TASA','sum'),
+                var_fact=('VAR_FACT','sum'), n=('SERVICIO','size'))
+    e_tasa = z * np.sqrt(res.pop('var_tasa')) / res.pop('n')
+    e_fact = z * np.sqrt(res.pop('var_fact'))
+    res['tasa_ocup_min']      = (res['tasa_ocup_prom'] - e_tasa).clip(lower=0)
+    res['tasa_ocup_max']      = (res['tasa_ocup_prom'] + e_tasa).clip(upper=TASA_MAXIMA)
+    res['fact_real_min']      = (res['total_fact_real'] - e_fact).clip(lower=0)
+    res['fact_real_max']      = res['total_fact_real'] + e_fact
+    res['perd_inasist_min']   = (res['total_perd_inasist'] - e_fact).clip(lower=0)
+    res['perd_inasist_max']   = res['total_perd_inasist'] + e_fact
+    return res
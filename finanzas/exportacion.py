@@ -0,0 +1,84 @@
+import io
+
+from .tiempos import medido
+
+# ============================================================
+# EXPORTACIÓN EN STREAMING
+# ============================================================
+# Cada formato recibe las partes como un iterable de (nombre, DataFrame) y las escribe de a
+# bloques en un archivo binario: una parte por período, sin juntar todo en memoria.
+# CSV y Parquet van en una sola tabla; XLSX, una hoja por parte (el nombre es el de la hoja).
+COLUMNAS_DETALLE = ['FECHA_INICIO','FECHA_FIN','SERVICIO','PROFESIONAL','FRACCION','_COL_TARGET',
+                    'RENDIMIENTO_USADO','TURNOS_PERDIDOS','DINERO_PERDIDO']
+FILAS_BLOQUE     = 50_000
+MAX_FILAS_HOJA   = 1_048_575   # límite de Excel sin contar el encabezado
+
+def detalle_perdidas(m, ordenar=True):
+    # Filas de pérdida del período, ordenadas como en pantalla (la tabla paginada ordena por su cuenta)
+    df = m['df_perd']
+    df = df[[c for c in COLUMNAS_DETALLE if c in df.columns]]
+    return df.sort_values('DINERO_PERDIDO', ascending=False) if ordenar else df
+
+def bloques(df, filas=FILAS_BLOQUE):
+    for i in range(0, len(df), filas):
+        yield df.iloc[i:i + filas]
+
+@medido("exportar CSV")
+def escribir_csv(partes, destino):
+    texto = io.TextIOWrapper(destino, encoding='utf-8', newline='', write_through=True)
+    encabezado = True
+    for _, df in partes:
+        for b in bloques(df):
+            b.to_csv(texto, index=False, header=encabezado)
+            encabezado = False
+    texto.detach()   # el archivo sigue abierto para quien lo lea
+
+@medido("exportar Parquet")
+def escribir_parquet(partes, destino):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    escritor = None
+    try:
+        for _, df in partes:
+            # Un row group por parte: se lee por período sin cargar el archivo entero
+            tabla = pa.Table.from_pandas(df, preserve_index=False)
+            if escritor is None:
+                escritor = pq.ParquetWriter(destino, tabla.schema)
+            escritor.write_table(tabla.cast(escritor.schema))
+    finally:
+        if escritor is not None:
+            escritor.close()
+
+def filas_excel(df):
+    # Tuplas con tipos nativos: NaN/NaT → celda vacía, categorías → texto
+    for b in bloques(df):
+        b = b.astype(object).where(b.notna(), None)
+        yield from b.itertuples(index=False, name=None)
+
+@medido("exportar XLSX")
+def escribir_xlsx(partes, destino):
+    # openpyxl en modo write-only: las filas van directo al archivo, sin armar las celdas en memoria
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    for nombre, df in partes:
+        for i in range(0, max(len(df), 1), MAX_FILAS_HOJA):
+            hoja = str(nombre)[:31] if i == 0 else f"{str(nombre)[:26]} ({i // MAX_FILAS_HOJA + 1})"
+            ws = wb.create_sheet(hoja)
+            ws.append(list(df.columns))
+            for fila in filas_excel(df.iloc[i:i + MAX_FILAS_HOJA]):
+                ws.append(fila)
+    if not wb.worksheets:
+        wb.create_sheet("Datos")
+    wb.save(destino)
+
+FORMATOS = dict(
+    xlsx    = ("Excel",   "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", escribir_xlsx),
+    csv     = ("CSV",     "text/csv",                                                            escribir_csv),
+    parquet = ("Parquet", "application/vnd.apache.parquet",                                      escribir_parquet),
+)
+
+def exportar(formato, partes, destino):
+    # Escribe y deja `destino` al principio, listo para leer
+    FORMATOS[formato][2](partes, destino)
+    destino.seek(0)
+    return destino
@@ -0,0 +1,344 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .periodos import filtrar, asignar_ausencias
+from .snapshot import SNAPSHOT_DIR, leer_ingesta
+from .compartido import (obtener_compartido, leer_compartido, bloqueo, carpeta_cache, publicar,
+                         escribir_tabla, leer_tabla, escribir_metricas, leer_metricas)
+from .tiempos import medido
+
+# ============================================================
+# RESULTADO POR PERÍODO
+# ============================================================
+# Los KPIs y los agregados por servicio (sens, df_ocup) se calculan al crear el resultado;
+# las filas cruzadas con valores (df_ing, df_perd) se arman recién cuando alguien las pide,
+# a partir de `fuente`: una función que devuelve los cortes (oferta, ausencias, valores) del período.
+ESCALARES = ('total_base', 'total_perd', 'total_pot', 'total_fact_real', 'total_perd_inasist',
+             'tasa_ocup_prom', 'tiene_dato_real', 'turnos_of', 'turnos_perd', 'pct_fuga')
+
+class Metricas:
+    __slots__ = ESCALARES + ('sens', 'df_ocup', 'rend_override', 'fuente', '_df_ing', '_df_perd')
+
+    def __init__(self, sens, df_ocup, fuente=None, rend_override=None, **escalares):
+        for k in ESCALARES:
+            setattr(self, k, escalares.get(k))
+        self.sens, self.df_ocup = sens, df_ocup
+        self.fuente, self.rend_override = fuente, rend_override
+        self._df_ing = self._df_perd = None
+
+    # Acceso como el dict que devolvía calcular_metricas
+    def __getitem__(self, k):
+        try:
+            return getattr(self, k)
+        except AttributeError:
+            raise KeyError(k) from None
+
+    def get(self, k, default=None):
+        return getattr(self, k, default)
+
+    def escalares(self):
+        return {k: getattr(self, k) for k in ESCALARES}
+
+    def con(self, **cambios):
+        # Copia con algunos valores cambiados; las filas se vuelven a armar si se piden
+        m = Metricas(self.sens, self.df_ocup, self.fuente, self.rend_override, **self.escalares())
+        for k, v in cambios.items():
+            setattr(m, k, v)
+        return m
+
+    @property
+    def df_ing(self):
+        if self._df_ing is None:
+            df_of, _, df_val = self.fuente()
+            self._df_ing = filas_ingresos(df_of, df_val)
+        return self._df_ing
+
+    @property
+    def df_perd(self):
+        if self._df_perd is None:
+            _, df_au, df_val = self.fuente()
+            self._df_perd = filas_perdidas(df_au, df_val, self.rend_override)
+        return self._df_perd
+
+def filas_ingresos(df_of, df_val):
+    # Facturación base por fila de oferta (oferta × valor)
+    df_ing = df_of.merge(df_val[['SERVICIO','VALOR_TURNO']], on='SERVICIO', how='left')
+    df_ing['VALOR_TURNO']      = df_ing['VALOR_TURNO'].fillna(0)
+    df_ing['FACTURACION_BASE'] = df_ing['TURNOS_MENSUAL'] * df_ing['VALOR_TURNO']
+    return df_ing
+
+def filas_perdidas(df_au, df_val, rend_override=None):
+    # Pérdida por ausentismo profesional por fila de ausencia
+    df_perd = df_au.merge(df_val[['SERVICIO','VALOR_TURNO','RENDIMIENTO']], on='SERVICIO', how='left')
+    df_perd['VALOR_TURNO']       = df_perd['VALOR_TURNO'].fillna(0)
+    df_perd['RENDIMIENTO_USADO'] = rend_override if rend_override else df_perd['RENDIMIENTO'].fillna(14)
+    df_perd['TURNOS_PERDIDOS']   = df_perd['_COL_TARGET'] * df_perd['RENDIMIENTO_USADO']
+    df_perd['DINERO_PERDIDO']    = df_perd['TURNOS_PERDIDOS'] * df_perd['VALOR_TURNO']
+    return df_perd
+
+# ============================================================
+# CÁLCULO CENTRAL
+# ============================================================
+@medido("calcular_metricas")
+def calcular_metricas(df_of, df_au, df_val, df_td_p=None, rend_override=None):
+    # Se suma por servicio antes de cruzar con valores: mismo resultado que cruzar fila por
+    # fila (valor y rendimiento dependen solo del servicio), sin copiar las filas
+    val = df_val[['SERVICIO','VALOR_TURNO','RENDIMIENTO']]
+    of_serv = (df_of.groupby('SERVICIO', observed=True, dropna=False)['TURNOS_MENSUAL'].sum()
+                    .reset_index().merge(val[['SERVICIO','VALOR_TURNO']], on='SERVICIO', how='left'))
+    sens = (df_au.groupby('SERVICIO', observed=True, dropna=False)['_COL_TARGET'].sum()
+                 .rename('CONSULTORIOS').reset_index().merge(val, on='SERVICIO', how='left'))
+    return metricas_por_servicio(of_serv, sens, df_td_p, rend_override, fuente=lambda: (df_of, df_au, df_val))
+
+def metricas_por_servicio(of_serv, sens, df_td_p, rend_override, fuente):
+    # Resto del cálculo, sobre una fila por servicio (lo comparte el motor SQL):
+    #   of_serv: SERVICIO, TURNOS_MENSUAL, VALOR_TURNO · sens: SERVICIO, CONSULTORIOS, VALOR_TURNO, RENDIMIENTO
+    of_serv['VALOR_TURNO'] = of_serv['VALOR_TURNO'].fillna(0)
+
+    # Pérdida por unidad de rendimiento: TURNOS_PERDIDOS y DINERO_PERDIDO son lineales en él
+    sens['PERD_POR_REND'] = sens['CONSULTORIOS'] * sens['VALOR_TURNO'].fillna(0)
+    rend = rend_override if rend_override else sens['RENDIMIENTO'].fillna(14)
+    sens = sens[['SERVICIO','CONSULTORIOS','PERD_POR_REND']]
+
+    total_base  = (of_serv['TURNOS_MENSUAL'] * of_serv['VALOR_TURNO']).sum()
+    total_perd  = (sens['PERD_POR_REND'] * rend).sum()
+    turnos_of   = of_serv['TURNOS_MENSUAL'].sum()
+    turnos_perd = (sens['CONSULTORIOS'] * rend).sum()
+    pct_fuga    = (total_perd / (total_base + total_perd) * 100) if (total_base + total_perd) > 0 else 0
+
+    # Ocupación real (solo si hay dato de turnos dados)
+    ocup = pd.DataFrame()
+    tiene_dato_real = False
+    if df_td_p is not None and not df_td_p.empty:
+        ocup = (of_serv.dropna(subset=['SERVICIO'])
+                       .groupby('SERVICIO', observed=True)
+                       .agg(TURNOS_OFERTA=('TURNOS_MENSUAL','sum'), VALOR_TURNO=('VALOR_TURNO','mean'))
+                       .reset_index()
+                       .merge(df_td_p[['SERVICIO','TURNO_DADOS']], on='SERVICIO', how='inner'))
+        ocup = ocup[(ocup['VALOR_TURNO'] > 0) & (ocup['TURNOS_OFERTA'] > 0)]
+        ocup['TASA_OCUP']         = (ocup['TURNO_DADOS'] / ocup['TURNOS_OFERTA'] * 100).round(1)
+        ocup['FACT_REAL']         = ocup['TURNO_DADOS'] * ocup['VALOR_TURNO']
+        ocup['PERD_INASISTENCIA'] = (ocup['TURNOS_OFERTA'] - ocup['TURNO_DADOS']).clip(lower=0) * ocup['VALOR_TURNO']
+        tiene_dato_real = not ocup.empty
+
+    return Metricas(
+        sens, ocup, fuente=fuente, rend_override=rend_override,
+        total_base=total_base, total_perd=total_perd,
+        total_pot=total_base + total_perd,
+        total_fact_real=ocup['FACT_REAL'].sum() if tiene_dato_real else None,
+        total_perd_inasist=ocup['PERD_INASISTENCIA'].sum() if tiene_dato_real else None,
+        tasa_ocup_prom=ocup['TASA_OCUP'].clip(upper=100).mean() if tiene_dato_real else None,
+        tiene_dato_real=tiene_dato_real,
+        turnos_of=turnos_of, turnos_perd=turnos_perd, pct_fuga=pct_fuga,
+    )
+
+@medido("aplicar_rendimiento")
+def aplicar_rendimiento(m, rend):
+    # Resultado de calcular_metricas(..., rend_override=rend) a partir del de base:
+    # la pérdida es lineal en el rendimiento, así que alcanza con multiplicar (sin merges).
+    sens        = m['sens']
+    total_perd  = rend * sens['PERD_POR_REND'].sum()
+    turnos_perd = rend * sens['CONSULTORIOS'].sum()
+    total_pot   = m['total_base'] + total_perd
+    return m.con(total_perd=total_perd, turnos_perd=turnos_perd, total_pot=total_pot, rend_override=rend,
+                 pct_fuga=(total_perd / total_pot * 100) if total_pot > 0 else 0)
+
+def curva_sensibilidad(sens, rendimientos=range(1, 31)):
+    # Pérdida de cada servicio para cada rendimiento: un producto externo
+    r = np.asarray(list(rendimientos))
+    return pd.DataFrame({
+        'SERVICIO'       : np.repeat(sens['SERVICIO'].astype(str).to_numpy(), len(r)),
+        'RENDIMIENTO'    : np.tile(r, len(sens)),
+        'DINERO_PERDIDO' : np.multiply.outer(sens['PERD_POR_REND'].to_numpy(), r).ravel(),
+        'TURNOS_PERDIDOS': np.multiply.outer(sens['CONSULTORIOS'].to_numpy(), r).ravel(),
+    })
+
+@medido("calcular_metricas_periodos")
+def calcular_metricas_periodos(df_of, df_au, df_val, df_td, periodos, rend_override=None):
+    # Misma lógica que calcular_metricas, pero para todos los períodos a la vez:
+    # merges por (PERIODO, SERVICIO) y un único groupby. Devuelve una fila por período.
+    per = pd.DataFrame({'PERIODO': pd.DatetimeIndex(periodos).unique()})
+    per['MES'] = per['PERIODO'].dt.to_period('M')
+    val = df_val[['PERIODO','SERVICIO','VALOR_TURNO','RENDIMIENTO']]
+
+    # Facturación base — cada fila de oferta se asigna a los períodos de su mes
+    df_ing = (df_of[['SERVICIO','TURNOS_MENSUAL']]
+              .assign(MES=df_of['PERIODO'].dt.to_period('M'))
+              .merge(per, on='MES')
+              .merge(val[['PERIODO','SERVICIO','VALOR_TURNO']], on=['PERIODO','SERVICIO'], how='left'))
+    df_ing['VALOR_TURNO']      = df_ing['VALOR_TURNO'].fillna(0)
+    df_ing['FACTURACION_BASE'] = df_ing['TURNOS_MENSUAL'] * df_ing['VALOR_TURNO']
+
+    # Pérdida por ausentismo profesional — ausencias repartidas entre los meses que cubren
+    asig    = asignar_ausencias(df_au)
+    df_perd = (asig[['SERVICIO','_COL_TARGET']]
+               .assign(MES=asig['PERIODO'].dt.to_period('M'))
+               .merge(per, on='MES')
+               .merge(val, on=['PERIODO','SERVICIO'], how='left'))
+    df_perd['VALOR_TURNO']     = df_perd['VALOR_TURNO'].fillna(0)
+    rend_usado                 = rend_override if rend_override else df_perd['RENDIMIENTO'].fillna(14)
+    df_perd['TURNOS_PERDIDOS'] = df_perd['_COL_TARGET'] * rend_usado
+    df_perd['DINERO_PERDIDO']  = df_perd['TURNOS_PERDIDOS'] * df_perd['VALOR_TURNO']
+
+    # Un único groupby por (PERIODO, SERVICIO) de cada lado
+    serv_ing = df_ing.groupby(['PERIODO','SERVICIO'], observed=True).agg(
+        TURNOS_OFERTA=('TURNOS_MENSUAL','sum'),
+        VALOR_TURNO=('VALOR_TURNO','mean'),
+        FACTURACION_BASE=('FACTURACION_BASE','sum'),
+    ).reset_index()
+    serv_perd = df_perd.groupby(['PERIODO','SERVICIO'], observed=True)[['TURNOS_PERDIDOS','DINERO_PERDIDO']].sum().reset_index()
+
+    return resumir_periodos(per['PERIODO'], serv_ing, serv_perd, df_td)
+
+def resumir_periodos(periodos, serv_ing, serv_perd, df_td):
+    # Totales por período a partir de las sumas por (PERIODO, SERVICIO) (lo comparte el motor SQL):
+    #   serv_ing: TURNOS_OFERTA, VALOR_TURNO, FACTURACION_BASE · serv_perd: TURNOS_PERDIDOS, DINERO_PERDIDO
+    res = pd.DataFrame(index=pd.Index(periodos, name='PERIODO'))
+    res['total_base']  = serv_ing.groupby('PERIODO')['FACTURACION_BASE'].sum()
+    res['turnos_of']   = serv_ing.groupby('PERIODO')['TURNOS_OFERTA'].sum()
+    res['total_perd']  = serv_perd.groupby('PERIODO')['DINERO_PERDIDO'].sum()
+    res['turnos_perd'] = serv_perd.groupby('PERIODO')['TURNOS_PERDIDOS'].sum()
+    res = res.fillna(0)
+    res['total_pot'] = res['total_base'] + res['total_perd']
+    res['pct_fuga']  = (res['total_perd'] / res['total_pot'] * 100).where(res['total_pot'] > 0, 0)
+
+    # Ocupación real — solo períodos con turnos dados
+    res['total_fact_real']    = np.nan
+    res['total_perd_inasist'] = np.nan
+    res['tasa_ocup_prom']     = np.nan
+    if df_td is not None and not df_td.empty:
+        ocup = serv_ing.merge(df_td[['PERIODO','SERVICIO','TURNO_DADOS']], on=['PERIODO','SERVICIO'], how='inner')
+        ocup = ocup[(ocup['VALOR_TURNO'] > 0) & (ocup['TURNOS_OFERTA'] > 0)]
+        ocup['TASA_OCUP']         = (ocup['TURNO_DADOS'] / ocup['TURNOS_OFERTA'] * 100).round(1).clip(upper=100)
+        ocup['FACT_REAL']         = ocup['TURNO_DADOS'] * ocup['VALOR_TURNO']
+        ocup['PERD_INASISTENCIA'] = (ocup['TURNOS_OFERTA'] - ocup['TURNO_DADOS']).clip(lower=0) * ocup['VALOR_TURNO']
+        g = ocup.groupby('PERIODO')
+        res['total_fact_real']    = g['FACT_REAL'].sum()
+        res['total_perd_inasist'] = g['PERD_INASISTENCIA'].sum()
+        res['tasa_ocup_prom']     = g['TASA_OCUP'].mean()
+    res['tiene_dato_real'] = res['tasa_ocup_prom'].notna()
+    return res
+
+# ============================================================
+# CACHÉS DE MÉTRICAS
+# ============================================================
+# El estado de cada caché lo crea una fábrica; la app lo guarda en st.cache_resource
+TAM_CACHE_METRICAS = 256   # resultados de calcular_metricas memoizados por proceso
+
+# Con directorio (el del snapshot) los resultados se comparten entre procesos (ver compartido.py)
+def nuevo_cache_historia(directorio=None):
+    # Última tabla de métricas por período
+    return dict(lock=threading.Lock(), version=None, res=None, directorio=directorio)
+
+def metricas_historia(c, version, df_of, df_au, df_val, df_td, periodos, sql=None):
+    # Reutiliza las métricas de la versión anterior y recalcula solo los meses modificados.
+    # Con sql (la base de sql.abrir_base) los meses que faltan se calculan en DuckDB.
+    def calcular(faltan):
+        if sql is not None:
+            from .sql import calcular_metricas_periodos_sql
+            return calcular_metricas_periodos_sql(sql, faltan)
+        return calcular_metricas_periodos(df_of, df_au, df_val, df_td, faltan)
+
+    with c['lock']:
+        base = c['res']
+        if base is not None and c['version'] != version:
+            ingesta = leer_ingesta(version, c['directorio'] or SNAPSHOT_DIR)
+            if ingesta and ingesta.get('base') == c['version']:
+                meses = base.index.year * 12 + base.index.month - 1
+                base  = base[~meses.isin(ingesta['meses_sucios'])]
+            else:
+                base = None
+        faltan = [p for p in periodos if base is None or p not in base.index]
+        if faltan:
+            base = historia_compartida(c['directorio'], version, base, faltan, calcular)
+        c['version'], c['res'] = version, base
+    return base.loc[list(periodos)]
+
+def historia_compartida(directorio, version, base, faltan, calcular):
+    # Completa base con los períodos que faltan: los toma de la tabla que publicó otro
+    # proceso para esta versión o los calcula (uno solo a la vez) y la republica
+    def completar(base):
+        compartida = leer_compartido(directorio, version, "historia.arrow", leer_tabla)
+        if compartida is not None:
+            base = compartida if base is None else pd.concat([base[~base.index.isin(compartida.index)], compartida])
+        pendientes = [p for p in faltan if base is None or p not in base.index]
+        return base, pendientes
+
+    carpeta = carpeta_cache(directorio, version)
+    base, pendientes = completar(base)
+    if not pendientes:
+        return base
+    if carpeta is None:
+        nuevo = calcular(pendientes)
+        return nuevo if base is None else pd.concat([base, nuevo])
+    with bloqueo(os.path.join(carpeta, ".historia.arrow.lock")):
+        base, pendientes = completar(base)
+        if pendientes:
+            nuevo = calcular(pendientes)
+            base  = nuevo if base is None else pd.concat([base, nuevo])
+            try:
+                publicar(os.path.join(carpeta, "historia.arrow"), escribir_tabla, base.sort_index())
+            except OSError:
+                pass
+    return base
+
+def nuevo_cache_metricas(directorio=None):
+    # LRU de resultados de calcular_metricas
+    return dict(lock=threading.Lock(), version=None, entradas=OrderedDict(),
+                aciertos=0, fallos=0, desalojos=0, directorio=directorio)
+
+def metricas_periodo(c, version, indice, p, rend_override=None, real=False):
+    # Memoiza calcular_metricas por (versión de datos, período, rendimiento, dato real).
+    # Un cambio de versión vacía la caché; los resultados se comparten, no se modifican.
+    # indice: el de indexar_periodos o la base de sql.abrir_base (motor SQL).
+    clave = (pd.Timestamp(p), rend_override or None, bool(real))
+    with c['lock']:
+        if c['version'] != version:
+            c['entradas'].clear()
+            c['version'] = version
+        if clave in c['entradas']:
+            c['aciertos'] += 1
+            c['entradas'].move_to_end(clave)
+            return c['entradas'][clave]
+        c['fallos'] += 1
+
+    if rend_override:
+        m = aplicar_rendimiento(metricas_periodo(c, version, indice, p, real=real), rend_override)
+    else:
+        if 'con' in indice:
+            from .sql import filtrar_sql as cortes, calcular_metricas_sql
+            calcular = lambda: calcular_metricas_sql(indice, p, real)
+        else:
+            cortes = filtrar
+            def calcular():
+                do, da, dv, dt = filtrar(indice, p)
+                return calcular_metricas(do, da, dv, dt if real else None)
+        nombre = f"metricas-{clave[0]:%Y%m%d}-{'real' if real else 'oferta'}"
+        m = obtener_compartido(c['directorio'], version, nombre, calcular, escribir_resultado, leer_resultado)
+        # Las filas se arman desde el índice (también si el resultado vino de otro proceso)
+        m.fuente = lambda: cortes(indice, p)[:3]
+
+    with c['lock']:
+        if c['version'] == version:
+            c['entradas'][clave] = m
+            while len(c['entradas']) > TAM_CACHE_METRICAS:
+                c['entradas'].popitem(last=False)
+                c['desalojos'] += 1
+    return m
+
+def escribir_resultado(carpeta, m):
+    # En disco van los escalares y los agregados por servicio, no las filas
+    escribir_metricas(carpeta, dict(m.escalares(), sens=m.sens, df_ocup=m.df_ocup))
+
+def leer_resultado(carpeta):
+    d = leer_metricas(carpeta)
+    return Metricas(d.pop('sens'), d.pop('df_ocup'), **d)
+
+def estadisticas_cache_metricas(c):
+    with c['lock']:
+        return dict(entradas=len(c['entradas']), aciertos=c['aciertos'],
+                    fallos=c['fallos'], desalojos=c['desalojos'])
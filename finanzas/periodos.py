@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from .tiempos import medido
+
+# ============================================================
+# ÍNDICE POR PERÍODO
+# ============================================================
+def clave_mes(fechas):
+    # Clave entera año*12+mes; NaT → -1
+    return (fechas.dt.year * 12 + fechas.dt.month - 1).fillna(-1).astype('int64')
+
+def indexar_por_mes(df, col):
+    # Ordena por mes y guarda (inicio, fin) de cada mes: un corte es un slice sin copia
+    clave = clave_mes(df[col]).to_numpy()
+    ordenado = bool((clave[1:] >= clave[:-1]).all())
+    orden = np.arange(len(clave)) if ordenado else np.argsort(clave, kind='stable')
+    claves, inicios = np.unique(clave[orden], return_index=True)
+    fines = np.append(inicios[1:], len(orden))
+    offsets = {int(k): (int(i), int(f)) for k, i, f in zip(claves, inicios, fines)}
+    # Si ya viene ordenado (snapshot) se usa tal cual, sin copiar las filas
+    return (df.reset_index(drop=True) if ordenado else df.iloc[orden].reset_index(drop=True)), offsets
+
+def corte_mes(indice, p):
+    df, offsets = indice
+    i, f = offsets.get(p.year * 12 + p.month - 1, (0, 0))
+    return df.iloc[i:f]
+
+# ============================================================
+# ASIGNACIÓN DE AUSENCIAS POR PERÍODO
+# ============================================================
+# Una ausencia que cruza meses se reparte entre ellos en proporción a los días hábiles
+# (lunes a viernes, sin FERIADOS) que cae en cada uno. Sin FECHA_FIN, o con una anterior
+# al inicio, cuenta entera en el mes de inicio.
+FERIADOS           = ()   # fechas 'AAAA-MM-DD' que no cuentan como hábiles
+MAX_MESES_AUSENCIA = 24   # tope para fechas de fin mal cargadas (p. ej. un año de más)
+
+def asignar_ausencias(df_au, feriados=FERIADOS):
+    # Una fila por (ausencia, mes) con PERIODO = primer día del mes, FRACCION de días hábiles
+    # y _COL_TARGET prorrateado. Barrido vectorizado: se repite cada ausencia por los meses que cubre.
+    n   = len(df_au)
+    ini = df_au['FECHA_INICIO'].to_numpy(dtype='datetime64[D]')
+    fin = df_au['FECHA_FIN'].to_numpy(dtype='datetime64[D]') if 'FECHA_FIN' in df_au.columns else ini
+    valida = ~np.isnat(ini)
+    ini = np.where(valida, ini, np.datetime64('1970-01-01'))
+    fin = np.where(valida & ~np.isnat(fin) & (fin >= ini), fin, ini)
+    m_ini = ini.astype('datetime64[M]')
+    fin = np.minimum(fin, (m_ini + MAX_MESES_AUSENCIA).astype('datetime64[D]') - 1)
+    k = (fin.astype('datetime64[M]') - m_ini).astype('int64') + 1
+
+    fila  = np.repeat(np.arange(n), k)
+    desde = np.arange(len(fila)) - np.repeat(np.cumsum(k) - k, k)   # n.º de mes dentro de la ausencia
+    mes   = m_ini[fila] + desde
+    a = np.maximum(ini[fila], mes.astype('datetime64[D]'))
+    b = np.minimum(fin[fila] + 1, (mes + 1).astype('datetime64[D]'))   # exclusivo
+    dias  = np.busday_count(a, b, holidays=list(feriados))
+    total = np.busday_count(ini, fin + 1, holidays=list(feriados))[fila]
+    # Ausencia sin días hábiles (p. ej. solo fin de semana): entera en el mes de inicio
+    frac  = np.where(total > 0, dias / np.maximum(total, 1), (desde == 0).astype('float64'))
+
+    usar = frac > 0
+    out = df_au.iloc[fila[usar]].reset_index(drop=True)
+    periodo = mes[usar].astype(df_au['FECHA_INICIO'].dtype)
+    out['PERIODO']     = np.where(valida[fila[usar]], periodo, np.datetime64('NaT'))
+    out['FRACCION']    = frac[usar]
+    out['_COL_TARGET'] = out['_COL_TARGET'].to_numpy(dtype='float64') * frac[usar]
+    return out
+
+def meses_cubiertos(df_au, meses):
+    # Meses (clave año*12+mes) que tocan las ausencias que empiezan en `meses`
+    inicio = clave_mes(df_au['FECHA_INICIO'])
+    asig = asignar_ausencias(df_au[inicio.isin(list(meses)).to_numpy()])
+    return {int(k) for k in clave_mes(asig['PERIODO']).unique() if k >= 0}
+
+def tiene_turnos_dados(df_td):
+    return df_td is not None and not df_td.empty and 'TURNO_DADOS' in df_td.columns
+
+@medido("índice por período")
+def indexar_periodos(df_of, df_au, df_val, df_td):
+    # Sin turnos dados utilizables el índice no los incluye y filtrar() devuelve None
+    return dict(
+        oferta       = indexar_por_mes(df_of,  'PERIODO'),
+        ausencia     = indexar_por_mes(asignar_ausencias(df_au), 'PERIODO'),
+        valores      = indexar_por_mes(df_val, 'PERIODO'),
+        turnos_dados = indexar_por_mes(df_td,  'PERIODO') if tiene_turnos_dados(df_td) else None,
+    )
+
+def filtrar(indice, p):
+    p  = pd.Timestamp(p)
+    dv = corte_mes(indice['valores'], p)
+    dv = dv[dv['PERIODO'] == p]
+    do = corte_mes(indice['oferta'], p)
+    da = corte_mes(indice['ausencia'], p)
+    dt = None
+    if indice['turnos_dados'] is not None:
+        dt = corte_mes(indice['turnos_dados'], p)
+        dt = dt[dt['PERIODO'] == p]
+    return do, da, dv, dt
+
+def periodos_con_dato_real(df_td):
+    # Meses con turnos dados cargados
+    if not tiene_turnos_dados(df_td):
+        return set()
+    return set(pd.to_datetime(df_td['PERIODO'].dropna()).dt.to_period('M'))
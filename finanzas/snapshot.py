@@ -0,0 +1,267 @@
+import os
+import json
+import time
+import uuid
+import random
+import shutil
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .carga import FUENTES, compactar, descargar_datos
+from .periodos import clave_mes
+from .compartido import bloqueo
+from .tiempos import medido
+
+# ============================================================
+# SNAPSHOT EN DISCO (Arrow IPC, stale-while-revalidate)
+# ============================================================
+# pyarrow se importa dentro de cada función: el cálculo desde CSV no lo necesita
+SNAPSHOT_DIR = os.environ.get(
+    "FINANZAS_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".snapshot"))
+TTL_DATOS    = 300   # antigüedad a partir de la cual se vuelven a descargar las hojas
+
+def version_datos(datos):
+    # Hash del contenido de los cuatro frames: cambia solo si cambian los datos
+    h = hashlib.sha1()
+    for df in datos:
+        h.update(",".join(map(str, df.columns)).encode())
+        h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()[:16]
+
+@medido("snapshot: lectura")
+def leer_snapshot(directorio=SNAPSHOT_DIR):
+    import pyarrow.feather as feather
+    try:
+        with open(os.path.join(directorio, "ACTUAL.json")) as f:
+            meta = json.load(f)
+        carpeta = os.path.join(directorio, meta['version'])
+        # Un solo bloque por columna: los numéricos quedan mapeados, sin copia, y las
+        # páginas se comparten con los demás procesos que leen el mismo snapshot
+        datos = tuple(
+            feather.read_table(os.path.join(carpeta, f"{c}.arrow"), memory_map=True).to_pandas(split_blocks=True)
+            for c in FUENTES)
+    except (OSError, ValueError, KeyError):
+        return None
+    meta['particiones'] = (leer_ingesta(meta['version'], directorio) or {}).get('particiones', {})
+    return compactar(datos), meta
+
+def leer_ingesta(version, directorio=SNAPSHOT_DIR):
+    # Particiones y meses modificados respecto de la versión base de este snapshot
+    try:
+        with open(os.path.join(directorio, version, "ingesta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def escribir_meta(directorio, meta):
+    tmp = os.path.join(directorio, f".ACTUAL.{uuid.uuid4().hex}.json")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(directorio, "ACTUAL.json"))
+
+@medido("snapshot: escritura")
+def guardar_snapshot(datos, directorio=SNAPSHOT_DIR, version=None, ingesta=None):
+    # Escribe en una carpeta temporal y publica con renombres atómicos
+    import pyarrow.feather as feather
+    version = version or version_datos(datos)
+    carpeta = os.path.join(directorio, version)
+    os.makedirs(directorio, exist_ok=True)
+    if not os.path.isdir(carpeta):
+        tmp = os.path.join(directorio, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp)
+        try:
+            for c, df in zip(FUENTES, datos):
+                # Filas ordenadas por mes (orden estable): el índice por período no necesita copiarlas
+                col = FUENTES[c]['col_fecha']
+                if col in df.columns and len(df):
+                    df = df.iloc[np.argsort(clave_mes(df[col]).to_numpy(), kind='stable')].reset_index(drop=True)
+                feather.write_feather(df, os.path.join(tmp, f"{c}.arrow"), compression="uncompressed",
+                                      chunksize=max(len(df), 1))
+            if ingesta is not None:
+                with open(os.path.join(tmp, "ingesta.json"), "w") as f:
+                    json.dump(ingesta, f)
+            os.replace(tmp, carpeta)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(carpeta):
+                raise
+    escribir_meta(directorio, dict(version=version, actualizado=time.time()))
+    # Conservar la versión vigente y la anterior (puede haber lectores en curso)
+    viejas = sorted((d for d in os.listdir(directorio)
+                     if d not in (version,) and not d.startswith(".") and os.path.isdir(os.path.join(directorio, d))),
+                    key=lambda d: os.path.getmtime(os.path.join(directorio, d)))
+    for d in viejas[:-1]:
+        shutil.rmtree(os.path.join(directorio, d), ignore_errors=True)
+    return version
+
+# ============================================================
+# REFRESCO PROGRAMADO
+# ============================================================
+# Un hilo por proceso recarga los datos cada INTERVALO_REFRESCO y reemplaza estado['actual']
+# con una sola asignación: los reruns leen siempre la versión vigente sin esperar red.
+INTERVALO_REFRESCO  = TTL_DATOS
+ESPERA_FALLO        = 15    # segundos tras el primer fallo; se duplica hasta ESPERA_FALLO_MAX
+ESPERA_FALLO_MAX    = 600
+ESPERA_OTRO_PROCESO = 5     # segundos entre chequeos mientras otro proceso descarga
+
+def nuevo_estado_refresco():
+    # La app lo guarda en st.cache_resource para compartirlo entre sesiones y reruns.
+    # actual: (datos, meta, errores) de la versión servida.
+    return dict(lock=threading.Lock(), actual=None, hilo=None, detener=threading.Event(),
+                ultimo_error=None, hora_error=None, fallos=0, proximo=None)
+
+def espera_tras_fallo(fallos):
+    # Backoff exponencial con jitter (±50%): los procesos caídos juntos no reintentan juntos
+    return min(ESPERA_FALLO_MAX, ESPERA_FALLO * 2 ** (fallos - 1)) * random.uniform(0.5, 1.5)
+
+def leer_meta(directorio=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(directorio, "ACTUAL.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def adoptar_reciente(estado, directorio, intervalo):
+    # Si otro proceso ya publicó un snapshot de menos de `intervalo` segundos, se usa ese
+    meta = leer_meta(directorio)
+    if not meta or time.time() - meta.get('actualizado', 0) >= intervalo:
+        return False
+    actual = estado['actual']
+    if actual is not None and actual[1]['version'] == meta['version']:
+        actual[1]['actualizado'] = meta['actualizado']
+        return True
+    snap = leer_snapshot(directorio)
+    if snap is None:
+        return False
+    estado['actual'] = (*snap, {})
+    return True
+
+def refrescar_snapshot(estado, directorio=SNAPSHOT_DIR, intervalo=INTERVALO_REFRESCO):
+    # Un ciclo del programador. Devuelve True si los datos quedaron al día, False si falló
+    # y None si otro proceso está descargando (su snapshot se adopta en el próximo ciclo).
+    try:
+        if adoptar_reciente(estado, directorio, intervalo):
+            return True
+        with bloqueo(os.path.join(directorio, ".refresco.lock"), esperar=False) as propio:
+            if not propio:
+                return None
+            if adoptar_reciente(estado, directorio, intervalo):
+                return True
+            previo = estado['actual'][:2] if estado['actual'] is not None and not estado['actual'][2] else None
+            datos, errores, ingesta = descargar_datos(previo)
+            if errores:
+                # No se pisa el último snapshot bueno con datos parciales
+                estado['ultimo_error'] = "; ".join(f"{FUENTES[c]['nombre']}: {e}" for c, e in errores.items())
+                return False
+            version = guardar_snapshot(datos, directorio, ingesta=ingesta)
+        # Se sirve la copia mapeada del snapshot, compartida con los demás procesos
+        snap = leer_snapshot(directorio)
+        if snap is not None and snap[1]['version'] == version:
+            estado['actual'] = (*snap, {})
+        else:
+            estado['actual'] = (datos, dict(version=version, actualizado=time.time(),
+                                            particiones=ingesta['particiones']), {})
+        estado['ultimo_error'] = None
+        return True
+    except Exception as e:
+        estado['ultimo_error'] = str(e)
+        return False
+
+def ciclo_refresco(estado, directorio, intervalo):
+    while True:
+        espera = max(0.0, estado['proximo'] - time.time())
+        if estado['detener'].wait(espera):
+            return
+        resultado = refrescar_snapshot(estado, directorio, intervalo)
+        if resultado is None:
+            estado['proximo'] = time.time() + ESPERA_OTRO_PROCESO
+        elif resultado:
+            estado['fallos'] = 0
+            estado['proximo'] = time.time() + intervalo
+        else:
+            estado['fallos'] += 1
+            estado['hora_error'] = time.time()
+            estado['proximo'] = time.time() + espera_tras_fallo(estado['fallos'])
+
+def iniciar_refresco(estado, directorio=SNAPSHOT_DIR, intervalo=INTERVALO_REFRESCO):
+    # Idempotente: a lo sumo un hilo vivo por estado
+    with estado['lock']:
+        if estado['hilo'] is not None and estado['hilo'].is_alive():
+            return
+        actual = estado['actual']
+        if actual is None:
+            estado['proximo'] = time.time()
+        elif actual[2]:
+            # La carga inicial quedó incompleta: cuenta como primer fallo
+            estado['fallos'] = max(estado['fallos'], 1)
+            estado['hora_error'] = time.time()
+            estado['ultimo_error'] = estado['ultimo_error'] or "; ".join(
+                f"{FUENTES[c]['nombre'] if c in FUENTES else c}: {e}" for c, e in actual[2].items())
+            estado['proximo'] = time.time() + espera_tras_fallo(estado['fallos'])
+        else:
+            estado['proximo'] = actual[1].get('actualizado', 0) + intervalo
+        estado['detener'].clear()
+        estado['hilo'] = threading.Thread(target=ciclo_refresco, args=(estado, directorio, intervalo),
+                                          name="finanzas-refresco", daemon=True)
+        estado['hilo'].start()
+
+def detener_refresco(estado):
+    estado['detener'].set()
+
+def estado_datos(estado):
+    # Para mostrar: antigüedad de los datos servidos, último error y próximo intento
+    actual, ahora = estado['actual'], time.time()
+    return dict(
+        version=actual[1]['version'] if actual else None,
+        edad=ahora - actual[1].get('actualizado', ahora) if actual else None,
+        ultimo_error=estado['ultimo_error'],
+        hace_error=ahora - estado['hora_error'] if estado['ultimo_error'] and estado['hora_error'] else None,
+        fallos=estado['fallos'],
+        proximo=max(0.0, estado['proximo'] - ahora) if estado['proximo'] else None,
+    )
+
+def descarga_inicial(directorio):
+    import pyarrow as pa
+    datos, errores, ingesta = descargar_datos()
+    version = version_datos(datos)
+    if not errores:
+        try:
+            guardar_snapshot(datos, directorio, version=version, ingesta=ingesta)
+        except (OSError, pa.ArrowException) as e:
+            errores = dict(snapshot=e)
+    return (datos, dict(version=version, actualizado=time.time(),
+                        particiones=ingesta['particiones']), errores)
+
+def obtener_datos(estado=None, directorio=SNAPSHOT_DIR):
+    # Devuelve (datos, versión, errores por fuente). Con estado se sirve la versión en memoria
+    # y se asegura el refresco programado; sin ella (CLI) se lee el snapshot o se descarga.
+    if estado is not None and estado['actual'] is not None:
+        iniciar_refresco(estado, directorio)
+        datos, meta, errores = estado['actual']
+        return datos, meta['version'], errores
+
+    snap = leer_snapshot(directorio)
+    if snap is None:
+        # Primer arranque sin snapshot: única carga que espera a la red. Con el lock, si
+        # arrancan varios procesos a la vez descarga uno y los demás leen su snapshot.
+        try:
+            with bloqueo(os.path.join(directorio, ".refresco.lock")):
+                snap = leer_snapshot(directorio)
+                actual = (*snap, {}) if snap is not None else descarga_inicial(directorio)
+        except OSError:
+            actual = descarga_inicial(directorio)
+    else:
+        actual = (*snap, {})
+
+    if estado is not None:
+        with estado['lock']:
+            if estado['actual'] is None:
+                estado['actual'] = actual
+            actual = estado['actual']
+        iniciar_refresco(estado, directorio)
+    datos, meta, errores = actual
+    return datos, meta['version'], errores
@@ -0,0 +1,154 @@
+import os
+import importlib.util
+
+import pandas as pd
+
+from .periodos import asignar_ausencias, tiene_turnos_dados
+from .compartido import bloqueo, carpeta_cache, publicar
+from .metricas import metricas_por_servicio, resumir_periodos
+from .tiempos import medido
+
+# ============================================================
+# MOTOR SQL (DuckDB, opcional)
+# ============================================================
+# Los cruces y las sumas de calcular_metricas, filtrar y calcular_metricas_periodos corren en
+# DuckDB sobre una base columnar por versión de datos, en <snapshot>/<versión>/cache-v*/: la arma
+# un proceso y los demás la abren en solo lectura. Las tablas van ordenadas por MES (primer día
+# del mes), así que un filtro por período saltea los bloques de los demás meses, y las consultas
+# usan todos los núcleos. Lo que queda después de sumar (una fila por servicio o por período)
+# se termina con el mismo código que el camino pandas. duckdb se importa dentro de cada función.
+MOTOR       = os.environ.get("FINANZAS_MOTOR", "pandas")   # 'pandas' o 'duckdb'
+ARCHIVO_SQL = "datos.duckdb"
+ENTEROS     = {'TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT', 'HUGEINT', 'UTINYINT', 'USMALLINT', 'UINTEGER', 'UBIGINT'}
+
+def motor_disponible():
+    return importlib.util.find_spec("duckdb") is not None
+
+def copiar_tabla(con, nombre, df, col_fecha):
+    # Categorías → texto (las de cada hoja son tipos distintos para DuckDB) y MES como clave de orden
+    cols = ", ".join(f'CAST("{c}" AS VARCHAR) AS "{c}"' if isinstance(df[c].dtype, pd.CategoricalDtype) else f'"{c}"'
+                     for c in df.columns)
+    con.register("_origen", df)
+    try:
+        con.execute(f"""CREATE TABLE {nombre} AS SELECT {cols}, date_trunc('month', "{col_fecha}") AS MES
+                        FROM _origen ORDER BY MES""")
+    finally:
+        con.unregister("_origen")
+
+def llenar_base(con, datos):
+    df_of, df_au, df_val, df_td = datos
+    copiar_tabla(con, "oferta", df_of, 'PERIODO')
+    copiar_tabla(con, "ausencias", asignar_ausencias(df_au), 'PERIODO')
+    copiar_tabla(con, "valores", df_val, 'PERIODO')
+    if tiene_turnos_dados(df_td):
+        copiar_tabla(con, "turnos_dados", df_td[['PERIODO','SERVICIO','TURNO_DADOS']], 'PERIODO')
+    else:
+        con.execute("CREATE TABLE turnos_dados (PERIODO TIMESTAMP, SERVICIO VARCHAR, TURNO_DADOS BIGINT, MES TIMESTAMP)")
+
+def nueva_base(con):
+    # sum() de una columna entera devuelve HUGEINT (float en pandas): la suma de la oferta se
+    # lleva al tipo que da el groupby de pandas, BIGINT si la hoja es entera y si no el de la columna
+    tipo = con.execute("""SELECT data_type FROM information_schema.columns
+                          WHERE table_name = 'oferta' AND column_name = 'TURNOS_MENSUAL'""").fetchone()[0]
+    return dict(con=con, tipo_oferta='BIGINT' if tipo in ENTEROS else tipo)
+
+def escribir_base(ruta, datos):
+    import duckdb
+    con = duckdb.connect(ruta)
+    try:
+        llenar_base(con, datos)
+    finally:
+        con.close()
+
+@medido("base SQL")
+def abrir_base(df_of, df_au, df_val, df_td, directorio=None, version=None):
+    # Con snapshot la base se publica en disco (una por versión); sin él queda en memoria
+    import duckdb
+    datos   = (df_of, df_au, df_val, df_td)
+    carpeta = carpeta_cache(directorio, version) if version else None
+    if carpeta is None:
+        con = duckdb.connect()
+        llenar_base(con, datos)
+        return nueva_base(con)
+    ruta = os.path.join(carpeta, ARCHIVO_SQL)
+    if not os.path.exists(ruta):
+        with bloqueo(os.path.join(carpeta, f".{ARCHIVO_SQL}.lock")):
+            if not os.path.exists(ruta):
+                publicar(ruta, escribir_base, datos)
+    return nueva_base(duckdb.connect(ruta, read_only=True))
+
+def consultar(base, sql, **params):
+    # Un cursor por consulta: la conexión se comparte entre hilos
+    cur = base['con'].cursor()
+    try:
+        return cur.execute(sql, params).df()
+    finally:
+        cur.close()
+
+# ============================================================
+# CONSULTAS
+# ============================================================
+def filtrar_sql(base, p):
+    # Los mismos cortes que periodos.filtrar (sin la columna MES)
+    p = pd.Timestamp(p)
+    mes = p.to_period('M').to_timestamp()
+    do = consultar(base, "SELECT * EXCLUDE (MES) FROM oferta WHERE MES = $mes", mes=mes)
+    da = consultar(base, "SELECT * EXCLUDE (MES) FROM ausencias WHERE MES = $mes", mes=mes)
+    dv = consultar(base, "SELECT * EXCLUDE (MES) FROM valores WHERE MES = $mes AND PERIODO = $p", mes=mes, p=p)
+    dt = consultar(base, "SELECT * EXCLUDE (MES) FROM turnos_dados WHERE MES = $mes AND PERIODO = $p", mes=mes, p=p)
+    return do, da, dv, (dt if not dt.empty else None)
+
+@medido("calcular_metricas (SQL)")
+def calcular_metricas_sql(base, p, real=False, rend_override=None):
+    # calcular_metricas(*filtrar(indice, p)) con las sumas por servicio en DuckDB
+    p = pd.Timestamp(p)
+    mes = p.to_period('M').to_timestamp()
+    of_serv = consultar(base, f"""
+        SELECT o.SERVICIO, o.TURNOS_MENSUAL, v.VALOR_TURNO
+        FROM (SELECT SERVICIO, CAST(sum(TURNOS_MENSUAL) AS {base['tipo_oferta']}) AS TURNOS_MENSUAL
+              FROM oferta WHERE MES = $mes GROUP BY SERVICIO) o
+        LEFT JOIN valores v ON v.SERVICIO = o.SERVICIO AND v.MES = $mes AND v.PERIODO = $p
+        ORDER BY o.SERVICIO NULLS LAST""", mes=mes, p=p)
+    sens = consultar(base, """
+        SELECT a.SERVICIO, a.CONSULTORIOS, v.VALOR_TURNO, v.RENDIMIENTO
+        FROM (SELECT SERVICIO, sum(_COL_TARGET) AS CONSULTORIOS
+              FROM ausencias WHERE MES = $mes GROUP BY SERVICIO) a
+        LEFT JOIN valores v ON v.SERVICIO = a.SERVICIO AND v.MES = $mes AND v.PERIODO = $p
+        ORDER BY a.SERVICIO NULLS LAST""", mes=mes, p=p)
+    td = None
+    if real:
+        td = consultar(base, "SELECT SERVICIO, TURNO_DADOS FROM turnos_dados WHERE MES = $mes AND PERIODO = $p",
+                       mes=mes, p=p)
+    return metricas_por_servicio(of_serv, sens, td, rend_override, fuente=lambda: filtrar_sql(base, p)[:3])
+
+@medido("calcular_metricas_periodos (SQL)")
+def calcular_metricas_periodos_sql(base, periodos, rend_override=None):
+    # calcular_metricas_periodos con los cruces y el groupby por (PERIODO, SERVICIO) en DuckDB
+    per = pd.DatetimeIndex(periodos).unique()
+    lista = list(per)
+    serv_ing = consultar(base, f"""
+        WITH per AS (SELECT PERIODO, date_trunc('month', PERIODO) AS MES FROM (SELECT unnest($per::TIMESTAMP[]) AS PERIODO))
+        SELECT per.PERIODO, o.SERVICIO,
+               CAST(sum(o.TURNOS_MENSUAL) AS {base['tipo_oferta']}) AS TURNOS_OFERTA,
+               avg(coalesce(v.VALOR_TURNO, 0))                   AS VALOR_TURNO,
+               sum(o.TURNOS_MENSUAL * coalesce(v.VALOR_TURNO, 0)) AS FACTURACION_BASE
+        FROM oferta o JOIN per ON o.MES = per.MES
+        LEFT JOIN valores v ON v.MES = per.MES AND v.PERIODO = per.PERIODO AND v.SERVICIO = o.SERVICIO
+        WHERE o.SERVICIO IS NOT NULL
+        GROUP BY ALL ORDER BY ALL""", per=lista)
+    serv_perd = consultar(base, """
+        WITH per AS (SELECT PERIODO, date_trunc('month', PERIODO) AS MES FROM (SELECT unnest($per::TIMESTAMP[]) AS PERIODO)),
+        perd AS (
+            SELECT per.PERIODO, a.SERVICIO,
+                   a._COL_TARGET * coalesce($rend, v.RENDIMIENTO, 14) AS TURNOS_PERDIDOS,
+                   coalesce(v.VALOR_TURNO, 0)                        AS VALOR_TURNO
+            FROM ausencias a JOIN per ON a.MES = per.MES
+            LEFT JOIN valores v ON v.MES = per.MES AND v.PERIODO = per.PERIODO AND v.SERVICIO = a.SERVICIO
+            WHERE a.SERVICIO IS NOT NULL)
+        SELECT PERIODO, SERVICIO, sum(TURNOS_PERDIDOS) AS TURNOS_PERDIDOS,
+               sum(TURNOS_PERDIDOS * VALOR_TURNO) AS DINERO_PERDIDO
+        FROM perd GROUP BY ALL ORDER BY ALL""", per=lista, rend=rend_override or None)
+    td = consultar(base, """
+        SELECT PERIODO, SERVICIO, TURNO_DADOS FROM turnos_dados
+        WHERE MES IN (SELECT DISTINCT date_trunc('month', unnest($per::TIMESTAMP[])))""", per=lista)
+    return resumir_periodos(per, serv_ing, serv_perd, td if not td.empty else None)
@@ -0,0 +1,152 @@
+import os
+import io
+import json
+import time
+import uuid
+import threading
+import functools
+from contextlib import contextmanager, nullcontext
+
+# ============================================================
+# TRAMOS DE TIEMPO POR RERUN
+# ============================================================
+# Un registro por hilo (cada rerun de Streamlit corre en el suyo). Sin registro activo
+# tramo() devuelve un contexto vacío: el costo es una búsqueda en threading.local.
+_local = threading.local()
+_NULO  = nullcontext()
+
+def iniciar_registro(activo=True, perfil=False):
+    # Reemplaza cualquier registro previo del hilo; con activo=False solo lo descarta.
+    # Un rerun cortado por una excepción no llegó a terminar_registro: se apaga su perfilador.
+    previo = getattr(_local, 'registro', None)
+    if previo is not None and previo['perfilador'] is not None:
+        previo['perfilador'].disable()
+    if not activo:
+        _local.registro = None
+        return None
+    r = dict(inicio=time.perf_counter(), tramos=[], nivel=0, seccion=None, perfil=None, perfilador=None)
+    if perfil:
+        import cProfile
+        r['perfilador'] = cProfile.Profile()
+        try:
+            r['perfilador'].enable()
+        except ValueError as e:
+            # Otro perfilador activo en el proceso (p. ej. otra sesión perfilando)
+            r['perfilador'], r['perfil'] = None, f"cProfile no disponible: {e}"
+    _local.registro = r
+    return r
+
+def registro_actual():
+    return getattr(_local, 'registro', None)
+
+def anotar(r, nombre, t0, nivel):
+    r['tramos'].append(dict(nombre=nombre, inicio=t0 - r['inicio'],
+                            seg=time.perf_counter() - t0, nivel=nivel))
+
+@contextmanager
+def _medir(r, nombre):
+    nivel = r['nivel'] + (r['seccion'] is not None)
+    r['nivel'] += 1
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        r['nivel'] -= 1
+        anotar(r, nombre, t0, nivel)
+
+def tramo(nombre):
+    r = getattr(_local, 'registro', None)
+    return _NULO if r is None else _medir(r, nombre)
+
+def medido(nombre):
+    # Decorador: toda la llamada como un tramo
+    def decorador(fn):
+        @functools.wraps(fn)
+        def envuelta(*args, **kwargs):
+            with tramo(nombre):
+                return fn(*args, **kwargs)
+        return envuelta
+    return decorador
+
+def seccion(nombre):
+    # Tramo secuencial de primer nivel: cierra la sección abierta y abre otra.
+    # Sirve para partes largas del script sin reindentarlas en un with.
+    r = getattr(_local, 'registro', None)
+    if r is None:
+        return
+    if r['seccion'] is not None:
+        anotar(r, *r['seccion'], 0)
+    r['seccion'] = (nombre, time.perf_counter()) if nombre else None
+
+def propagar(fn):
+    # Para trabajo enviado a otros hilos: registra sus tramos en el registro de quien lo envía
+    r = getattr(_local, 'registro', None)
+    if r is None:
+        return fn
+    # Vista propia del hilo: comparte la lista de tramos pero no el anidamiento
+    sub = dict(r, nivel=r['nivel'] + (r['seccion'] is not None), seccion=None, perfilador=None)
+    def envuelta(*args, **kwargs):
+        _local.registro = sub
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.registro = None
+    return envuelta
+
+def terminar_registro(max_filas_perfil=30):
+    # Cierra la sección abierta y el perfilador; devuelve el registro ya ordenado
+    r = getattr(_local, 'registro', None)
+    if r is None:
+        return None
+    seccion(None)
+    _local.registro = None
+    if r['perfilador'] is not None:
+        import pstats
+        r['perfilador'].disable()
+        salida = io.StringIO()
+        pstats.Stats(r['perfilador'], stream=salida).sort_stats('cumulative').print_stats(max_filas_perfil)
+        r['perfil'], r['perfilador'] = salida.getvalue(), None
+    r['total'] = time.perf_counter() - r['inicio']
+    r['tramos'].sort(key=lambda t: t['inicio'])
+    return r
+
+# ============================================================
+# ACUMULADOS Y LOGS
+# ============================================================
+def acumular(totales, r):
+    # totales: {nombre: [llamadas, segundos]}; por sesión y por proceso
+    for t in r['tramos']:
+        acc = totales.setdefault(t['nombre'], [0, 0.0])
+        acc[0] += 1
+        acc[1] += t['seg']
+    acc = totales.setdefault('total', [0, 0.0])
+    acc[0] += 1
+    acc[1] += r['total']
+    return totales
+
+def escribir_jsonl(ruta, r, **etiquetas):
+    # Una línea por rerun; apertura en modo append para que varios procesos puedan escribir
+    linea = dict(ts=time.time(), total=r['total'], **etiquetas,
+                 tramos=[dict(nombre=t['nombre'], seg=round(t['seg'], 6), nivel=t['nivel']) for t in r['tramos']])
+    with open(ruta, "a") as f:
+        f.write(json.dumps(linea) + "\n")
+
+def escribir_prometheus(ruta, totales):
+    # Formato textfile del node_exporter: se reescribe entero y se publica con rename atómico
+    lineas = ["# TYPE finanzas_tramo_segundos_total counter",
+              "# TYPE finanzas_tramo_llamadas_total counter"]
+    for nombre, (llamadas, seg) in sorted(totales.items()):
+        etiqueta = nombre.replace("\\", "\\\\").replace('"', '\\"')
+        lineas.append(f'finanzas_tramo_segundos_total{{tramo="{etiqueta}"}} {seg:.6f}')
+        lineas.append(f'finanzas_tramo_llamadas_total{{tramo="{etiqueta}"}} {llamadas}')
+    tmp = os.path.join(os.path.dirname(os.path.abspath(ruta)), f".{uuid.uuid4().hex}.prom.tmp")
+    with open(tmp, "w") as f:
+        f.write("\n".join(lineas) + "\n")
+    os.replace(tmp, ruta)
+
+def escribir_log(ruta, r, totales, **etiquetas):
+    # .prom → textfile de Prometheus con los acumulados; cualquier otra extensión → JSON lines
+    if ruta.endswith(".prom"):
+        escribir_prometheus(ruta, totales)
+    else:
+        escribir_jsonl(ruta, r, **etiquetas)
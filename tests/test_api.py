@@ -0,0 +1,71 @@
+import io
+import json
+import threading
+import urllib.request
+from urllib.error import HTTPError
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from finanzas.api import nuevo_estado_api, nuevo_servidor, metricas_de, recursos
+from finanzas.exportacion import detalle_perdidas, exportar
+from finanzas.snapshot import guardar_snapshot
+from benchmarks.paridad import ingerir
+from benchmarks.sintetico import TAMANOS, generar
+
+# ============================================================
+# EXPORTACIÓN POR LA API
+# ============================================================
+# Servidor de la API en un puerto libre sobre un snapshot del preset chico
+@pytest.fixture(scope="module")
+def servidor(tmp_path_factory):
+    directorio = str(tmp_path_factory.mktemp("snapshot"))
+    guardar_snapshot(ingerir(generar(**TAMANOS['chico'])), directorio)
+    api = nuevo_estado_api(directorio=directorio)
+    srv = nuevo_servidor(api, 0)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield api, f"http://127.0.0.1:{srv.server_port}"
+    srv.shutdown()
+    srv.server_close()
+
+def pedir(url):
+    with urllib.request.urlopen(url, timeout=30) as r:
+        return r.headers, r.read()
+
+def esperado(api, formato, periodos, rend=None):
+    r = recursos(api)
+    partes = ((f"{p:%Y-%m}", detalle_perdidas(metricas_de(api, r, p, rend)).assign(PERIODO=p)) for p in periodos)
+    return exportar(formato, partes, io.BytesIO()).read()
+
+def test_exporta_rango_en_csv(servidor):
+    api, base = servidor
+    periodos = recursos(api)['periodos'][:3]
+    cab, cuerpo = pedir(f"{base}/exportar/csv?desde={periodos[0]:%Y-%m}&hasta={periodos[-1]:%Y-%m}&rendimiento=20")
+    assert cab['Content-Type'] == "text/csv"
+    assert f'perdidas_{periodos[0]:%Y-%m}_{periodos[-1]:%Y-%m}.csv' in cab['Content-Disposition']
+    assert int(cab['Content-Length']) == len(cuerpo)
+    assert cuerpo == esperado(api, 'csv', periodos, 20)
+    assert set(pd.read_csv(io.BytesIO(cuerpo))['PERIODO']) == {f"{p:%Y-%m-%d}" for p in periodos}
+
+def test_exporta_periodo_en_excel(servidor):
+    api, base = servidor
+    p = recursos(api)['periodos'][0]
+    _, cuerpo = pedir(f"{base}/exportar/xlsx?desde={p:%Y-%m}")
+    hojas = pd.read_excel(io.BytesIO(cuerpo), sheet_name=None)
+    assert list(hojas) == [f"{p:%Y-%m}"]
+    assert len(hojas[f"{p:%Y-%m}"]) == len(detalle_perdidas(metricas_de(api, recursos(api), p, None)))
+
+@pytest.mark.parametrize("ruta, codigo", [
+    ("/exportar/pdf?desde=2024-01", 404),
+    ("/exportar/csv", 400),
+    ("/exportar/csv?desde=2024-1", 400),
+    ("/exportar/csv?desde=1990-01&hasta=1990-12", 404),
+])
+def test_pedidos_invalidos(servidor, ruta, codigo):
+    _, base = servidor
+    with pytest.raises(HTTPError) as e:
+        pedir(base + ruta)
+    assert e.value.code == codigo
+    assert "error" in json.loads(e.value.read())
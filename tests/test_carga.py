@@ -0,0 +1,113 @@
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from finanzas import carga
+from finanzas.carga import FUENTES, descargar_fuentes, descargar_datos
+from benchmarks.sintetico import generar, como_csv
+
+# ============================================================
+# HOJAS PUBLICADAS DE PRUEBA
+# ============================================================
+# Un http.server local en FINANZAS_BASE_URL sirve el CSV de cada fuente (por gid) con una
+# demora y una cantidad de fallas (503) configurables por fuente.
+CSV = como_csv(generar(servicios=3, profesionales=6, meses=3, ausencias=40))
+POR_GID = {f['gid']: clave for clave, f in FUENTES.items()}
+
+class Hoja(BaseHTTPRequestHandler):
+    def do_GET(self):
+        clave = POR_GID[parse_qs(urlparse(self.path).query)['gid'][0]]
+        conf = self.server.fuentes[clave]
+        with self.server.lock:
+            self.server.pedidos[clave] += 1
+            falla = conf['fallas'] > 0
+            conf['fallas'] -= falla
+        time.sleep(conf['demora'])
+        cuerpo = b"caida" if falla else CSV[clave]
+        try:
+            self.send_response(503 if falla else 200)
+            self.send_header("Content-Type", "text/csv")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+        except OSError:   # el cliente ya cortó por timeout
+            pass
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def hojas(monkeypatch):
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Hoja)
+    srv.daemon_threads = True
+    srv.lock = threading.Lock()
+    srv.fuentes = {c: dict(demora=0.0, fallas=0) for c in FUENTES}
+    srv.pedidos = {c: 0 for c in FUENTES}
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    monkeypatch.setenv("FINANZAS_BASE_URL", f"http://127.0.0.1:{srv.server_port}")
+    monkeypatch.setattr(carga, "TIMEOUT_FUENTE", 2.0)
+    monkeypatch.setattr(carga, "REINTENTOS", 0)
+    monkeypatch.setattr(carga, "ESPERA_REINTENTO", 0.01)
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+# ============================================================
+# DESCARGA
+# ============================================================
+def test_descarga_todas_las_fuentes(hojas):
+    frames, errores = descargar_fuentes()
+    assert errores == {}
+    assert all(len(frames[c]) > 0 for c in FUENTES)
+    assert all(n == 1 for n in hojas.pedidos.values())
+
+def test_descargas_en_paralelo(hojas):
+    for conf in hojas.fuentes.values():
+        conf['demora'] = 0.4
+    t0 = time.perf_counter()
+    frames, errores = descargar_fuentes()
+    seg = time.perf_counter() - t0
+    assert errores == {}
+    # Cerca de la más lenta, lejos de la suma (1,6 s)
+    assert seg < 0.4 * len(FUENTES) / 2
+
+def test_timeout_por_fuente(hojas, monkeypatch):
+    monkeypatch.setattr(carga, "TIMEOUT_FUENTE", 0.3)
+    hojas.fuentes['turnos_dados']['demora'] = 1.5
+    for c in ('oferta', 'ausencias', 'valores'):
+        hojas.fuentes[c]['demora'] = 0.2
+    t0 = time.perf_counter()
+    frames, errores = descargar_fuentes()
+    seg = time.perf_counter() - t0
+    assert set(errores) == {'turnos_dados'}
+    assert all(len(frames[c]) > 0 for c in ('oferta', 'ausencias', 'valores'))
+    # Corta la fuente lenta a su timeout sin esperar su respuesta
+    assert seg < 1.0
+
+def test_reintenta_un_intento_fallido(hojas, monkeypatch):
+    monkeypatch.setattr(carga, "REINTENTOS", 1)
+    hojas.fuentes['valores']['fallas'] = 1
+    frames, errores = descargar_fuentes()
+    assert errores == {}
+    assert hojas.pedidos['valores'] == 2
+    assert len(frames['valores']) > 0
+
+def test_sin_reintentos_suficientes_falla(hojas, monkeypatch):
+    monkeypatch.setattr(carga, "REINTENTOS", 1)
+    hojas.fuentes['valores']['fallas'] = 2
+    _, errores = descargar_fuentes()
+    assert set(errores) == {'valores'}
+    assert hojas.pedidos['valores'] == 2
+
+def test_fuente_caida_queda_vacia_con_aviso(hojas):
+    hojas.fuentes['turnos_dados']['fallas'] = 1
+    datos, errores, _ = descargar_datos()
+    # El error por fuente es el que la app muestra como st.warning
+    assert set(errores) == {'turnos_dados'}
+    assert "503" in str(errores['turnos_dados'])
+    df_of, df_au, df_val, df_td = datos
+    assert df_td.empty and list(df_td.columns) == list(FUENTES['turnos_dados']['requeridas'])
+    assert len(df_of) > 0 and len(df_au) > 0 and len(df_val) > 0
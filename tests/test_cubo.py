@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from finanzas.carga import FUENTES, parsear_csv, ingerir_fuente, compactar
+from finanzas.cubo import construir_cubo, rollup
+from finanzas.periodos import indexar_periodos, filtrar
+from finanzas.metricas import calcular_metricas
+from benchmarks.sintetico import generar, como_csv
+
+# ============================================================
+# CUBO ↔ filtrar
+# ============================================================
+# Un rollup de un período tiene que dar lo mismo que calcular_metricas sobre filtrar(),
+# también cuando la hoja de valores trae dos períodos en el mismo mes
+def datos_con_dos_periodos_en_un_mes():
+    tablas = generar(servicios=4, profesionales=12, meses=4, ausencias=200)
+    va = tablas['valores']
+    extra = va[va['PERIODO'] == va['PERIODO'].iloc[-1]].assign(PERIODO=lambda d: "15" + d['PERIODO'].str[2:])
+    csv = como_csv(tablas | dict(valores=pd.concat([va, extra], ignore_index=True)))
+    return compactar([ingerir_fuente(c, parsear_csv(csv[c]))[0] for c in FUENTES])
+
+DATOS = datos_con_dos_periodos_en_un_mes()
+
+@pytest.mark.parametrize("p", sorted(DATOS[2]['PERIODO'].unique()), ids=lambda p: f"{pd.Timestamp(p):%Y-%m-%d}")
+def test_rollup_igual_a_filtrar(p):
+    cubo, indice = construir_cubo(*DATOS), indexar_periodos(*DATOS)
+    m = calcular_metricas(*filtrar(indice, p)[:3], None)
+    tot = rollup(cubo, (), p, p).iloc[0]
+    assert np.isclose(tot['FACTURACION_BASE'], m['total_base'], rtol=1e-9)
+    assert np.isclose(tot['DINERO_PERDIDO'], m['total_perd'], rtol=1e-9)
+    assert np.isclose(tot['TURNOS_OFERTA'], m['turnos_of'], rtol=1e-9)
+
+def test_hay_dos_periodos_en_un_mes():
+    per = pd.Series(DATOS[2]['PERIODO'].unique())
+    assert per.dt.to_period('M').duplicated().any()
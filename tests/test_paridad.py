@@ -0,0 +1,22 @@
+import pytest
+
+pytest.importorskip("duckdb")
+
+from benchmarks.paridad import CASOS, RENDIMIENTOS, caso, ingerir, diferencias
+from benchmarks.sintetico import TAMANOS, generar
+
+# ============================================================
+# PARIDAD pandas ↔ DuckDB
+# ============================================================
+# Los casos de benchmarks/paridad.py sobre el preset chico, con y sin rendimiento manual
+TABLAS = generar(**TAMANOS['chico'])
+
+@pytest.fixture(scope="module", params=CASOS)
+def datos(request):
+    return ingerir(caso(request.param, TABLAS))
+
+@pytest.mark.parametrize("rend", RENDIMIENTOS, ids=lambda r: f"rend={r}")
+def test_motores_iguales(datos, rend):
+    dif, n = diferencias(datos, rendimientos=(rend,))
+    assert n > 0
+    assert dif == []